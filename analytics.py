@@ -0,0 +1,266 @@
+"""
+Sales Analytics
+Keeps bills and bill lines in memory as compact columns (array module, or
+NumPy when installed) so the report breakdowns don't re-run SQL aggregates on
+every page load.
+- Text columns (customer, payment method, bill type, product, category) are
+  dictionary-encoded: each row stores a small integer code
+- New bills are appended incrementally (transactions.id > last loaded id); if
+  bills were deleted or committed out of id order the columns are reloaded
+- One store per worker process, refreshed at most every ANALYTICS_REFRESH_SECONDS
+
+Roughly 40 bytes per bill line; 1M lines is ~40 MB per worker.
+"""
+
+import os
+import time
+import threading
+from array import array
+from itertools import compress
+from datetime import date
+
+from database import Database
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get('ANALYTICS_REFRESH_SECONDS', '5'))
+
+# dimension -> (level, column); bill-level columns count each bill once
+DIMENSIONS = {
+    'day': ('bill', 'day'),
+    'customer': ('bill', 'customer'),
+    'payment_method': ('bill', 'payment_method'),
+    'bill_type': ('bill', 'bill_type'),
+    'product': ('line', 'product'),
+    'category': ('line', 'category'),
+}
+
+NEW_BILLS_SQL = '''
+    SELECT id, created_at, customer_name, payment_method, bill_type, total_amount
+    FROM transactions
+    WHERE id > ?
+    ORDER BY id
+'''
+NEW_LINES_SQL = '''
+    SELECT ti.transaction_id, ti.product_id, ti.product_name, p.category, ti.quantity, ti.total_price
+    FROM transaction_items ti
+    LEFT JOIN products p ON p.id = ti.product_id
+    WHERE ti.transaction_id > ?
+    ORDER BY ti.transaction_id
+'''
+
+
+class Dictionary:
+    """Maps values to dense integer codes and back"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class SalesColumns:
+    """Bill and bill-line columns for one process"""
+
+    def __init__(self):
+        self.dictionaries = {name: Dictionary() for name in ('customer', 'payment_method', 'bill_type',
+                                                              'product', 'category')}
+        self.product_names = {}
+        # Bill level: one row per transaction
+        self.bill_ids = array('q')
+        self.bill_day = array('i')      # date ordinal (IST)
+        self.bill_customer = array('i')
+        self.bill_payment_method = array('i')
+        self.bill_bill_type = array('i')
+        self.bill_quantity = array('i')
+        self.bill_total = array('d')
+        # Line level: one row per transaction item, with its bill's row number
+        self.line_bill = array('i')
+        self.line_product = array('i')
+        self.line_category = array('i')
+        self.line_quantity = array('i')
+        self.line_total = array('d')
+        self.last_id = 0
+        self._row_of_bill = {}
+
+    def append(self, bills, lines):
+        """Append bills (NEW_BILLS_SQL rows) and their lines (NEW_LINES_SQL rows)"""
+        d = self.dictionaries
+        for bill_id, created_at, customer, payment_method, bill_type, total in bills:
+            self._row_of_bill[bill_id] = len(self.bill_ids)
+            self.bill_ids.append(bill_id)
+            self.bill_day.append(date.fromisoformat(str(created_at)[:10]).toordinal())
+            self.bill_customer.append(d['customer'].encode((customer or '').strip() or 'Walk-in'))
+            self.bill_payment_method.append(d['payment_method'].encode(payment_method or 'CASH'))
+            self.bill_bill_type.append(d['bill_type'].encode(bill_type or 'REGULAR'))
+            self.bill_quantity.append(0)
+            self.bill_total.append(float(total or 0))
+            self.last_id = max(self.last_id, bill_id)
+        for bill_id, product_id, product_name, category, quantity, total in lines:
+            row = self._row_of_bill.get(bill_id)
+            if row is None:
+                continue
+            # Manual items (product_id 0) are told apart by name
+            key = product_id if product_id and product_id > 0 else f"manual:{product_name}"
+            self.product_names[key] = product_name
+            self.line_bill.append(row)
+            self.line_product.append(d['product'].encode(key))
+            self.line_category.append(d['category'].encode(category or 'Manual'))
+            self.line_quantity.append(int(quantity or 0))
+            self.bill_quantity[row] += int(quantity or 0)
+            self.line_total.append(float(total or 0))
+
+    def _bill_mask(self, start, end, bill_types):
+        """Bill rows in [start, end] (date ordinals) of the given bill types, or None for all"""
+        type_codes = None
+        if bill_types:
+            codes = self.dictionaries['bill_type'].codes
+            type_codes = {codes[t] for t in bill_types if t in codes}
+        if start is None and end is None and type_codes is None:
+            return None
+        lo = start if start is not None else 0
+        hi = end if end is not None else date.max.toordinal()
+        if numpy is not None:
+            days = numpy.frombuffer(self.bill_day, dtype=numpy.int32)
+            mask = (days >= lo) & (days <= hi)
+            if type_codes is not None:
+                mask &= numpy.isin(numpy.frombuffer(self.bill_bill_type, dtype=numpy.int32), list(type_codes))
+            return mask
+        return [lo <= day <= hi and (type_codes is None or bill_type in type_codes)
+                for day, bill_type in zip(self.bill_day, self.bill_bill_type)]
+
+    def group_by(self, dimension, start=None, end=None, bill_types=None):
+        """{code: (bills_or_lines, quantity, total)} for one dimension"""
+        level, column = DIMENSIONS[dimension]
+        bill_mask = self._bill_mask(start, end, bill_types)
+        if level == 'bill':
+            return _group(getattr(self, f'bill_{column}'), self.bill_quantity, self.bill_total, bill_mask)
+        line_mask = bill_mask
+        if bill_mask is not None:
+            if numpy is not None:
+                line_mask = bill_mask[numpy.frombuffer(self.line_bill, dtype=numpy.int32)]
+            else:
+                line_mask = [bill_mask[row] for row in self.line_bill]
+        return _group(getattr(self, f'line_{column}'), self.line_quantity, self.line_total, line_mask)
+
+    def label(self, dimension, code):
+        if dimension == 'day':
+            return date.fromordinal(code).isoformat()
+        value = self.dictionaries[dimension].values[code]
+        if dimension == 'product':
+            return self.product_names.get(value, str(value))
+        return value
+
+
+def _group(codes, quantities, totals, mask):
+    """Group-by sum over code columns; vectorized with NumPy, a single pass otherwise"""
+    if numpy is not None:
+        codes_np = numpy.frombuffer(codes, dtype=numpy.int32)
+        totals_np = numpy.frombuffer(totals, dtype=numpy.float64)
+        qty_np = numpy.frombuffer(quantities, dtype=numpy.int32)
+        if mask is not None:
+            codes_np, totals_np, qty_np = codes_np[mask], totals_np[mask], qty_np[mask]
+        if not len(codes_np):
+            return {}
+        # Day codes are date ordinals; shift them so the bins start at zero
+        offset = int(codes_np.min())
+        codes_np = codes_np - offset
+        counts = numpy.bincount(codes_np)
+        sums = numpy.bincount(codes_np, weights=totals_np)
+        qty = numpy.bincount(codes_np, weights=qty_np)
+        return {int(code) + offset: (int(counts[code]), int(qty[code]), float(sums[code]))
+                for code in numpy.nonzero(counts)[0]}
+    rows = zip(codes, quantities, totals)
+    if mask is not None:
+        rows = compress(rows, mask)
+    counts, qty, sums = {}, {}, {}
+    for code, quantity, total in rows:
+        if code in counts:
+            counts[code] += 1
+            qty[code] += quantity
+            sums[code] += total
+        else:
+            counts[code], qty[code], sums[code] = 1, quantity, total
+    return {code: (counts[code], qty[code], sums[code]) for code in counts}
+
+
+class SalesAnalytics:
+    """Process-wide sales columns, refreshed incrementally from the database"""
+
+    def __init__(self):
+        self.columns = SalesColumns()
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def refresh(self, force=False):
+        """Append bills added since the last refresh (reload everything if bills disappeared)"""
+        if not force and time.time() - self._checked_at < ANALYTICS_REFRESH_SECONDS:
+            return
+        db = Database()
+        try:
+            count, max_id = db.fetch_one('SELECT COUNT(*), MAX(id) FROM transactions') or (0, None)
+            columns = self.columns
+            new_count = db.fetch_one('SELECT COUNT(*) FROM transactions WHERE id > ?', (columns.last_id,))[0]
+            if len(columns.bill_ids) + new_count != count:
+                # Deleted bills (or ids committed out of order): start over
+                columns = SalesColumns()
+            if max_id is not None and max_id > columns.last_id:
+                start = columns.last_id
+                columns.append(db.fetch_all(NEW_BILLS_SQL, (start,)), db.fetch_all(NEW_LINES_SQL, (start,)))
+            self.columns = columns
+            self._checked_at = time.time()
+        finally:
+            db.close()
+
+    def sales_by(self, dimension, start=None, end=None, bill_types=None, limit=None):
+        """Sales grouped by a dimension between two IST dates (YYYY-MM-DD, inclusive).
+
+        Returns [{'key', 'count', 'quantity', 'total'}], largest total first
+        (by date for 'day'); count is bills for bill-level dimensions and
+        bill lines for product/category.
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}'. Use one of: {', '.join(DIMENSIONS)}")
+        start = date.fromisoformat(start).toordinal() if start else None
+        end = date.fromisoformat(end).toordinal() if end else None
+        with self._lock:
+            self.refresh()
+            columns = self.columns
+            groups = columns.group_by(dimension, start, end, bill_types)
+            rows = [{
+                'key': columns.label(dimension, code),
+                'count': count,
+                'quantity': quantity,
+                'total': round(total, 2)
+            } for code, (count, quantity, total) in groups.items()]
+        if dimension == 'day':
+            rows.sort(key=lambda row: row['key'])
+        else:
+            rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows[:limit] if limit else rows
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    """This process's SalesAnalytics"""
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                _analytics = SalesAnalytics()
+    return _analytics
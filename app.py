@@ -3,18 +3,32 @@
 Flask Web Application for Electrical Shop Stock Management System
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, g, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, g, session, redirect, url_for, Response
 from flask_cors import CORS
 from products import ProductManager
 from stock import StockManager
-from billing import BillingManager
+from billing import BillingManager, SYNC_MAX_BILLS, SYNC_ALLOW_OVERSELL, BILL_ITEM_COLUMNS, RECENT_BILL_COLUMNS
+from products import PRODUCT_COLUMNS, LOW_STOCK_COLUMNS
+from stock import STOCK_REPORT_COLUMNS
+from serializers import RowMapper, array_response, dumps
 from expenses import ExpenseManager
 from supplier_bills import SupplierBillManager
-from cleanup_old_records import DatabaseCleaner
-# from apscheduler.schedulers.background import BackgroundScheduler
-# from apscheduler.triggers.cron import CronTrigger
+from jobs import JobScheduler, register_default_jobs, JOBS_ENABLED
+from sales_velocity import get_velocity, parse_window
+from reorder import ReorderEngine
+import costing
+import idempotency
+import events
+import change_log
+import compression
+import database
+import profiler
+import metrics
 import json
-from datetime import datetime
+import os
+import time
+import importlib
+from datetime import datetime, timedelta
 import io
 from functools import wraps
 import logging
@@ -22,49 +36,71 @@ import logging
 app = Flask(__name__)
 app.secret_key = 'saibaba_venkata_secret_key_2026'  # Secret key for session management
 CORS(app)
+# gzip/Brotli responses, precompressed and fingerprinted static files (loaded in create_app)
+compression.init_app(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize background scheduler for automatic cleanup - COMMENTED OUT FOR NOW
-# scheduler = BackgroundScheduler()
-
-# def run_weekly_cleanup():
-#     """Run database cleanup automatically every Sunday at 2 AM"""
-#     try:
-#         logger.info("Starting automatic weekly database cleanup...")
-#         cleaner = DatabaseCleaner()
-#         cleaner.cleanup()
-#         cleaner.close()
-#         logger.info("Weekly cleanup completed successfully")
-#     except Exception as e:
-#         logger.error(f"Error during weekly cleanup: {e}")
-
-# Schedule cleanup for every Sunday at 2 AM
-# scheduler.add_job(
-#     func=run_weekly_cleanup,
-#     trigger=CronTrigger(day_of_week=6, hour=2, minute=0),
-#     id='weekly_cleanup',
-#     name='Weekly Database Cleanup',
-#     replace_existing=True
-# )
-
-# Start scheduler immediately when app starts
-# if not scheduler.running:
-#     scheduler.start()
-#     logger.info("Background scheduler started - automatic cleanup enabled")
+# Background scheduler for maintenance jobs (cleanup, optimize, backups).
+# Started lazily in each worker; only the leader worker actually runs jobs.
+scheduler = JobScheduler()
+register_default_jobs(scheduler)
+
+@app.before_request
+def start_background_jobs():
+    """Start the job scheduler in this worker on its first request"""
+    scheduler.start()
+
+@app.before_request
+def start_query_profiling():
+    """Begin recording this request's queries"""
+    g.request_started = time.perf_counter()
+    profiler.start_request()
+
+@app.after_request
+def add_query_timing(response):
+    """Report query count and DB time via Server-Timing headers and metrics"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    total_ms = (time.perf_counter() - started) * 1000
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    count, db_ms = profiler.finish_request(f"{request.method} {route}", total_ms)
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_ms:.2f};desc="{count} queries", app;dur={total_ms:.2f}'
+    )
+    response.headers['X-Query-Count'] = str(count)
+
+    metrics.REQUEST_LATENCY.observe(total_ms / 1000, method=request.method, route=route)
+    metrics.REQUEST_DB_TIME.observe(db_ms / 1000, method=request.method, route=route)
+    metrics.REQUEST_QUERIES.observe(count, method=request.method, route=route)
+    metrics.REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    metrics.REGISTRY.maybe_flush()
+    return response
+
+metrics.track_lru_cache('statement_normalize', profiler.normalize_statement)
+metrics.track_lru_cache('placeholder_translation', database.translate_placeholders)
+
+MANAGER_CLASSES = {
+    'products': ProductManager,
+    'stock': StockManager,
+    'billing': BillingManager,
+    'expenses': ExpenseManager,
+    'supplier_bills': SupplierBillManager
+}
+
+class RequestManagers(dict):
+    """A request's managers, each created on first use (every manager opens its own connection)"""
+    def __missing__(self, name):
+        manager = self[name] = MANAGER_CLASSES[name]()
+        return manager
 
 def get_managers():
     """Get or create managers for current request"""
     if 'managers' not in g:
-        g.managers = {
-            'products': ProductManager(),
-            'stock': StockManager(),
-            'billing': BillingManager(),
-            'expenses': ExpenseManager(),
-            'supplier_bills': SupplierBillManager()
-        }
+        g.managers = RequestManagers()
     return g.managers
 
 @app.teardown_appcontext
@@ -75,6 +111,105 @@ def close_managers(error):
         for mgr in managers.values():
             mgr.close()
 
+# ============ RESPONSE HELPERS ============
+# Shared by the Flask routes and the async routes in asgi.py
+
+# Row mappers: fields are written against each query's column names and compiled
+# once (see serializers.py); each is called like a function of one row
+product_to_dict = RowMapper(PRODUCT_COLUMNS, {
+    'id': 'id',
+    'name': 'name',
+    'category': 'category',
+    'unit_price': 'unit_price',
+    'quantity': 'quantity',
+    'minimum_stock': 'minimum_stock',
+    'status': "'LOW' if quantity <= minimum_stock else 'OK'"
+})
+
+low_stock_to_dict = RowMapper(LOW_STOCK_COLUMNS, {
+    'id': 'id',
+    'name': 'name',
+    'category': 'category',
+    'current_quantity': 'quantity',
+    'minimum_stock': 'minimum_stock',
+    'shortage': 'max(minimum_stock - quantity, 0)',
+    'suggested_quantity': 'suggested_quantity if suggested_quantity is not None else max(minimum_stock - quantity, 0)',
+    'days_of_cover': 'days_of_cover'
+})
+
+stock_item_to_dict = RowMapper(STOCK_REPORT_COLUMNS, {
+    'id': 'id',
+    'name': 'name',
+    'category': 'category',
+    'quantity': 'quantity',
+    'unit_price': 'unit_price',
+    'min_stock': 'minimum_stock',
+    'total_value': 'total_value',
+    'status': "'LOW' if quantity <= minimum_stock else 'OK'"
+})
+
+bill_item_to_dict = RowMapper(BILL_ITEM_COLUMNS, {
+    'product_name': 'product_name',
+    'quantity': 'quantity',
+    'unit_price': 'unit_price',
+    'total_price': 'total_price'
+})
+
+recent_bill_to_dict = RowMapper(RECENT_BILL_COLUMNS, {
+    'bill_number': 'bill_number',
+    'customer_name': 'customer_name',
+    'total_amount': 'total_amount',
+    'payment_method': 'payment_method',
+    'created_at': 'created_at'
+})
+
+def stock_total_value(report):
+    return sum(item[6] for item in report)
+
+def stock_report_to_dict(report):
+    report = report or []
+    return {
+        'items': stock_item_to_dict.map(report),
+        'total_inventory_value': stock_total_value(report)
+    }
+
+def bills_with_items(bills, items):
+    """(bill, its items) pairs for bill_with_items_to_dict, from get_recent_bills_with_items"""
+    return [(bill, items.get(bill[0], ())) for bill in bills]
+
+def bill_with_items_to_dict(pair):
+    bill, items = pair
+    result = recent_bill_to_dict(bill)
+    result['items'] = bill_item_to_dict.map(items)
+    return result
+
+def sales_summary_to_dict(summary):
+    if summary and summary[0] > 0:
+        return {
+            'total_bills': int(summary[0]),
+            'total_sales': float(summary[1]),
+            'avg_bill_value': float(summary[2]),
+            'max_bill_value': float(summary[3])
+        }
+    return {
+        'total_bills': 0,
+        'total_sales': 0.0,
+        'avg_bill_value': 0.0,
+        'max_bill_value': 0.0
+    }
+
+def dashboard_to_dict(product_count, low_stock_count, sales_summary, stock_report):
+    total_bills, total_sales, avg_bill, max_bill = sales_summary if sales_summary else (0, 0, 0, 0)
+    total_inventory_value = stock_total_value(stock_report) if stock_report else 0
+    return {
+        'total_products': product_count,
+        'low_stock_count': low_stock_count,
+        'total_bills': int(total_bills) if total_bills else 0,
+        'total_sales': float(total_sales) if total_sales else 0.0,
+        'avg_bill_value': float(avg_bill) if avg_bill else 0.0,
+        'inventory_value': float(total_inventory_value)
+    }
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
@@ -155,24 +290,30 @@ def get_dashboard_data():
         
         # Get sales stats
         sales_summary = mgr['billing'].get_sales_summary()
-        total_bills, total_sales, avg_bill, max_bill = sales_summary if sales_summary else (0, 0, 0, 0)
         
         # Get stock report
         stock_report = mgr['stock'].get_stock_report()
-        total_inventory_value = sum(item[6] for item in stock_report) if stock_report else 0
         
-        data = {
-            'total_products': len(all_products) if all_products else 0,
-            'low_stock_count': len(low_stock) if low_stock else 0,
-            'total_bills': int(total_bills) if total_bills else 0,
-            'total_sales': float(total_sales) if total_sales else 0.0,
-            'avg_bill_value': float(avg_bill) if avg_bill else 0.0,
-            'inventory_value': float(total_inventory_value)
-        }
+        data = dashboard_to_dict(len(all_products) if all_products else 0,
+                                 len(low_stock) if low_stock else 0,
+                                 sales_summary, stock_report)
         return jsonify(data), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events')
+@admin_required
+def event_stream():
+    """Server-Sent Events: bill, stock and payment deltas for open pages"""
+    if not events.EVENTS_ENABLED:
+        return jsonify({'error': 'Live events are disabled'}), 404
+    subscription = events.subscribe(request.headers.get('Last-Event-ID'))
+    if subscription is None:
+        # Pages fall back to loading the full payloads
+        return jsonify({'error': 'Too many live event streams'}), 503
+    return Response(events.stream(subscription), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # ============ PRODUCT ROUTES ============
 
 @app.route('/products')
@@ -187,20 +328,7 @@ def get_products():
     """Get all products"""
     try:
         products = get_managers()['products'].get_all_products()
-        if not products:
-            return jsonify([]), 200
-        result = []
-        for product in products:
-            result.append({
-                'id': product[0],
-                'name': product[1],
-                'category': product[2],
-                'unit_price': product[3],
-                'quantity': product[4],
-                'minimum_stock': product[5],
-                'status': 'LOW' if product[4] <= product[5] else 'OK'
-            })
-        return jsonify(result), 200
+        return array_response(products, product_to_dict)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -273,27 +401,27 @@ def get_stock_report():
         report = get_managers()['stock'].get_stock_report()
         if not report:
             return jsonify([]), 200
-        
-        result = []
-        total_value = 0
-        for item in report:
-            value = item[6]
-            total_value += value
-            result.append({
-                'id': item[0],
-                'name': item[1],
-                'category': item[2],
-                'quantity': item[3],
-                'unit_price': item[4],
-                'min_stock': item[5],
-                'total_value': value,
-                'status': 'LOW' if item[3] <= item[5] else 'OK'
-            })
-        
-        return jsonify({
-            'items': result,
-            'total_inventory_value': total_value
-        }), 200
+        # The total goes first so the items can be streamed after it
+        prefix = b'{"total_inventory_value":' + dumps(stock_total_value(report)) + b',"items":'
+        return array_response(report, stock_item_to_dict, prefix=prefix, suffix=b'}')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stock/as-of')
+@login_required
+def get_stock_as_of():
+    """Stock and valuation at a past date (?date=YYYY-MM-DD[ HH:MM:SS]&product_ids=1,2)"""
+    try:
+        as_of = request.args.get('date')
+        if not as_of:
+            return jsonify({'error': 'date is required'}), 400
+        product_ids = [int(pid) for pid in request.args.get('product_ids', '').split(',') if pid.strip()]
+        result = get_managers()['stock'].get_stock_as_of(as_of, product_ids or None)
+        data = stock_report_to_dict(result['items'])
+        data.update(as_of=result['as_of'], source=result['source'])
+        return jsonify(data), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -303,7 +431,9 @@ def add_stock():
     """Add stock to product"""
     try:
         data = request.json
-        if get_managers()['stock'].add_stock(data['product_id'], int(data['quantity']), data.get('notes', '')):
+        unit_cost = float(data['unit_cost']) if data.get('unit_cost') not in (None, '') else None
+        if get_managers()['stock'].add_stock(data['product_id'], int(data['quantity']), data.get('notes', ''),
+                                             unit_cost=unit_cost):
             return jsonify({'success': True, 'message': 'Stock added'}), 200
         else:
             return jsonify({'error': 'Failed to add stock'}), 400
@@ -353,12 +483,57 @@ def billing_page():
     """Billing/invoicing page"""
     return render_template('billing.html')
 
+def created_bill_to_dict(bill_number, bill):
+    return {
+        'success': True,
+        'bill_number': bill_number,
+        'bill': {
+            'bill_number': bill.get('bill_number'),
+            'customer_name': bill.get('customer_name'),
+            'total_amount': bill.get('total_amount'),
+            'payment_method': bill.get('payment_method'),
+            'created_at': bill.get('created_at'),
+            'items': bill.get('items', [])
+        }
+    }
+
+def idempotent_replay(billing, key, fingerprint):
+    """The stored response for an Idempotency-Key already used, or None"""
+    row = idempotency.lookup(billing.db, key)
+    if not row:
+        return None
+    stored_hash, bill_number, status_code, response = row
+    if stored_hash != fingerprint:
+        return jsonify({'error': 'Idempotency-Key was already used for a different bill'}), 422
+    if response:
+        body = json.loads(response)
+    else:
+        # Bill committed but the first response was never stored (worker died in between)
+        bill = billing.get_bill(bill_number, use_primary=True)
+        if bill is None:
+            return jsonify({'error': 'Bill created but could not retrieve details'}), 400
+        body, status_code = created_bill_to_dict(bill_number, bill), 201
+    resp = jsonify(body)
+    resp.headers['Idempotent-Replayed'] = 'true'
+    return resp, status_code
+
 @app.route('/api/billing/create', methods=['POST'])
 @login_required
 def create_bill():
-    """Create new bill"""
+    """Create new bill; retries carrying the same Idempotency-Key header get the first response back"""
     try:
         data = request.json
+        billing = get_managers()['billing']
+        key = request.headers.get('Idempotency-Key')
+        fingerprint = None
+        if key is not None:
+            if not idempotency.is_valid_key(key):
+                return jsonify({'error': f'Idempotency-Key must be 1 to {idempotency.MAX_KEY_LENGTH} characters'}), 400
+            fingerprint = idempotency.request_hash(data)
+            replay = idempotent_replay(billing, key, fingerprint)
+            if replay:
+                return replay
+
         # New format includes product_id, quantity, unit_price, and name
         items_list = [
             (
@@ -369,33 +544,33 @@ def create_bill():
             ) for item in data['items']
         ]
         
-        bill_number = get_managers()['billing'].create_bill(
+        bill_number = billing.create_bill(
             data['customer_name'],
             items_list,
             data.get('payment_method', 'CASH'),
             data.get('cash_amount'),
             data.get('upi_amount'),
-            data.get('bill_type', 'REGULAR')
+            data.get('bill_type', 'REGULAR'),
+            idempotency_key=key,
+            request_hash=fingerprint
         )
         
         if bill_number:
-            bill = get_managers()['billing'].get_bill(bill_number)
+            # Read-your-writes: the replica may not have the new bill yet
+            bill = billing.get_bill(bill_number, use_primary=True)
             if bill is None:
                 return jsonify({'error': 'Bill created but could not retrieve details'}), 400
             
-            return jsonify({
-                'success': True,
-                'bill_number': bill_number,
-                'bill': {
-                    'bill_number': bill.get('bill_number'),
-                    'customer_name': bill.get('customer_name'),
-                    'total_amount': bill.get('total_amount'),
-                    'payment_method': bill.get('payment_method'),
-                    'created_at': bill.get('created_at'),
-                    'items': bill.get('items', [])
-                }
-            }), 201
+            body = created_bill_to_dict(bill_number, bill)
+            if key:
+                idempotency.save_response(billing.db, key, 201, body)
+            return jsonify(body), 201
         else:
+            if key:
+                # A concurrent retry with the same key may have created the bill first
+                replay = idempotent_replay(billing, key, fingerprint)
+                if replay:
+                    return replay
             return jsonify({'error': 'Failed to create bill'}), 400
     except Exception as e:
         import traceback
@@ -403,42 +578,56 @@ def create_bill():
         print(f"Create bill error: {error_trace}")
         return jsonify({'error': str(e), 'trace': error_trace}), 500
 
+@app.route('/api/billing/sync', methods=['POST'])
+@login_required
+def sync_bills():
+    """Apply bills queued offline by the billing page in one transaction.
+    {"bills": [{"client_id", "customer_name", "items", "payment_method", "bill_type", "created_at", ...}]}
+    Returns a result per bill; client_id makes resending a batch safe."""
+    try:
+        data = request.get_json(silent=True) or {}
+        bills = data.get('bills')
+        if not isinstance(bills, list) or not bills:
+            return jsonify({'error': 'bills must be a non-empty list'}), 400
+        if len(bills) > SYNC_MAX_BILLS:
+            return jsonify({'error': f'At most {SYNC_MAX_BILLS} bills per sync'}), 400
+        batch = []
+        for bill in bills:
+            if not isinstance(bill, dict) or not idempotency.is_valid_key(str(bill.get('client_id') or '')):
+                return jsonify({'error': 'Every bill needs a client_id'}), 400
+            batch.append({
+                'client_id': str(bill['client_id']),
+                'customer_name': bill.get('customer_name'),
+                'items': [
+                    (item['product_id'], item['quantity'], item.get('unit_price'), item.get('name'))
+                    for item in bill.get('items') or []
+                ],
+                'payment_method': bill.get('payment_method'),
+                'cash_amount': bill.get('cash_amount'),
+                'upi_amount': bill.get('upi_amount'),
+                'bill_type': bill.get('bill_type'),
+                'created_at': bill.get('created_at'),
+                # The same fingerprint as the direct request, for a bill queued after that request failed
+                'fingerprint': idempotency.request_hash(
+                    {key: value for key, value in bill.items() if key not in ('client_id', 'created_at')})
+            })
+        results = get_managers()['billing'].create_bills(batch, allow_oversell=SYNC_ALLOW_OVERSELL)
+        counts = {status: sum(1 for r in results if r['status'] == status)
+                  for status in ('created', 'duplicate', 'rejected')}
+        return jsonify(dict(counts, results=results)), 200
+    except (KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid bill: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/bills')
 @login_required
 def get_bills():
     """Get recent bills with items"""
     try:
         limit = request.args.get('limit', 10, type=int)
-        bills = get_managers()['billing'].get_all_bills(limit)
-        
-        if not bills:
-            return jsonify([]), 200
-        
-        result = []
-        for bill in bills:
-            bill_number = bill[0]
-            bill_detail = get_managers()['billing'].get_bill(bill_number)
-            
-            # Convert items tuples to dictionaries
-            items_data = []
-            if bill_detail.get('items'):
-                for item in bill_detail['items']:
-                    items_data.append({
-                        'product_name': item[2],
-                        'quantity': item[3],
-                        'unit_price': item[4],
-                        'total_price': item[5]
-                    })
-            
-            result.append({
-                'bill_number': bill_detail['bill_number'],
-                'customer_name': bill_detail['customer_name'],
-                'total_amount': bill_detail['total_amount'],
-                'payment_method': bill_detail['payment_method'],
-                'created_at': bill_detail['created_at'],
-                'items': items_data
-            })
-        return jsonify(result), 200
+        bills, items = get_managers()['billing'].get_recent_bills_with_items(limit)
+        return array_response(bills_with_items(bills, items), bill_with_items_to_dict)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -571,43 +760,158 @@ def get_sales_summary():
     """Get sales summary"""
     try:
         summary = get_managers()['billing'].get_sales_summary()
-        if summary and summary[0] > 0:
-            return jsonify({
-                'total_bills': int(summary[0]),
-                'total_sales': float(summary[1]),
-                'avg_bill_value': float(summary[2]),
-                'max_bill_value': float(summary[3])
-            }), 200
-        else:
-            return jsonify({
-                'total_bills': 0,
-                'total_sales': 0.0,
-                'avg_bill_value': 0.0,
-                'max_bill_value': 0.0
-            }), 200
+        return jsonify(sales_summary_to_dict(summary)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/reports/low-stock')
 @login_required
 def get_low_stock_report():
-    """Get low stock products"""
+    """Get low stock products (below minimum stock or at their reorder point)"""
     try:
         low_stock = get_managers()['products'].get_low_stock_products()
-        if not low_stock:
-            return jsonify([]), 200
-        
+        return array_response(low_stock, low_stock_to_dict)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reorder-suggestions')
+@login_required
+def get_reorder_suggestions():
+    """Products to reorder as of the last reorder_suggestions run, least cover first"""
+    try:
+        engine = ReorderEngine()
+        try:
+            suggestions = engine.get_suggestions()
+            last_run = engine.last_run()
+        finally:
+            engine.close()
+        return jsonify({
+            'last_run': last_run,
+            'suggestions': [{
+                'id': row[0],
+                'name': row[1],
+                'category': row[2],
+                'current_quantity': row[3],
+                'minimum_stock': row[4],
+                'units_per_day': row[5],
+                'days_of_cover': row[6],
+                'lead_time_days': row[7],
+                'reorder_point': row[8],
+                'suggested_quantity': row[9],
+                'computed_at': row[10],
+                'supplier_name': row[11]
+            } for row in suggestions]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reorder-settings/<int:product_id>', methods=['PUT'])
+@admin_required
+def set_reorder_settings(product_id):
+    """Set a product's supplier lead time ({"lead_time_days": 5, "supplier_name": "..."})"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if 'lead_time_days' not in data:
+            return jsonify({'error': 'lead_time_days is required'}), 400
+        if not get_managers()['products'].get_product_by_id(product_id):
+            return jsonify({'error': 'Product not found'}), 404
+        engine = ReorderEngine()
+        try:
+            engine.set_lead_time(product_id, int(data['lead_time_days']), data.get('supplier_name'))
+        finally:
+            engine.close()
+        return jsonify({'success': True, 'message': 'Lead time updated'}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/profit')
+@admin_required
+def get_profit_report():
+    """Revenue, cost and margin by day, category and product (?from=YYYY-MM-DD&to=YYYY-MM-DD, default last 30 days)"""
+    try:
+        today = database.get_ist_datetime()[:10]
+        end = request.args.get('to') or today
+        start = request.args.get('from') or (datetime.fromisoformat(end) - timedelta(days=29)).strftime('%Y-%m-%d')
+        return jsonify(get_managers()['billing'].get_profit_report(start, end)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<int:product_id>/cost', methods=['GET', 'PUT'])
+@admin_required
+def product_cost(product_id):
+    """Average and last purchase cost; PUT {"unit_cost"} sets the cost of stock on hand without one"""
+    try:
+        db = get_managers()['products'].db
+        if request.method == 'PUT':
+            data = request.get_json(silent=True) or {}
+            if data.get('unit_cost') in (None, ''):
+                return jsonify({'error': 'unit_cost is required'}), 400
+            costing.set_opening_cost(db, product_id, float(data['unit_cost']))
+        cost = costing.get_cost(db, product_id)
+        return jsonify({
+            'product_id': product_id,
+            'avg_cost': cost[0] if cost else None,
+            'last_cost': cost[1] if cost else None,
+            'cost_method': costing.COST_METHOD
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/sales-by/<dimension>')
+@login_required
+def get_sales_by(dimension):
+    """Sales grouped by day, category, product, customer, payment_method or bill_type
+    (?from=YYYY-MM-DD&to=YYYY-MM-DD&bill_type=REGULAR,CREDIT&limit=20)"""
+    try:
+        from analytics import get_analytics
+        bill_types = [t for t in request.args.get('bill_type', '').split(',') if t]
+        rows = get_analytics().sales_by(
+            dimension,
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            bill_types=bill_types or None,
+            limit=request.args.get('limit', type=int)
+        )
+        return jsonify(rows), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/top-products')
+@login_required
+def get_top_products():
+    """Best sellers and units/day velocity (?window=7d|30d|90d&limit=10&by=quantity|revenue)"""
+    try:
+        days = parse_window(request.args.get('window', '30d'))
+        by = request.args.get('by', 'quantity')
+        if by not in ('quantity', 'revenue'):
+            return jsonify({'error': 'by must be quantity or revenue'}), 400
+        top = get_velocity().top_products(days, k=request.args.get('limit', 10, type=int), by=by)
+        products = get_managers()['products'].get_products_by_ids([product_id for product_id, _, _ in top])
         result = []
-        for product in low_stock:
+        for product_id, units, revenue in top:
+            product = products.get(product_id)
+            velocity = units / days
             result.append({
-                'id': product[0],
-                'name': product[1],
-                'category': product[2],
-                'current_quantity': product[4],
-                'minimum_stock': product[5],
-                'shortage': product[5] - product[4]
+                'id': product_id,
+                'name': product[1] if product else None,
+                'category': product[2] if product else None,
+                'units_sold': units,
+                'revenue': round(revenue, 2),
+                'units_per_day': round(velocity, 2),
+                'current_stock': product[4] if product else None,
+                'days_of_cover': round(product[4] / velocity, 1) if product and velocity else None
             })
-        return jsonify(result), 200
+        return jsonify({'window_days': days, 'by': by, 'products': result}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -783,6 +1087,11 @@ def add_supplier_bill():
             data.get('description', ''),
             data.get('due_date')
         )
+        # Optional received lines [{product_id, quantity, unit_cost}] add stock at the billed cost
+        for item in data.get('items') or []:
+            mgr['stock'].add_stock(int(item['product_id']), int(item['quantity']),
+                                   f"Supplier bill {data['bill_number']}",
+                                   unit_cost=float(item['unit_cost']), source='SUPPLIER_BILL', source_id=bill_id)
         
         return jsonify({'success': True, 'bill_id': bill_id}), 200
     except Exception as e:
@@ -934,10 +1243,8 @@ def pay_credit_bill(bill_number):
 def delete_transaction(transaction_id):
     """Delete a transaction (credit/replacement bill)"""
     try:
-        mgr = get_managers()
-        cursor = mgr['billing'].db.cursor
-        cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
-        mgr['billing'].db.connection.commit()
+        if not get_managers()['billing'].delete_transaction(transaction_id):
+            return jsonify({'error': 'Transaction not found'}), 404
         return jsonify({'success': True, 'message': 'Transaction deleted'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -966,5 +1273,142 @@ def credit_bills_summary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ============ ADMIN ROUTES ============
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics; needs METRICS_TOKEN as a bearer token or an admin session"""
+    token = os.environ.get('METRICS_TOKEN')
+    authorized = session.get('role') == 'admin' or (
+        token and request.headers.get('Authorization') == f'Bearer {token}'
+    )
+    if not authorized:
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/changes')
+def get_changes():
+    """Changes after ?since=<seq>, oldest first, one JSON object per line; needs CHANGES_TOKEN or an admin session"""
+    token = os.environ.get('CHANGES_TOKEN')
+    authorized = session.get('role') == 'admin' or (
+        token and request.headers.get('Authorization') == f'Bearer {token}'
+    )
+    if not authorized:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', 10000, type=int), 100000)
+        if since < 0 or limit < 1:
+            raise ValueError("since must be >= 0 and limit >= 1")
+        oldest, head = change_log.get_bounds(get_managers()['billing'].db)
+        if oldest is not None and since < oldest - 1:
+            # Purged past this consumer: it has to re-read the tables, then continue from head
+            return jsonify({'error': 'Changes after this seq have been purged', 'oldest_seq': oldest,
+                            'head_seq': head}), 410
+        head = head or 0
+
+        def generate():
+            # Own connection: the request's managers are closed once streaming starts
+            db = database.Database()
+            try:
+                for row in change_log.iter_changes(db, since, head, limit):
+                    yield change_log.to_json_line(row)
+            finally:
+                db.close()
+
+        return Response(generate(), mimetype='application/x-ndjson',
+                        headers={'X-Change-Log-Head': str(head)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@admin_required
+def get_jobs_status():
+    """Background job status, timing stats and recent run history"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify(scheduler.get_status(limit)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/perf', methods=['GET'])
+@admin_required
+def get_perf_stats():
+    """Per-endpoint query counts and timings, hot statements and slow queries"""
+    try:
+        top = request.args.get('top', 20, type=int)
+        return jsonify(profiler.get_stats(top)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/perf', methods=['DELETE'])
+@admin_required
+def reset_perf_stats():
+    """Clear the profiler totals for this worker"""
+    profiler.reset()
+    return jsonify({'success': True}), 200
+
+@app.route('/api/admin/stock-reconciliation', methods=['GET', 'POST'])
+@admin_required
+def stock_reconciliation():
+    """Drift between product quantities and stock movements; POST {"repair": "ledger"|"quantity"} fixes it"""
+    from reconciliation import StockReconciler, REPAIR_MODES
+    try:
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        repair = data.get('repair')
+        if repair and repair not in REPAIR_MODES:
+            return jsonify({'error': f"repair must be one of: {', '.join(REPAIR_MODES)}"}), 400
+        reconciler = StockReconciler()
+        try:
+            report = reconciler.run(full=request.args.get('full') == '1', repair=repair)
+        finally:
+            reconciler.close()
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/jobs/<job_name>/run', methods=['POST'])
+@admin_required
+def run_job_now(job_name):
+    """Trigger a background job immediately (runs off the request path)"""
+    try:
+        if scheduler.run_in_background(job_name):
+            return jsonify({'success': True, 'message': f'Job {job_name} started'}), 202
+        return jsonify({'error': 'Job not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============ APP FACTORY ============
+
+# Imported on first use by routes and jobs; create_app imports them up front so
+# preloaded gunicorn workers share them instead of each importing its own
+PRELOAD_MODULES = ['analytics', 'reconciliation', 'backup', 'cleanup_old_records']
+if JOBS_ENABLED:
+    PRELOAD_MODULES += ['apscheduler.schedulers.background', 'apscheduler.triggers.cron']
+
+_app_ready = False
+
+def create_app():
+    """
+    Initialise the app once per process and return it: the tables, the
+    precompressed static files and the lazily imported modules. Under
+    gunicorn.conf.py (preload_app) this runs in the master before the workers
+    fork, so they share all of it copy-on-write.
+    """
+    global _app_ready
+    if not _app_ready:
+        started = time.perf_counter()
+        database.init_schema()
+        assets = app.extensions.get('compression')
+        static_files = assets.preload() if assets else 0
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+        _app_ready = True
+        print(f"✓ App ready in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"({static_files} static files precompressed)")
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
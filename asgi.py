@@ -0,0 +1,232 @@
+"""
+ASGI Entry Point
+Serves the read-heavy API routes (products, bills, stock report, reports,
+dashboard) as async handlers on AsyncDatabase, so a slow report doesn't hold a
+worker while the counters wait. Every other path is handed to the Flask app.
+
+    pip install uvicorn asgiref aiosqlite      # or asyncpg for PostgreSQL
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker --workers 2
+
+Login uses the same signed Flask session cookie as app.py.
+"""
+
+import time
+import asyncio
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_accept_header
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise ImportError("asgi.py needs asgiref to serve the Flask routes: pip install asgiref")
+
+import compression
+import profiler
+import metrics
+from async_db import AsyncDatabase
+from app import (app as flask_app, create_app, scheduler, product_to_dict, low_stock_to_dict, stock_report_to_dict,
+                 sales_summary_to_dict, bills_with_items, bill_with_items_to_dict, dashboard_to_dict)
+from products import ALL_PRODUCTS_SQL, LOW_STOCK_SQL
+from stock import STOCK_REPORT_SQL
+from billing import RECENT_BILL_HEADERS_SQL, SALES_SUMMARY_SQL, bill_item_queries, group_items
+from serializers import dumps
+
+ASYNC_ROUTES = {}
+
+_db = None
+_db_lock = None
+_wsgi = WsgiToAsgi(flask_app)
+
+
+def route(path, admin=False):
+    """Register an async GET handler; admin=True mirrors @admin_required"""
+    def decorator(func):
+        ASYNC_ROUTES[path] = (func, admin)
+        return func
+    return decorator
+
+
+class AsyncRequest:
+    def __init__(self, scope, session):
+        self.scope = scope
+        self.session = session
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+    def arg_int(self, name, default):
+        try:
+            return int(self.args.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+
+def _header(scope, header_name):
+    for name, value in scope.get('headers', []):
+        if name == header_name:
+            return value.decode('latin-1')
+    return ''
+
+
+def load_session(scope):
+    """Decode the signed Flask session cookie, or {} if missing/invalid"""
+    cookie_header = _header(scope, b'cookie')
+    cookie = SimpleCookie()
+    try:
+        cookie.load(cookie_header)
+    except Exception:
+        return {}
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if morsel is None or serializer is None:
+        return {}
+    try:
+        return serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+async def get_db():
+    global _db, _db_lock
+    if _db is None:
+        if _db_lock is None:
+            _db_lock = asyncio.Lock()
+        async with _db_lock:
+            if _db is None:
+                # Create the schema (and load the static files) before pooling connections
+                await asyncio.to_thread(create_app)
+                _db = await AsyncDatabase().connect()
+                print(f"✓ Async database ready ({_db.backend}, pool of {_db.pool_size})")
+    return _db
+
+
+# ============ ASYNC ROUTES ============
+
+@route('/api/products')
+async def get_products(request, db):
+    """Get all products"""
+    products = await db.fetch_all(ALL_PRODUCTS_SQL)
+    return product_to_dict.map(products), 200
+
+
+@route('/api/stock-report')
+async def get_stock_report(request, db):
+    """Get stock report with valuations"""
+    report = await db.fetch_all(STOCK_REPORT_SQL)
+    if not report:
+        return [], 200
+    return stock_report_to_dict(report), 200
+
+
+@route('/api/bills')
+async def get_bills(request, db):
+    """Get recent bills with items"""
+    bills = await db.fetch_all(RECENT_BILL_HEADERS_SQL, (request.arg_int('limit', 10),))
+    results = await asyncio.gather(*(db.fetch_all(sql, params) for sql, params in bill_item_queries(bills)))
+    items = group_items(item for rows in results for item in rows)
+    return [bill_with_items_to_dict(pair) for pair in bills_with_items(bills, items)], 200
+
+
+@route('/api/reports/sales-summary')
+async def get_sales_summary(request, db):
+    """Get sales summary"""
+    return sales_summary_to_dict(await db.fetch_one(SALES_SUMMARY_SQL)), 200
+
+
+@route('/api/reports/low-stock')
+async def get_low_stock_report(request, db):
+    """Get low stock products"""
+    low_stock = await db.fetch_all(LOW_STOCK_SQL)
+    return low_stock_to_dict.map(low_stock), 200
+
+
+@route('/api/dashboard', admin=True)
+async def get_dashboard_data(request, db):
+    """Get dashboard statistics"""
+    all_products, low_stock, sales_summary, stock_report = await asyncio.gather(
+        db.fetch_all(ALL_PRODUCTS_SQL),
+        db.fetch_all(LOW_STOCK_SQL),
+        db.fetch_one(SALES_SUMMARY_SQL),
+        db.fetch_all(STOCK_REPORT_SQL),
+    )
+    return dashboard_to_dict(len(all_products), len(low_stock), sales_summary, stock_report), 200
+
+
+# ============ ASGI PLUMBING ============
+
+async def _send_response(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _handle_async_route(scope, send, path, handler, admin):
+    started = time.perf_counter()
+    session = load_session(scope)
+    if 'logged_in' not in session:
+        location = '/login'
+    elif admin and session.get('role') != 'admin':
+        location = '/billing'
+    else:
+        location = None
+    if location:
+        await _send_response(send, 302, b'', [(b'location', location.encode()), (b'content-length', b'0')])
+        return
+
+    profiler.start_request()
+    try:
+        data, status = await handler(AsyncRequest(scope, session), await get_db())
+    except Exception as e:
+        data, status = {'error': str(e)}, 500
+    body = dumps(data) + b'\n'
+    encoding = None
+    if compression.COMPRESSION_ENABLED and len(body) >= compression.COMPRESS_MIN_BYTES:
+        encoding = compression.choose_encoding(parse_accept_header(_header(scope, b'accept-encoding')))
+        if encoding:
+            body = compression.compress(body, encoding)
+
+    total_ms = (time.perf_counter() - started) * 1000
+    count, db_ms = profiler.finish_request(f"GET {path}", total_ms)
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'server-timing', f'db;dur={db_ms:.2f};desc="{count} queries", app;dur={total_ms:.2f}'.encode()),
+        (b'x-query-count', str(count).encode()),
+        (b'vary', b'Accept-Encoding'),
+    ]
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode()))
+    metrics.REQUEST_LATENCY.observe(total_ms / 1000, method='GET', route=path)
+    metrics.REQUEST_DB_TIME.observe(db_ms / 1000, method='GET', route=path)
+    metrics.REQUEST_QUERIES.observe(count, method='GET', route=path)
+    metrics.REQUESTS.inc(method='GET', route=path, status=status)
+    metrics.REGISTRY.maybe_flush()
+    await _send_response(send, status, body, headers)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await get_db()
+            scheduler.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _db is not None:
+                await _db.close()
+            scheduler.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        entry = ASYNC_ROUTES.get(scope['path'])
+        if entry:
+            await _handle_async_route(scope, send, scope['path'], *entry)
+            return
+    await _wsgi(scope, receive, send)
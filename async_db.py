@@ -0,0 +1,205 @@
+"""
+Async Database Access
+Same fetch_all / fetch_one / execute_query interface as Database, for the
+async routes in asgi.py. Uses a small pool of connections per process.
+- PostgreSQL: asyncpg if installed
+- SQLite: aiosqlite if installed
+- Otherwise: plain sqlite3/psycopg2 connections run in worker threads
+The schema must already exist (Database() creates it).
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+
+import database
+import profiler
+
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', '8'))
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+class _ThreadConnection:
+    """A blocking connection driven through asyncio.to_thread"""
+
+    def __init__(self, is_postgres):
+        self.is_postgres = is_postgres
+        if is_postgres:
+            import psycopg2
+            self.connection = psycopg2.connect(database.DATABASE_URL)
+            # Single statements only; don't leave read transactions open between requests
+            self.connection.autocommit = True
+        else:
+            self.connection = sqlite3.connect(database.DB_PATH, check_same_thread=False,
+                                              cached_statements=database.SQLITE_CACHED_STATEMENTS)
+
+    def _execute(self, query, params, fetch):
+        cursor = self.connection.cursor()
+        try:
+            if params and self.is_postgres:
+                cursor.execute(database.translate_placeholders(query), params)
+            elif params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            if fetch == 'all':
+                return cursor.fetchall(), None
+            if fetch == 'one':
+                return cursor.fetchone(), None
+            self.connection.commit()
+            return None, cursor.rowcount
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    async def run(self, query, params, fetch):
+        return await asyncio.to_thread(self._execute, query, params, fetch)
+
+    async def close(self):
+        await asyncio.to_thread(self.connection.close)
+
+
+class _AsyncpgConnection:
+    """An asyncpg pool connection; asyncpg caches prepared statements itself"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def run(self, query, params, fetch):
+        pg_query = database.numbered_placeholders(query)
+        args = tuple(params or ())
+        if fetch == 'all':
+            return [tuple(row) for row in await self.connection.fetch(pg_query, *args)], None
+        if fetch == 'one':
+            row = await self.connection.fetchrow(pg_query, *args)
+            return (tuple(row) if row else None), None
+        # Status is e.g. 'UPDATE 3' or 'INSERT 0 1'
+        count = (await self.connection.execute(pg_query, *args)).split()[-1]
+        return None, int(count) if count.isdigit() else 0
+
+
+class _AiosqliteConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @classmethod
+    async def open(cls):
+        return cls(await aiosqlite.connect(database.DB_PATH,
+                                           cached_statements=database.SQLITE_CACHED_STATEMENTS))
+
+    async def run(self, query, params, fetch):
+        async with self.connection.execute(query, params or ()) as cursor:
+            if fetch == 'all':
+                return await cursor.fetchall(), None
+            if fetch == 'one':
+                return await cursor.fetchone(), None
+            await self.connection.commit()
+            return None, cursor.rowcount
+
+    async def close(self):
+        await self.connection.close()
+
+
+class AsyncDatabase:
+    """Pooled async connections with the Database query interface"""
+
+    def __init__(self, pool_size=None):
+        self.is_postgres = bool(database.DATABASE_URL)
+        self.pool_size = pool_size or ASYNC_DB_POOL_SIZE
+        self._pg_pool = None
+        self._idle = None
+        self._connections = []
+
+    @property
+    def backend(self):
+        if self.is_postgres:
+            return 'asyncpg' if asyncpg else 'psycopg2-threads'
+        return 'aiosqlite' if aiosqlite else 'sqlite3-threads'
+
+    async def connect(self):
+        if self.is_postgres and asyncpg:
+            self._pg_pool = await asyncpg.create_pool(database.DATABASE_URL, min_size=1, max_size=self.pool_size)
+            return self
+        self._idle = asyncio.Queue()
+        for _ in range(self.pool_size):
+            if not self.is_postgres and aiosqlite:
+                connection = await _AiosqliteConnection.open()
+            else:
+                connection = await asyncio.to_thread(_ThreadConnection, self.is_postgres)
+            self._connections.append(connection)
+            self._idle.put_nowait(connection)
+        return self
+
+    async def close(self):
+        if self._pg_pool:
+            await self._pg_pool.close()
+            self._pg_pool = None
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+
+    @asynccontextmanager
+    async def _acquire(self):
+        if self._pg_pool:
+            async with self._pg_pool.acquire() as connection:
+                yield _AsyncpgConnection(connection)
+            return
+        connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def _run(self, query, params, fetch):
+        """Run one statement; the profiler sees execution time, not pool wait"""
+        async with self._acquire() as connection:
+            start = time.perf_counter()
+            try:
+                result, rowcount = await connection.run(query, params, fetch)
+            except Exception as e:
+                profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 0, error=e)
+                raise
+        if fetch == 'all':
+            rowcount = len(result)
+        elif fetch == 'one':
+            rowcount = 1 if result else 0
+        profiler.record_query(query, params, (time.perf_counter() - start) * 1000, rowcount)
+        return result
+
+    async def execute_query(self, query, params=None):
+        """Execute a query"""
+        try:
+            await self._run(query, params, None)
+            return True
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+
+    async def fetch_all(self, query, params=None):
+        """Fetch all results"""
+        try:
+            return await self._run(query, params, 'all')
+        except Exception as e:
+            print(f"Error fetching data: {e}")
+            return []
+
+    async def fetch_one(self, query, params=None):
+        """Fetch single result"""
+        try:
+            return await self._run(query, params, 'one')
+        except Exception as e:
+            print(f"Error fetching data: {e}")
+            return None
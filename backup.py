@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Online Database Backup
+Takes consistent snapshots of the live SQLite database while the app is running.
+- Pages are copied in small steps with the sqlite3 backup API, so billing can
+  keep writing between steps instead of waiting for a whole-file copy
+- Snapshots are gzip-compressed and get a .sha256 checksum file next to them
+- Only the newest BACKUP_KEEP snapshots are kept
+
+Usage:
+    python backup.py create
+    python backup.py list
+    python backup.py verify <snapshot>
+    python backup.py restore <snapshot>
+"""
+
+import os
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+from datetime import datetime
+
+import database
+
+BACKUP_DIR = os.environ.get(
+    'BACKUP_DIR',
+    os.path.join(os.path.dirname(__file__), 'data', 'backups')
+)
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '14'))
+# Pages copied per step (4 KB each) and pause between steps
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.005'))
+# A write from another connection restarts a paged backup; after this many
+# restarts the remaining copy is done in a single step
+BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', '3'))
+
+SNAPSHOT_PREFIX = 'electrical_shop-'
+SNAPSHOT_SUFFIX = '.db.gz'
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BackupManager:
+    def __init__(self, db_path=None, backup_dir=None, keep=None):
+        if database.DATABASE_URL:
+            raise RuntimeError("Online backups only support SQLite; use pg_dump for PostgreSQL")
+        self.db_path = db_path or database.DB_PATH
+        self.backup_dir = backup_dir or BACKUP_DIR
+        self.keep = keep if keep is not None else BACKUP_KEEP
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    def _copy_database(self, source_path, target_path, pages, sleep):
+        """Copy a live database with the backup API; returns (steps, restarts)"""
+        stats = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+        def progress(status, remaining, total):
+            stats['steps'] += 1
+            if stats['remaining'] is not None and remaining > stats['remaining']:
+                stats['restarts'] += 1
+                if stats['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise _BackupRestarted()
+            stats['remaining'] = remaining
+
+        source = sqlite3.connect(source_path)
+        try:
+            target = sqlite3.connect(target_path)
+            try:
+                try:
+                    source.backup(target, pages=pages, progress=progress, sleep=sleep)
+                except _BackupRestarted:
+                    # Busy database: copy everything under one short read lock
+                    source.backup(target, pages=-1)
+                    stats['steps'] += 1
+                result = target.execute('PRAGMA quick_check').fetchone()
+                if not result or result[0] != 'ok':
+                    raise RuntimeError(f"Snapshot failed integrity check: {result}")
+            finally:
+                target.close()
+        finally:
+            source.close()
+        return stats['steps'], stats['restarts']
+
+    def create_backup(self, label=None, pages=None, sleep=None):
+        """Create a compressed, checksummed snapshot of the live database"""
+        pages = pages or BACKUP_PAGES_PER_STEP
+        sleep = BACKUP_STEP_SLEEP if sleep is None else sleep
+        start = time.perf_counter()
+
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = f"{SNAPSHOT_PREFIX}{timestamp}{'-' + label if label else ''}{SNAPSHOT_SUFFIX}"
+        final_path = os.path.join(self.backup_dir, name)
+        raw_tmp = final_path + '.raw.tmp'
+        gz_tmp = final_path + '.tmp'
+
+        try:
+            steps, restarts = self._copy_database(self.db_path, raw_tmp, pages, sleep)
+            with open(raw_tmp, 'rb') as src, gzip.open(gz_tmp, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            raw_size = os.path.getsize(raw_tmp)
+            checksum = _sha256_file(gz_tmp)
+            os.replace(gz_tmp, final_path)
+            with open(final_path + '.sha256', 'w') as f:
+                f.write(f"{checksum}  {name}\n")
+        finally:
+            for path in (raw_tmp, gz_tmp):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        removed = self.rotate()
+        duration_ms = (time.perf_counter() - start) * 1000
+        print(f"✓ Backup created: {name} ({raw_size} bytes -> {os.path.getsize(final_path)} bytes, "
+              f"{steps} steps, {restarts} restarts, {duration_ms:.0f} ms)")
+        return {
+            'path': final_path,
+            'size': os.path.getsize(final_path),
+            'database_size': raw_size,
+            'sha256': checksum,
+            'steps': steps,
+            'restarts': restarts,
+            'duration_ms': duration_ms,
+            'rotated': removed
+        }
+
+    def list_backups(self):
+        """Snapshots in the backup directory, newest first"""
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+                path = os.path.join(self.backup_dir, name)
+                backups.append({
+                    'name': name,
+                    'path': path,
+                    'size': os.path.getsize(path),
+                    'created_at': datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+                })
+        backups.sort(key=lambda b: b['name'], reverse=True)
+        return backups
+
+    def rotate(self):
+        """Delete snapshots beyond the newest `keep`; returns removed names"""
+        removed = []
+        for backup in self.list_backups()[self.keep:]:
+            os.remove(backup['path'])
+            if os.path.exists(backup['path'] + '.sha256'):
+                os.remove(backup['path'] + '.sha256')
+            removed.append(backup['name'])
+        return removed
+
+    def _resolve(self, snapshot):
+        if os.path.exists(snapshot):
+            return snapshot
+        return os.path.join(self.backup_dir, snapshot)
+
+    def verify_backup(self, snapshot):
+        """Check a snapshot against its .sha256 file"""
+        path = self._resolve(snapshot)
+        checksum_path = path + '.sha256'
+        if not os.path.exists(path) or not os.path.exists(checksum_path):
+            return False
+        with open(checksum_path) as f:
+            expected = f.read().split()[0]
+        return _sha256_file(path) == expected
+
+    def restore_backup(self, snapshot):
+        """Restore a snapshot into the live database.
+
+        The current database is snapshotted first (label 'pre-restore'), and
+        the restore goes through the backup API so open connections see a
+        consistent database rather than a half-copied file.
+        """
+        path = self._resolve(snapshot)
+        if not self.verify_backup(path):
+            raise RuntimeError(f"Checksum verification failed for {path}")
+
+        raw_tmp = os.path.join(self.backup_dir, '.restore.db.tmp')
+        try:
+            with gzip.open(path, 'rb') as src, open(raw_tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            check = sqlite3.connect(raw_tmp)
+            try:
+                result = check.execute('PRAGMA integrity_check').fetchone()
+            finally:
+                check.close()
+            if not result or result[0] != 'ok':
+                raise RuntimeError(f"Snapshot failed integrity check: {result}")
+
+            if os.path.exists(self.db_path):
+                self.create_backup(label='pre-restore')
+
+            source = sqlite3.connect(raw_tmp)
+            target = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        finally:
+            if os.path.exists(raw_tmp):
+                os.remove(raw_tmp)
+
+        # The backup may predate newer tables or columns
+        database.reset_schema_cache()
+        print(f"✓ Database restored from {os.path.basename(path)}")
+        return True
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('create', 'list', 'verify', 'restore'):
+        print(__doc__)
+        sys.exit(1)
+
+    manager = BackupManager()
+    command = sys.argv[1]
+    if command == 'create':
+        manager.create_backup()
+    elif command == 'list':
+        for backup in manager.list_backups():
+            print(f"{backup['name']:<50} {backup['size']:>12} bytes  {backup['created_at']}")
+    elif len(sys.argv) < 3:
+        print(f"Usage: python backup.py {command} <snapshot>")
+        sys.exit(1)
+    elif command == 'verify':
+        ok = manager.verify_backup(sys.argv[2])
+        print("✓ Checksum OK" if ok else "✗ Checksum mismatch or missing")
+        sys.exit(0 if ok else 1)
+    elif command == 'restore':
+        manager.restore_backup(sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
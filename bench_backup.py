@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Backup Impact Benchmark
+Measures create_bill latency on a scratch database while an online backup runs.
+
+Runs three phases against the same seeded database:
+  idle      - bills only, no backup
+  paged     - bills while backup.py copies pages in small steps
+  one-step  - bills while the whole file is copied in one step (pages=-1)
+
+Usage:
+    python bench_backup.py [--movements 200000] [--seconds 5]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+import io
+
+import database
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed(db_path, products, movements):
+    """Fill a scratch database with products and a large movement ledger"""
+    import sqlite3
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.Database().close()
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO products (name, category, unit_price, quantity, minimum_stock) VALUES (?, ?, ?, ?, ?)',
+        [(f"Product {i}", f"Category {i % 12}", 10 + i % 500, 1000000, 5) for i in range(products)]
+    )
+    conn.executemany(
+        'INSERT INTO stock_movements (product_id, movement_type, quantity, notes) VALUES (?, ?, ?, ?)',
+        [(1 + i % products, 'ADD', 1 + i % 20, 'seed movement for benchmark') for i in range(movements)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def bill_loop(billing, products, stop, latencies, errors):
+    counter = 0
+    while not stop.is_set():
+        counter += 1
+        items = [(random.randint(1, products), random.randint(1, 3)) for _ in range(random.randint(1, 5))]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = billing.create_bill(f"Bench Customer {counter}", items, 'CASH')
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not result:
+            errors.append(counter)
+
+
+def run_phase(name, products, seconds, backup_kwargs=None):
+    from billing import BillingManager
+    from backup import BackupManager
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        billing = BillingManager()
+    stop = threading.Event()
+    latencies, errors = [], []
+    worker = threading.Thread(target=bill_loop, args=(billing, products, stop, latencies, errors))
+    worker.start()
+
+    backups = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if backup_kwargs is None:
+            time.sleep(0.05)
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            backups.append(BackupManager(keep=2).create_backup(**backup_kwargs))
+    stop.set()
+    worker.join()
+    billing.close()
+
+    result = {
+        'phase': name,
+        'bills': len(latencies),
+        'failed': len(errors),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies) if latencies else 0.0,
+        'backups': len(backups),
+        'backup_avg_ms': sum(b['duration_ms'] for b in backups) / len(backups) if backups else 0.0,
+        'backup_restarts': sum(b['restarts'] for b in backups)
+    }
+    print(f"{name:<10} bills={result['bills']:<6} p50={result['p50_ms']:7.2f}ms p95={result['p95_ms']:7.2f}ms "
+          f"p99={result['p99_ms']:7.2f}ms max={result['max_ms']:8.2f}ms "
+          f"backups={result['backups']} avg_backup={result['backup_avg_ms']:.0f}ms restarts={result['backup_restarts']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--movements', type=int, default=200000)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    if database.DATABASE_URL:
+        print("This benchmark uses a scratch SQLite database; unset DATABASE_URL")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='bench_backup_')
+    database.DB_PATH = os.path.join(workdir, 'bench.db')
+    os.environ['BACKUP_DIR'] = os.path.join(workdir, 'backups')
+    import backup
+    backup.BACKUP_DIR = os.environ['BACKUP_DIR']
+
+    random.seed(42)
+    seed(database.DB_PATH, args.products, args.movements)
+    print(f"Scratch database: {database.DB_PATH} ({os.path.getsize(database.DB_PATH) // 1024} KB)")
+
+    run_phase('idle', args.products, args.seconds)
+    run_phase('paged', args.products, args.seconds, {})
+    run_phase('one-step', args.products, args.seconds, {'pages': -1, 'sleep': 0})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Billing Benchmark
+Measures create_bill throughput and latency with several checkout processes
+writing at once, on a scratch SQLite database.
+
+Runs two phases, each on a fresh database:
+  statement - every statement commits on its own (old behaviour)
+  txn       - one commit per bill (Database.transaction)
+
+Usage:
+    python bench_billing.py [--workers 4] [--seconds 5] [--items 5]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+import io
+import logging
+import multiprocessing
+
+import database
+from bench_backup import percentile
+
+# Lock waits show up as slow INSERTs; they're what this measures
+logging.getLogger('slow_query').setLevel(logging.ERROR)
+
+PHASES = ['statement', 'txn']
+
+
+@contextlib.contextmanager
+def _no_transaction(self):
+    yield self
+
+
+def checkout_loop(phase, db_path, seconds, items, products, results):
+    """One checkout process: create bills until the deadline"""
+    from billing import BillingManager
+    database.DB_PATH = db_path
+    if phase == 'statement':
+        database.Database.transaction = _no_transaction
+
+    rng = random.Random(os.getpid())
+    latencies, failed = [], 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        billing = BillingManager()
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            cart = [(rng.randint(1, products), 1) for _ in range(items)]
+            start = time.perf_counter()
+            if not billing.create_bill('Walk-in', cart, 'CASH'):
+                failed += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        billing.close()
+    results.put((latencies, failed))
+
+
+def run_phase(phase, workdir, args):
+    db_path = os.path.join(workdir, f"{phase}.db")
+    database.DB_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = database.Database()
+        for i in range(1, args.products + 1):
+            db.execute_query('INSERT INTO products (name, category, unit_price, quantity) VALUES (?, ?, ?, ?)',
+                             (f"Product {i}", 'Bench', 100.0, 10 ** 9))
+        db.close()
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=checkout_loop,
+                                     args=(phase, db_path, args.seconds, args.items, args.products, results))
+             for _ in range(args.workers)]
+    for proc in procs:
+        proc.start()
+    latencies, failed = [], 0
+    for _ in procs:
+        worker_latencies, worker_failed = results.get()
+        latencies += worker_latencies
+        failed += worker_failed
+    for proc in procs:
+        proc.join()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = database.Database()
+        movements = db.fetch_one('SELECT COUNT(*) FROM stock_movements')[0]
+        db.close()
+    print(f"{phase:<9} bills/s={len(latencies) / args.seconds:7.1f} failed={failed:<4} "
+          f"p50={percentile(latencies, 50):7.2f}ms p95={percentile(latencies, 95):7.2f}ms "
+          f"p99={percentile(latencies, 99):7.2f}ms movements={movements}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Checkout processes')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--items', type=int, default=5, help='Line items per bill')
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args()
+
+    if database.DATABASE_URL:
+        print("This benchmark uses a scratch SQLite database; unset DATABASE_URL")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='bench_billing_')
+    print(f"{args.workers} checkout processes, {args.items} items per bill, {args.seconds:g}s per phase")
+    for phase in PHASES:
+        run_phase(phase, workdir, args)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
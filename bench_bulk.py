@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Bulk Write Benchmark
+Measures inserting N rows into a temporary table, on a scratch SQLite
+database, or on DATABASE_URL when it is set (PostgreSQL):
+
+  per row      - execute_insert for each row inside one transaction (how the
+                 import and sync paths wrote before)
+  bulk_insert  - COPY FROM STDIN on PostgreSQL, chunked executemany on SQLite
+  bulk_upsert  - the same rows again, every one a conflict (execute_values on
+                 PostgreSQL)
+
+Usage:
+    python bench_bulk.py [--rows 10000]
+    DATABASE_URL=postgres://... python bench_bulk.py
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+import database
+
+TABLE = 'bench_bulk'
+COLUMNS = ('id', 'name', 'category', 'unit_price', 'quantity', 'notes')
+
+
+def rows(count):
+    return [(i, f"Product {i}", f"Category {i % 12}", 10.0 + i % 500, i % 40, None if i % 3 else 'note, "quoted"')
+            for i in range(1, count + 1)]
+
+
+def reset(db):
+    cursor = db.connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""CREATE TEMP TABLE {TABLE} (id INTEGER PRIMARY KEY, name TEXT NOT NULL, category TEXT,
+                                                  unit_price REAL, quantity INTEGER, notes TEXT)""")
+    cursor.close()
+    db.connection.commit()
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk insert / upsert benchmark')
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    if not database.DATABASE_URL:
+        database.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = database.Database()
+    data = rows(args.rows)
+    insert_sql = f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+
+    def per_row():
+        with db.transaction():
+            for row in data:
+                db.execute_insert(insert_sql, row)
+
+    results = []
+    reset(db)
+    results.append(('per row', timed(per_row)))
+    reset(db)
+    results.append(('bulk_insert', timed(lambda: db.bulk_insert(TABLE, COLUMNS, data))))
+    results.append(('bulk_upsert', timed(lambda: db.bulk_upsert(TABLE, COLUMNS, data, ('id',)))))
+    assert db.fetch_one(f"SELECT COUNT(*) FROM {TABLE}", use_primary=True)[0] == args.rows
+
+    cursor = db.connection.cursor()
+    cursor.execute(f"DROP TABLE {TABLE}")
+    cursor.close()
+    db.connection.commit()
+    db.close()
+
+    print(f"{'PostgreSQL' if database.DATABASE_URL else 'SQLite'}, {args.rows} rows")
+    baseline = results[0][1]
+    for label, ms in results:
+        print(f"  {label:<12} {ms:9.1f} ms   {args.rows / ms * 1000:10.0f} rows/s   {baseline / ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Concurrency Check
+Runs N clients in parallel threads against the app (the test client, on a
+scratch SQLite database), as gthread workers serve it, then checks that
+nothing was lost:
+
+  - every request succeeded
+  - stock quantities equal the starting stock plus what was added, minus
+    what was billed and removed (no lost updates)
+  - one bill, one bill item and the stock movements per request
+  - the connection pool was reused rather than opening one per request
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python bench_concurrency.py [--clients 32] [--rounds 5]
+"""
+
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+import tempfile
+import threading
+import contextlib
+import io
+
+ROUTES = ['/api/products', '/api/bills', '/api/supplier-bills', '/api/stock-report']
+START_STOCK = 100000
+
+
+def client(app_module):
+    test_client = app_module.app.test_client()
+    test_client.post('/login', data={'username': 'admin', 'password': 'saibaba99'})
+    return test_client
+
+
+def run_client(app_module, rounds, barrier, errors, latencies):
+    test_client = client(app_module)
+    barrier.wait()
+    for i in range(rounds):
+        requests = [
+            ('POST', '/api/billing/create', {'customer_name': f'Client {threading.get_ident()}', 'payment_method': 'CASH',
+                                             'items': [{'product_id': 1, 'quantity': 1}]}, 201),
+            ('POST', '/api/stock/add', {'product_id': 2, 'quantity': 2}, 200),
+            ('POST', '/api/stock/remove', {'product_id': 1, 'quantity': 1}, 200),
+        ] + [('GET', route, None, 200) for route in ROUTES]
+        for method, route, body, expected in requests:
+            start = time.perf_counter()
+            response = test_client.open(route, method=method, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                errors.append(f"{method} {route}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel clients correctness check')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    # Keep the jobs lock, backups and live events out of the repo
+    os.environ.setdefault('JOBS_ENABLED', '0')
+    os.environ.setdefault('EVENTS_DIR', os.path.join(scratch, 'events'))
+    os.environ.setdefault('BACKUP_DIR', os.path.join(scratch, 'backups'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import database
+        database.DB_PATH = os.path.join(scratch, 'concurrency.db')
+        import app as app_module
+        import metrics
+        from products import ProductManager
+        app_module.create_app()
+        products = ProductManager()
+        products.add_product('Bench Bulb', 'Lighting', 100, START_STOCK, 5)
+        products.add_product('Bench Wire', 'Wiring', 50, 0, 5)
+        products.close()
+
+    # Waiting on SQLite's write lock makes writes "slow" by design here
+    logging.getLogger('slow_query').setLevel(logging.ERROR)
+    errors, latencies = [], []
+    barrier = threading.Barrier(args.clients)
+    threads = [threading.Thread(target=run_client, args=(app_module, args.rounds, barrier, errors, latencies))
+               for _ in range(args.clients)]
+    # The routes print a line per bill and stock change
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    writes = args.clients * args.rounds
+    connection = sqlite3.connect(database.DB_PATH)
+    count = lambda query: connection.execute(query).fetchone()[0]
+    checks = [
+        ('failed requests', len(errors), 0),
+        ('Bench Bulb stock', count('SELECT quantity FROM products WHERE id = 1'), START_STOCK - 2 * writes),
+        ('Bench Wire stock', count('SELECT quantity FROM products WHERE id = 2'), 2 * writes),
+        ('bills', count('SELECT COUNT(*) FROM transactions'), writes),
+        ('bill items', count('SELECT COUNT(*) FROM transaction_items'), writes),
+        # Plus Bench Bulb's opening stock
+        ('stock movements', count('SELECT COUNT(*) FROM stock_movements'), 3 * writes + 1),
+    ]
+    connection.close()
+
+    latencies.sort()
+    print(f"{args.clients} clients x {args.rounds} rounds: {len(latencies)} requests in {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:.0f} req/s, p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms)")
+    pool = {result: value for (cache, result), value in metrics.CACHE_REQUESTS.values.items() if cache == 'db_pool'}
+    print(f"connection pool: {pool.get('hit', 0)} reused, {pool.get('miss', 0)} opened")
+
+    failed = False
+    for label, actual, expected in checks:
+        ok = actual == expected
+        failed = failed or not ok
+        print(f"  {'✓' if ok else '✗'} {label}: {actual} (expected {expected})")
+    for error in errors[:5]:
+        print(f"    {error}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
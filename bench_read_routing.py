@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Read Routing Benchmark
+Measures create_bill (checkout) latency while other processes hammer the
+heavy report queries, on a dataset from benchmark.py.
+
+Runs three phases, each on a fresh copy of the same database:
+  journal   - rollback journal, every read on the primary connection (old behaviour)
+  wal       - WAL mode, every read on the primary connection
+  routed    - WAL mode, reports on a read-only (mode=ro) connection
+
+Usage:
+    python bench_read_routing.py [--readers 4] [--seconds 8] [--years 1]
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+import io
+import logging
+import multiprocessing
+from argparse import Namespace
+
+import database
+import benchmark
+from bench_backup import percentile
+
+# The report queries are slow on purpose here
+logging.getLogger('slow_query').setLevel(logging.ERROR)
+
+PHASES = [
+    ('journal', {'SQLITE_WAL': False, 'DB_READ_ROUTING': False}),
+    ('wal', {'SQLITE_WAL': True, 'DB_READ_ROUTING': False}),
+    ('routed', {'SQLITE_WAL': True, 'DB_READ_ROUTING': True}),
+]
+
+
+def configure(db_path, settings):
+    database.DB_PATH = db_path
+    for name, value in settings.items():
+        setattr(database, name, value)
+
+
+def report_loop(db_path, settings, stop, counter):
+    """One reader process: the report routes, over and over"""
+    from billing import BillingManager
+    from stock import StockManager
+    from supplier_bills import SupplierBillManager
+    configure(db_path, settings)
+    with contextlib.redirect_stdout(io.StringIO()):
+        while not stop.is_set():
+            # Fresh managers per round, like one HTTP request
+            billing, stock, suppliers = BillingManager(), StockManager(), SupplierBillManager()
+            stock.get_stock_report()
+            billing.get_credit_bills()
+            billing.get_sales_summary()
+            suppliers.get_supplier_groups()
+            for manager in (billing, stock, suppliers):
+                manager.close()
+            with counter.get_lock():
+                counter.value += 1
+
+
+def run_phase(name, source, workdir, settings, readers, seconds, products):
+    from billing import BillingManager
+
+    db_path = os.path.join(workdir, f"{name}.db")
+    shutil.copyfile(source, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA journal_mode={'WAL' if settings['SQLITE_WAL'] else 'DELETE'}")
+    conn.close()
+    configure(db_path, settings)
+
+    stop = multiprocessing.Event()
+    counter = multiprocessing.Value('i', 0)
+    procs = [multiprocessing.Process(target=report_loop, args=(db_path, settings, stop, counter))
+             for _ in range(readers)]
+    for proc in procs:
+        proc.start()
+    time.sleep(0.5)
+
+    latencies, failed = [], 0
+    deadline = time.time() + seconds
+    rng = random.Random(42)
+    while time.time() < deadline:
+        items = [(rng.randint(1, products), rng.randint(1, 3)) for _ in range(rng.randint(1, 5))]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            # A new manager per checkout, like the app's per-request managers
+            billing = BillingManager()
+            bill_number = billing.create_bill('Walk-in', items, 'CASH')
+            if bill_number:
+                billing.get_bill(bill_number, use_primary=True)
+            else:
+                failed += 1
+            billing.close()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    stop.set()
+    for proc in procs:
+        proc.join()
+
+    print(f"{name:<8} bills={len(latencies):<5} failed={failed:<3} p50={percentile(latencies, 50):7.2f}ms "
+          f"p95={percentile(latencies, 95):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+          f"max={max(latencies) if latencies else 0:8.2f}ms report_rounds={counter.value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4, help='Report-hammering processes')
+    parser.add_argument('--seconds', type=float, default=8)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--years', type=float, default=1)
+    args = parser.parse_args()
+
+    if database.DATABASE_URL:
+        print("This benchmark uses a scratch SQLite database; unset DATABASE_URL")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='bench_read_routing_')
+    source = os.path.join(workdir, 'source.db')
+    with contextlib.redirect_stdout(io.StringIO()):
+        benchmark.generate(Namespace(db=source, products=args.products, years=args.years, bills_per_day=40,
+                                     credit_customers=40, supplier_bills=200, expenses=500, seed=42))
+    conn = sqlite3.connect(source)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+    print(f"Scratch database: {source} ({os.path.getsize(source) // 1024} KB), {args.readers} report processes")
+
+    for name, settings in PHASES:
+        run_phase(name, source, workdir, settings, args.readers, args.seconds, args.products)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
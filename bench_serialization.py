@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark
+Measures the cost of turning query rows into a JSON body, per 10k rows, for
+the /api/products and /api/stock-report row shapes (synthetic rows, no
+database).
+
+  hand-built + jsonify  - positional dicts (product[0], ...) and Flask's json
+  mapper + json         - the compiled RowMapper and the standard json module
+  mapper + orjson       - the compiled RowMapper and orjson (if installed)
+  streamed              - iter_array() in STREAM_CHUNK_ROWS chunks, joined
+
+Usage:
+    python bench_serialization.py [--rows 10000] [--repeat 20]
+"""
+
+import io
+import json
+import time
+import argparse
+import contextlib
+
+import serializers
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+
+
+def product_rows(count):
+    return [(i, f"Product {i}", f"Category {i % 12}", 10.0 + i % 500, i % 40, 5, '2026-01-01 10:00:00')
+            for i in range(1, count + 1)]
+
+
+def stock_rows(count):
+    return [(i, f"Product {i}", f"Category {i % 12}", i % 40, 10.0 + i % 500, 5, (i % 40) * (10.0 + i % 500))
+            for i in range(1, count + 1)]
+
+
+# The dict building the routes did before the row mappers
+def product_by_position(product):
+    return {
+        'id': product[0],
+        'name': product[1],
+        'category': product[2],
+        'unit_price': product[3],
+        'quantity': product[4],
+        'minimum_stock': product[5],
+        'status': 'LOW' if product[4] <= product[5] else 'OK'
+    }
+
+
+def stock_item_by_position(item):
+    return {
+        'id': item[0],
+        'name': item[1],
+        'category': item[2],
+        'quantity': item[3],
+        'unit_price': item[4],
+        'min_stock': item[5],
+        'total_value': item[6],
+        'status': 'LOW' if item[3] <= item[5] else 'OK'
+    }
+
+
+def std_dumps(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def timed(func, repeat):
+    """Best of repeat runs, in ms"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_shape(name, rows, by_position, mapper, repeat):
+    flask_app = app_module.app
+    per_10k = 10000 / len(rows)
+    cases = [
+        ('hand-built + jsonify', lambda: flask_app.json.dumps([by_position(row) for row in rows]).encode()),
+        ('mapper + json', lambda: std_dumps(mapper.map(rows))),
+    ]
+    if serializers.orjson is not None:
+        cases.append(('mapper + orjson', lambda: serializers.orjson.dumps(mapper.map(rows))))
+    cases.append(('streamed', lambda: b''.join(serializers.iter_array(rows, mapper))))
+
+    # Every variant has to produce the same JSON
+    expected = json.loads(cases[0][1]())
+    for label, func in cases[1:]:
+        assert json.loads(func()) == expected, label
+
+    print(f"\n{name} ({len(rows)} rows, ms per 10k rows)")
+    baseline = None
+    for label, func in cases:
+        ms = timed(func, repeat) * per_10k
+        baseline = baseline or ms
+        print(f"  {label:<22} {ms:8.2f} ms   {baseline / ms:5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row serialization micro-benchmark')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"JSON backend: {'orjson' if serializers.orjson else 'json'}")
+    bench_shape('/api/products', product_rows(args.rows), product_by_position,
+                app_module.product_to_dict, args.repeat)
+    bench_shape('/api/stock-report items', stock_rows(args.rows), stock_item_by_position,
+                app_module.stock_item_to_dict, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
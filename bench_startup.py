@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures what a worker costs to start and to keep, as gunicorn runs it, on a
+scratch SQLite database (Linux only: memory comes from /proc).
+
+  import      - time to import app.py, then create_app(), in fresh interpreters
+  no preload  - N workers forked from a bare master, each importing the app
+                itself (gunicorn without preload_app)
+  preload     - the master runs create_app() and gc.freeze(), then forks N
+                workers (gunicorn.conf.py)
+
+Each worker serves the same requests through the test client, then reports
+its RSS, PSS (shared pages split between the processes sharing them) and
+USS (pages only it uses). PSS is what adds up to the machine's real usage.
+
+Usage:
+    python bench_startup.py [--workers 3] [--requests 200] [--repeat 5]
+"""
+
+import os
+import gc
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROUTES = ['/api/products', '/api/stock-report', '/api/bills', '/api/dashboard', '/api/reports/low-stock', '/']
+
+IMPORT_SCRIPT = '''
+import sys, time, contextlib, io
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import database
+    database.DB_PATH = sys.argv[1]
+    import app
+    imported = time.perf_counter()
+    app.create_app()
+print(imported - started, time.perf_counter() - imported)
+'''
+
+
+def memory_kb():
+    """(rss, pss, uss) of this process in kB"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    uss = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields.get('Rss', 0), fields.get('Pss', 0), uss
+
+
+def bench_import(repeat, db_path):
+    imports, inits = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, db_path], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        imported, initialised = map(float, output.stdout.split()[-2:])
+        imports.append(imported * 1000)
+        inits.append(initialised * 1000)
+    return statistics.median(imports), statistics.median(inits)
+
+
+def seed(db_path):
+    import database
+    import contextlib
+    import io
+    database.DB_PATH = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = database.Database()
+        db.execute_many('INSERT INTO products (name, category, unit_price, quantity, minimum_stock) VALUES (?, ?, ?, ?, ?)',
+                        [(f"Product {i}", f"Category {i % 12}", 10.0 + i, i % 40, 5) for i in range(500)])
+        db.close()
+        database.reset_schema_cache()
+
+
+def serve(requests):
+    """Worker body: load the app if the master didn't, serve requests, report memory"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+        app_module.create_app()
+        client = app_module.app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'saibaba99'})
+        for i in range(requests):
+            client.get(ROUTES[i % len(ROUTES)], headers={'Accept-Encoding': 'gzip'})
+    return memory_kb()
+
+
+def bench_workers(workers, requests, preload, db_path):
+    """Fork workers (after create_app() when preload) and return their memory, in kB"""
+    import database
+    database.DB_PATH = db_path
+    if preload:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app as app_module
+            app_module.create_app()
+        gc.collect()
+        gc.freeze()
+
+    children = []
+    for _ in range(workers):
+        report_r, report_w = os.pipe()
+        release_r, release_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(report_r)
+            os.close(release_w)
+            stats = serve(requests)
+            os.write(report_w, json.dumps(stats).encode())
+            os.close(report_w)
+            # Stay alive until every worker has reported, so PSS splits the shared pages
+            os.read(release_r, 1)
+            os._exit(0)
+        os.close(report_w)
+        os.close(release_r)
+        children.append((pid, report_r, release_w))
+
+    stats = []
+    for pid, report_r, release_w in children:
+        stats.append(json.loads(os.read(report_r, 4096)))
+    master = memory_kb()
+    for pid, report_r, release_w in children:
+        os.write(release_w, b'x')
+        os.waitpid(pid, 0)
+    return stats, master
+
+
+def run_mode(args, preload):
+    """Run one mode in a child process, so the modes don't share a master"""
+    report_r, report_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(report_r)
+        result = bench_workers(args.workers, args.requests, preload, args.db)
+        os.write(report_w, json.dumps(result).encode())
+        os._exit(0)
+    os.close(report_w)
+    data = b''
+    while chunk := os.read(report_r, 65536):
+        data += chunk
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker startup time and memory benchmark')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    # Keep the jobs lock, backups and live events out of the repo
+    os.environ.setdefault('JOBS_ENABLED', '0')
+    os.environ.setdefault('EVENTS_DIR', os.path.join(scratch, 'events'))
+    os.environ.setdefault('BACKUP_DIR', os.path.join(scratch, 'backups'))
+    args.db = os.path.join(scratch, 'bench.db')
+
+    import_ms, init_ms = bench_import(args.repeat, args.db)
+    print(f"import app: {import_ms:.0f} ms, create_app(): {init_ms:.0f} ms (median of {args.repeat})")
+
+    seed(args.db)
+    print(f"\n{args.workers} workers, {args.requests} requests each (kB per worker)")
+    print(f"  {'mode':<12} {'RSS':>8} {'PSS':>8} {'USS':>8}   total PSS incl. master")
+    for label, preload in (('no preload', False), ('preload', True)):
+        stats, master = run_mode(args, preload)
+        rss, pss, uss = (statistics.mean(s[i] for s in stats) for i in range(3))
+        total = sum(s[1] for s in stats) + master[1]
+        print(f"  {label:<12} {rss:8.0f} {pss:8.0f} {uss:8.0f}   {total / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
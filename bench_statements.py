@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Statement Cache Benchmark
+Measures per-statement overhead of the create_bill statements with and without
+the statement cache.
+
+  translation - str.replace('?', '%s') on every call vs the cached translation
+  sqlite      - cached_statements=0 vs SQLITE_CACHED_STATEMENTS on a scratch file
+  postgres    - plain execute vs server-side prepared statements
+                (only when DATABASE_URL is set; uses TEMP tables)
+
+Usage:
+    python bench_statements.py [--bills 2000] [--items 5]
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+import io
+
+import database
+
+# The statements create_bill issues, in order, for one line item
+BILL_STATEMENTS = [
+    'SELECT id, name, unit_price, quantity FROM products WHERE id = ?',
+    '''
+            INSERT INTO transactions (customer_name, total_amount, payment_method, bill_number, cash_amount, upi_amount, bill_type, is_credit, is_replacement, received_amount, credit_status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+    'SELECT id FROM transactions WHERE bill_number = ?',
+    '''
+                INSERT INTO transaction_items (transaction_id, product_id, product_name, quantity, unit_price, total_price)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''',
+    '''
+                    UPDATE products SET quantity = quantity - ? WHERE id = ?
+                ''',
+    '''
+                    INSERT INTO stock_movements (product_id, movement_type, quantity, reference_id)
+                    VALUES (?, ?, ?, ?)
+                ''',
+]
+
+
+def bill_statements(bill_no, items):
+    """(sql, params) pairs for one bill, matching BillingManager.create_bill"""
+    product_select, txn_insert, txn_select, item_insert, stock_update, movement_insert = BILL_STATEMENTS
+    product_ids = [1 + (bill_no * 7 + i) % 50 for i in range(items)]
+    bill_number = f"BENCH-{bill_no}"
+    steps = [(product_select, (pid,)) for pid in product_ids]
+    steps.append((txn_insert, ('Walk-in', 100.0 * items, 'CASH', bill_number, 100.0 * items, 0,
+                               'REGULAR', 0, 0, 100.0 * items, 'PAID', '2026-01-01 10:00:00')))
+    steps.append((txn_select, (bill_number,)))
+    for pid in product_ids:
+        steps.append((item_insert, (bill_no, pid, f"Product {pid}", 1, 100.0, 100.0)))
+        steps.append((stock_update, (1, pid)))
+        steps.append((movement_insert, (pid, 'SALE', 1, bill_no)))
+    return steps
+
+
+def bench_translation(rounds):
+    queries = [q for q in BILL_STATEMENTS] * rounds
+    start = time.perf_counter()
+    for query in queries:
+        query.replace('?', '%s')
+    plain = time.perf_counter() - start
+    database.translate_placeholders.cache_clear()
+    start = time.perf_counter()
+    for query in queries:
+        database.translate_placeholders(query)
+    cached = time.perf_counter() - start
+    return plain / len(queries) * 1e6, cached / len(queries) * 1e6
+
+
+def bench_sqlite(bills, items, cached_statements):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'bench.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.Database().close()
+        conn = sqlite3.connect(database.DB_PATH, cached_statements=cached_statements)
+        conn.executemany('INSERT INTO products (name, category, unit_price, quantity) VALUES (?, ?, ?, ?)',
+                         [(f"Product {i}", 'Bench', 100.0, 10 ** 9) for i in range(1, 51)])
+        conn.commit()
+        cur = conn.cursor()
+        statements = 0
+        start = time.perf_counter()
+        for bill_no in range(bills):
+            for query, params in bill_statements(bill_no, items):
+                cur.execute(query, params)
+                statements += 1
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        conn.close()
+    return elapsed / statements * 1e6
+
+
+def bench_postgres(bills, items, threshold):
+    database.PG_PREPARE_THRESHOLD = threshold
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = database.Database()
+    cursor = db.connection.cursor()
+    for table in ('stock_movements', 'transaction_items', 'transactions', 'products'):
+        cursor.execute(f"CREATE TEMP TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS)")
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS pg_temp.bench_ids")
+    for table in ('stock_movements', 'transaction_items', 'transactions', 'products'):
+        cursor.execute(f"ALTER TABLE pg_temp.{table} ALTER COLUMN id SET DEFAULT nextval('pg_temp.bench_ids')")
+    cursor.executemany('INSERT INTO products (name, category, unit_price, quantity) VALUES (%s, %s, %s, %s)',
+                       [(f"Product {i}", 'Bench', 100.0, 10 ** 9) for i in range(1, 51)])
+    statements = 0
+    start = time.perf_counter()
+    for bill_no in range(bills):
+        for query, params in bill_statements(bill_no, items):
+            run = db._run(query, params)
+            if run.description:
+                run.fetchall()
+            run.close()
+            statements += 1
+    elapsed = time.perf_counter() - start
+    db.connection.rollback()
+    # Prepared statements outlive the rollback but point at the dropped temp tables:
+    # the connection goes back to the pool, so forget them
+    cursor.execute('DEALLOCATE ALL')
+    cursor.close()
+    db._primary.statements = ({}, set())
+    db.close()
+    return elapsed / statements * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statement cache micro-benchmark')
+    parser.add_argument('--bills', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=5)
+    args = parser.parse_args()
+
+    plain, cached = bench_translation(args.bills * 10)
+    print(f"Placeholder translation: {plain:.3f} us -> {cached:.3f} us per statement")
+
+    if database.DATABASE_URL:
+        threshold = database.PG_PREPARE_THRESHOLD or 2
+        plain = bench_postgres(args.bills, args.items, 0)
+        prepared = bench_postgres(args.bills, args.items, threshold)
+        print(f"PostgreSQL execute:      {plain:.1f} us -> {prepared:.1f} us per statement (prepared)")
+    else:
+        uncached = bench_sqlite(args.bills, args.items, 0)
+        cached = bench_sqlite(args.bills, args.items, database.SQLITE_CACHED_STATEMENTS)
+        print(f"SQLite execute:          {uncached:.1f} us -> {cached:.1f} us per statement "
+              f"(cached_statements 0 -> {database.SQLITE_CACHED_STATEMENTS})")
+        print("Set DATABASE_URL to measure server-side prepared statements")
+
+
+if __name__ == '__main__':
+    main()
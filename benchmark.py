@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Load Generation & Benchmark Suite
+Builds a realistic scratch database and measures endpoint latency against it.
+
+    # 1. Generate a dataset (products, years of bills, credit customers,
+    #    supplier bills, expenses) into a scratch SQLite file
+    python benchmark.py generate --db bench.db --products 1000 --years 1
+
+    # 2. Drive the app with concurrent clients and save the results
+    python benchmark.py run --db bench.db --concurrency 8 --output results.json
+    python benchmark.py run --url http://localhost:8000 --output results.json   # live gunicorn
+
+    # 3. Catch regressions between versions
+    python benchmark.py compare baseline.json results.json --threshold 20
+
+`run` without --url uses the Flask test client in-process against --db.
+With --url, the server must already be running on that database.
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import random
+import sqlite3
+import argparse
+import threading
+import subprocess
+import contextlib
+import io
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+CATEGORIES = [
+    ('Bulbs', 60, 450), ('Tube Lights', 150, 900), ('Switches', 25, 250), ('Sockets', 40, 300),
+    ('Wiring', 10, 120), ('Breakers', 180, 2500), ('Fans', 1200, 6500), ('Conduit', 15, 90),
+    ('Accessories', 5, 150), ('Distribution Boards', 800, 5000), ('Cables', 300, 4000), ('Tools', 100, 1500)
+]
+FIRST_NAMES = ['Rajesh', 'Priya', 'Arjun', 'Lakshmi', 'Suresh', 'Anitha', 'Ravi', 'Kavya', 'Venkat', 'Srinivas',
+               'Padma', 'Mahesh', 'Divya', 'Ramesh', 'Swathi', 'Naresh', 'Bhavani', 'Kiran', 'Sai', 'Gopal']
+SUPPLIERS = ['Havells Distributor', 'Anchor Agencies', 'Polycab Traders', 'Finolex Depot', 'Crompton Wholesale',
+             'Legrand Supplies', 'Syska Dealers', 'Orient Electric Agency']
+EXPENSE_CATEGORIES = [('Tea/Snacks', 20, 200), ('Transport', 100, 1500), ('Electricity', 1500, 6000),
+                      ('Salary', 8000, 20000), ('Rent', 10000, 25000), ('Misc', 50, 1000)]
+
+# (name, method, path, weight) - path may contain {product_id} / {bill_number}
+SCENARIO = [
+    ('create_bill', 'POST', '/api/billing/create', 30),
+    ('products', 'GET', '/api/products', 15),
+    ('bills', 'GET', '/api/bills?limit=20', 10),
+    ('bill_detail', 'GET', '/api/bills/{bill_number}', 10),
+    ('stock_report', 'GET', '/api/stock-report', 5),
+    ('stock_history', 'GET', '/api/stock/history/{product_id}', 5),
+    ('dashboard', 'GET', '/api/dashboard', 5),
+    ('sales_summary', 'GET', '/api/reports/sales-summary', 4),
+    ('low_stock', 'GET', '/api/reports/low-stock', 4),
+    ('daily_sales', 'GET', '/api/sales/daily', 4),
+    ('credit_bills', 'GET', '/api/credit-bills', 4),
+    ('supplier_groups', 'GET', '/api/supplier-bills?aggregate=1', 2),
+    ('expenses', 'GET', '/api/expenses', 2),
+]
+
+
+# ============ DATASET GENERATION ============
+
+def _daily_bill_count(day, bills_per_day, rng):
+    """Busier on weekends and in the Dussehra/Diwali season"""
+    factor = 1.3 if day.weekday() >= 5 else 1.0
+    if day.month in (10, 11):
+        factor *= 1.8
+    return max(0, int(rng.gauss(bills_per_day * factor, bills_per_day * factor * 0.25)))
+
+
+def _item_count(rng):
+    """Most bills have 1-3 lines, a few are long contractor bills"""
+    return min(25, 1 + int(rng.expovariate(0.45)))
+
+
+def generate(args):
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    database.DB_PATH = args.db
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.Database().close()
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(args.db)
+    cur = conn.cursor()
+    start = time.perf_counter()
+
+    # Products with Zipf-like popularity: a few items sell most
+    products = []
+    for i in range(args.products):
+        category, low, high = CATEGORIES[i % len(CATEGORIES)]
+        price = round(math.exp(rng.uniform(math.log(low), math.log(high))), 2)
+        products.append((f"{category} Item {i + 1:05d}", category, price, rng.randint(0, 400), rng.choice([5, 10, 20])))
+    cur.executemany('INSERT INTO products (name, category, unit_price, quantity, minimum_stock) VALUES (?, ?, ?, ?, ?)',
+                    products)
+    weights = [1.0 / (rank + 1) ** 0.9 for rank in range(args.products)]
+    product_ids = list(range(1, args.products + 1))
+    rng.shuffle(product_ids)
+
+    credit_customers = [f"{rng.choice(FIRST_NAMES)} Contractors {i + 1}" for i in range(args.credit_customers)]
+
+    end_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    day = end_day - timedelta(days=int(args.years * 365))
+    txn_id = item_id = 0
+    transactions, items, movements, payments = [], [], [], []
+
+    def flush():
+        cur.executemany('''INSERT INTO transactions (id, customer_name, total_amount, payment_method, cash_amount, upi_amount,
+                           bill_number, bill_type, is_credit, is_replacement, received_amount, credit_status, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', transactions)
+        cur.executemany('''INSERT INTO transaction_items (id, transaction_id, product_id, product_name, quantity, unit_price, total_price)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''', items)
+        cur.executemany('''INSERT INTO stock_movements (product_id, movement_type, quantity, reference_id, notes, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?)''', movements)
+        cur.executemany('''INSERT INTO credit_bill_payments (transaction_id, payment_amount, payment_date, notes)
+                           VALUES (?, ?, ?, ?)''', payments)
+        for batch in (transactions, items, movements, payments):
+            batch.clear()
+
+    while day < end_day:
+        for _ in range(_daily_bill_count(day, args.bills_per_day, rng)):
+            txn_id += 1
+            created = day + timedelta(hours=rng.uniform(9, 21))
+            created_str = created.strftime('%Y-%m-%d %H:%M:%S')
+            roll = rng.random()
+            bill_type = 'CREDIT' if roll < 0.06 and credit_customers else 'REPLACEMENT' if roll < 0.07 else 'REGULAR'
+            customer = rng.choice(credit_customers) if bill_type == 'CREDIT' else f"{rng.choice(FIRST_NAMES)} {rng.randint(1, 999)}"
+
+            total = 0.0
+            for pid in rng.choices(product_ids, weights=weights, k=_item_count(rng)):
+                item_id += 1
+                qty = 1 + int(rng.expovariate(0.6))
+                price = products[pid - 1][2]
+                items.append((item_id, txn_id, pid, products[pid - 1][0], qty, price, round(price * qty, 2)))
+                movements.append((pid, 'SALE', qty, txn_id, None, created_str))
+                total += price * qty
+            total = round(total, 2)
+
+            method = rng.choices(['CASH', 'UPI', 'SPLIT'], weights=[55, 40, 5])[0]
+            cash = total if method == 'CASH' else round(total / 2, 2) if method == 'SPLIT' else None
+            upi = total if method == 'UPI' else round(total - cash, 2) if method == 'SPLIT' else None
+            received, status = total, 'PAID'
+            if bill_type == 'CREDIT':
+                paid_fraction = rng.choice([0, 0, 0.5, 1])
+                received = round(total * paid_fraction, 2)
+                status = 'PAID' if paid_fraction == 1 else 'PARTIAL' if paid_fraction else 'UNPAID'
+                if received:
+                    payments.append((txn_id, received, (created + timedelta(days=rng.randint(1, 30))).strftime('%Y-%m-%d'), 'bench'))
+            transactions.append((txn_id, customer, total, method, cash, upi, f"BILL-{created.strftime('%Y%m%d%H%M%S')}-{txn_id}",
+                                 bill_type, int(bill_type == 'CREDIT'), int(bill_type == 'REPLACEMENT'), received, status, created_str))
+
+        # Weekly restock of popular products
+        if day.weekday() == 0:
+            for pid in rng.choices(product_ids[:max(1, args.products // 5)], k=max(1, args.products // 20)):
+                movements.append((pid, 'ADD', rng.randint(10, 100), None, 'Restock', day.strftime('%Y-%m-%d 10:00:00')))
+        if len(items) > 50000:
+            flush()
+        day += timedelta(days=1)
+    flush()
+
+    supplier_rows = []
+    for i in range(args.supplier_bills):
+        bill_date = end_day - timedelta(days=rng.randint(0, int(args.years * 365)))
+        total = round(rng.uniform(2000, 150000), 2)
+        paid = rng.choice([0, total, round(total * rng.uniform(0.1, 0.9), 2)])
+        status = 'PAID' if paid >= total else 'PARTIAL' if paid else 'UNPAID'
+        supplier_rows.append((rng.choice(SUPPLIERS), f"SUP-{i + 1:06d}", bill_date.strftime('%Y-%m-%d'), total, paid, status,
+                              'Stock purchase', (bill_date + timedelta(days=30)).strftime('%Y-%m-%d')))
+    cur.executemany('''INSERT INTO supplier_bills (supplier_name, bill_number, bill_date, total_amount, paid_amount, status,
+                       description, due_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', supplier_rows)
+    cur.execute('''INSERT INTO supplier_bill_payments (bill_id, payment_amount, payment_date, notes)
+                   SELECT id, paid_amount, bill_date, 'bench' FROM supplier_bills WHERE paid_amount > 0''')
+
+    expense_rows = []
+    for _ in range(args.expenses):
+        category, low, high = rng.choice(EXPENSE_CATEGORIES)
+        expense_day = end_day - timedelta(days=rng.randint(0, int(args.years * 365)))
+        expense_rows.append((category, f"{category} expense", round(rng.uniform(low, high), 2), expense_day.strftime('%Y-%m-%d')))
+    cur.executemany('INSERT INTO expenses (category, description, amount, expense_date) VALUES (?, ?, ?, ?)', expense_rows)
+
+    # Make sure the benchmark can keep selling
+    cur.execute('UPDATE products SET quantity = quantity + 100000')
+    conn.commit()
+    counts = {table: cur.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('products', 'transactions', 'transaction_items', 'stock_movements',
+                            'credit_bill_payments', 'supplier_bills', 'expenses')}
+    conn.close()
+
+    print(f"✓ Dataset generated in {time.perf_counter() - start:.1f}s: {args.db} ({os.path.getsize(args.db) // 1024} KB)")
+    for table, count in counts.items():
+        print(f"  {table:<22} {count:>10}")
+    with open(args.db + '.meta.json', 'w') as f:
+        json.dump({'seed': args.seed, 'products': args.products, 'years': args.years,
+                   'bills_per_day': args.bills_per_day, 'credit_customers': args.credit_customers,
+                   'supplier_bills': args.supplier_bills, 'expenses': args.expenses, 'counts': counts}, f, indent=2)
+
+
+# ============ LOAD DRIVERS ============
+
+class TestClientDriver:
+    """Drives the Flask app in-process; one logged-in test client per thread"""
+
+    def __init__(self, db_path):
+        os.environ['JOBS_ENABLED'] = '0'
+        database.DB_PATH = db_path
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app as app_module
+        self.app = app_module.app
+        self._local = threading.local()
+        self._patch_bill_numbers()
+
+    @staticmethod
+    def _patch_bill_numbers():
+        # Bill numbers have one-second resolution; give concurrent bills a suffix
+        from billing import BillingManager
+        original = BillingManager._generate_bill_number
+        counter = iter(range(1, 1 << 62))
+        lock = threading.Lock()
+
+        def unique_bill_number(self):
+            with lock:
+                return f"{original(self)}-B{next(counter)}"
+        BillingManager._generate_bill_number = unique_bill_number
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self.app.test_client()
+            client.post('/login', data={'username': 'admin', 'password': 'saibaba99'})
+            self._local.client = client
+        return client
+
+    def quiet(self):
+        # The managers print on every call. Swap stdout once for the whole run:
+        # per-request redirect_stdout from several threads can leave it swapped.
+        return contextlib.redirect_stdout(io.StringIO())
+
+    def request(self, method, path, body=None):
+        response = self._client().open(path, method=method, json=body)
+        return response.status_code, response.headers, response.get_data()
+
+
+class HttpDriver:
+    """Drives a running server over HTTP with a session cookie per thread"""
+
+    def __init__(self, base_url):
+        import urllib.request
+        import http.cookiejar
+        self.base_url = base_url.rstrip('/')
+        self._urllib = urllib.request
+        self._cookiejar = http.cookiejar
+        self._local = threading.local()
+
+    def _opener(self):
+        opener = getattr(self._local, 'opener', None)
+        if opener is None:
+            import urllib.parse
+            opener = self._urllib.build_opener(self._urllib.HTTPCookieProcessor(self._cookiejar.CookieJar()))
+            form = urllib.parse.urlencode({'username': 'admin', 'password': 'saibaba99'}).encode()
+            opener.open(self.base_url + '/login', data=form, timeout=30).read()
+            self._local.opener = opener
+        return opener
+
+    def request(self, method, path, body=None):
+        import urllib.error
+        data = json.dumps(body).encode() if body is not None else None
+        req = self._urllib.Request(self.base_url + path, data=data, method=method,
+                                   headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with self._opener().open(req, timeout=60) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def quiet(self):
+        return contextlib.nullcontext()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _db_ms(headers):
+    timing = headers.get('Server-Timing') or ''
+    for part in timing.split(','):
+        part = part.strip()
+        if part.startswith('db;dur='):
+            return float(part.split(';')[1][4:])
+    return None
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    if args.url:
+        driver = HttpDriver(args.url)
+    else:
+        if not args.db or not os.path.exists(args.db):
+            print("✗ --db must point to a generated dataset (python benchmark.py generate)")
+            sys.exit(1)
+        driver = TestClientDriver(args.db)
+
+    with driver.quiet():
+        samples, wall = _drive(driver, args)
+    _report(args, samples, wall)
+
+
+def _drive(driver, args):
+    """Build the request plan and run it; returns (samples per endpoint, wall seconds)"""
+    rng = random.Random(args.seed)
+    status, _, body = driver.request('GET', '/api/products')
+    products = [p for p in json.loads(body) if p['quantity'] > 10] if status == 200 else []
+    status, _, body = driver.request('GET', '/api/bills?limit=50')
+    bill_numbers = [b['bill_number'] for b in json.loads(body)] if status == 200 else []
+    if not products or not bill_numbers:
+        print("✗ The target has no products or bills; generate a dataset first", file=sys.stderr)
+        sys.exit(1)
+
+    names = [s[0] for s in SCENARIO]
+    weights = [s[3] for s in SCENARIO]
+    plan = []
+    for name in rng.choices(names, weights=weights, k=args.requests):
+        scenario = next(s for s in SCENARIO if s[0] == name)
+        body = None
+        path = scenario[2]
+        if name == 'create_bill':
+            lines = rng.sample(products, min(len(products), 1 + int(rng.expovariate(0.5))))
+            body = {'customer_name': f"Bench {rng.randint(1, 10**6)}", 'payment_method': 'CASH',
+                    'items': [{'product_id': p['id'], 'quantity': rng.randint(1, 3)} for p in lines]}
+        path = path.replace('{product_id}', str(rng.choice(products)['id']))
+        path = path.replace('{bill_number}', rng.choice(bill_numbers))
+        plan.append((name, scenario[1], path, body))
+
+    # Warm up every endpoint once so first-request costs don't skew p99
+    for name, method, path, body in {p[0]: p for p in plan}.values():
+        if method == 'GET':
+            driver.request(method, path, body)
+
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def execute(step):
+        name, method, path, body = step
+        start = time.perf_counter()
+        try:
+            status, headers, _ = driver.request(method, path, body)
+        except Exception:
+            status, headers = 0, {}
+        elapsed = (time.perf_counter() - start) * 1000
+        queries = headers.get('X-Query-Count')
+        with lock:
+            samples[name].append((elapsed, status, int(queries) if queries else None, _db_ms(headers)))
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(execute, plan))
+    wall = time.perf_counter() - wall_start
+    return samples, wall
+
+
+def _report(args, samples, wall):
+    names = [s[0] for s in SCENARIO]
+    results = {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'mode': 'http' if args.url else 'test_client',
+            'target': args.url or args.db,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'seed': args.seed,
+            'wall_seconds': round(wall, 3),
+            'throughput_rps': round(args.requests / wall, 1) if wall else None
+        },
+        'endpoints': {}
+    }
+    if not args.url and os.path.exists(args.db + '.meta.json'):
+        with open(args.db + '.meta.json') as f:
+            results['meta']['dataset'] = json.load(f)
+
+    print(f"\n{'Endpoint':<18} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8} {'db ms':>8}")
+    print('-' * 86)
+    for name in names:
+        rows = samples[name]
+        if not rows:
+            continue
+        latencies = [r[0] for r in rows]
+        errors = sum(1 for r in rows if not 200 <= r[1] < 300)
+        queries = [r[2] for r in rows if r[2] is not None]
+        db_times = [r[3] for r in rows if r[3] is not None]
+        stats = {
+            'count': len(rows),
+            'errors': errors,
+            'p50_ms': round(_percentile(latencies, 50), 3),
+            'p95_ms': round(_percentile(latencies, 95), 3),
+            'p99_ms': round(_percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+            'avg_queries': round(sum(queries) / len(queries), 2) if queries else None,
+            'avg_db_ms': round(sum(db_times) / len(db_times), 3) if db_times else None
+        }
+        results['endpoints'][name] = stats
+        print(f"{name:<18} {stats['count']:>5} {errors:>4} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f} {stats['avg_queries'] if queries else '-':>8} "
+              f"{stats['avg_db_ms'] if db_times else '-':>8}")
+    print(f"\n{args.requests} requests in {wall:.2f}s ({results['meta']['throughput_rps']} req/s, concurrency {args.concurrency})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Results saved to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = []
+    print(f"{'Endpoint':<18} {'base p95':>10} {'new p95':>10} {'change':>8} {'base q':>7} {'new q':>7}")
+    print('-' * 66)
+    for name, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if not old:
+            continue
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        flag = ''
+        if change > args.threshold:
+            regressions.append(f"{name}: p95 {old['p95_ms']:.2f} -> {new['p95_ms']:.2f} ms (+{change:.0f}%)")
+            flag = ' ✗'
+        if old.get('avg_queries') is not None and new.get('avg_queries') is not None \
+                and new['avg_queries'] > old['avg_queries'] + 0.5:
+            regressions.append(f"{name}: queries per request {old['avg_queries']} -> {new['avg_queries']}")
+            flag = ' ✗'
+        if new['errors'] > old['errors']:
+            regressions.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+            flag = ' ✗'
+        print(f"{name:<18} {old['p95_ms']:>10.2f} {new['p95_ms']:>10.2f} {change:>+7.0f}% "
+              f"{str(old.get('avg_queries')):>7} {str(new.get('avg_queries')):>7}{flag}")
+
+    if regressions:
+        print(f"\n✗ {len(regressions)} regression(s) ({baseline['meta'].get('revision')} -> {current['meta'].get('revision')}):")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\n✓ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help='Generate a scratch dataset')
+    gen.add_argument('--db', default='bench.db')
+    gen.add_argument('--products', type=int, default=1000)
+    gen.add_argument('--years', type=float, default=1)
+    gen.add_argument('--bills-per-day', type=int, default=60)
+    gen.add_argument('--credit-customers', type=int, default=40)
+    gen.add_argument('--supplier-bills', type=int, default=200)
+    gen.add_argument('--expenses', type=int, default=2000)
+    gen.add_argument('--seed', type=int, default=42)
+
+    bench = sub.add_parser('run', help='Run the load benchmark')
+    bench.add_argument('--db', default='bench.db')
+    bench.add_argument('--url', help='Benchmark a running server instead of the in-process test client')
+    bench.add_argument('--concurrency', type=int, default=8)
+    bench.add_argument('--requests', type=int, default=1000)
+    bench.add_argument('--seed', type=int, default=42)
+    bench.add_argument('--output')
+
+    cmp_parser = sub.add_parser('compare', help='Compare two result files')
+    cmp_parser.add_argument('baseline')
+    cmp_parser.add_argument('current')
+    cmp_parser.add_argument('--threshold', type=float, default=20, help='Allowed p95 increase in percent')
+
+    args = parser.parse_args()
+    if args.command in ('generate', 'run') and database.DATABASE_URL and not getattr(args, 'url', None):
+        print("The benchmark uses a scratch SQLite database; unset DATABASE_URL")
+        sys.exit(1)
+    {'generate': generate, 'run': run, 'compare': compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,193 @@
 from database import Database, get_ist_datetime
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import os
+import secrets
+import metrics
+import stock
+import sales_velocity
+import costing
+import idempotency
+import events
+import change_log
+
+# Shared with the async routes in asgi.py; the *_COLUMNS name each query's columns
+# for the row mappers in app.py
+BILL_HEADER_SQL = '''SELECT id, customer_name, total_amount, payment_method, bill_number, created_at
+                     FROM transactions WHERE bill_number = ?'''
+BILL_ITEMS_SQL = '''SELECT id, product_id, product_name, quantity, unit_price, total_price
+                    FROM transaction_items
+                    WHERE transaction_id = ?'''
+BILL_ITEM_COLUMNS = ('id', 'product_id', 'product_name', 'quantity', 'unit_price', 'total_price')
+# /api/bills: the bills, then all their items in one query per ITEMS_IN_CHUNK bills
+RECENT_BILL_COLUMNS = ('id', 'bill_number', 'customer_name', 'total_amount', 'payment_method', 'created_at')
+RECENT_BILL_HEADERS_SQL = '''
+    SELECT id, bill_number, customer_name, total_amount, payment_method, created_at
+    FROM transactions
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+ITEMS_IN_CHUNK = 500
+RECENT_BILLS_SQL = '''
+    SELECT bill_number, customer_name, total_amount, payment_method, created_at
+    FROM transactions
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+SALES_SUMMARY_SQL = '''
+    SELECT 
+        COUNT(*) as total_bills,
+        SUM(total_amount) as total_sales,
+        AVG(total_amount) as avg_bill_value,
+        MAX(total_amount) as max_bill_value
+    FROM transactions
+    WHERE is_credit = 0 AND is_replacement = 0
+'''
+
+# One row per day x product; get_profit_report rolls it up. created_at is IST.
+PROFIT_SQL = '''
+    SELECT SUBSTR(CAST(t.created_at AS TEXT), 1, 10), COALESCE(p.category, 'Manual'), ti.product_id, ti.product_name,
+           SUM(ti.quantity), SUM(ti.total_price), SUM(ti.total_cost),
+           SUM(CASE WHEN ti.total_cost IS NULL THEN 0 ELSE ti.total_price END)
+    FROM transactions t
+    JOIN transaction_items ti ON ti.transaction_id = t.id
+    LEFT JOIN products p ON p.id = ti.product_id
+    WHERE t.created_at >= ? AND t.created_at < ? AND t.is_replacement = 0
+    GROUP BY SUBSTR(CAST(t.created_at AS TEXT), 1, 10), COALESCE(p.category, 'Manual'), ti.product_id, ti.product_name
+'''
+BILL_TYPES = ("REGULAR", "CREDIT", "REPLACEMENT")
+
+# Offline bill sync (/api/billing/sync): bills per request, and whether a synced sale may
+# take stock below zero (it already happened at the counter) instead of being rejected
+SYNC_MAX_BILLS = int(os.environ.get('SYNC_MAX_BILLS', '200'))
+SYNC_ALLOW_OVERSELL = os.environ.get('SYNC_ALLOW_OVERSELL', '1') == '1'
+
+
+def bill_items_sql(count):
+    """Items of count bills: BILL_ITEM_COLUMNS, then transaction_id last (so BILL_ITEM_COLUMNS mappers fit)"""
+    return f'''
+        SELECT id, product_id, product_name, quantity, unit_price, total_price, transaction_id
+        FROM transaction_items
+        WHERE transaction_id IN ({', '.join('?' for _ in range(count))})
+        ORDER BY transaction_id, id
+    '''
+
+
+def bill_item_queries(bills):
+    """(sql, params) for the items of bills (RECENT_BILL_COLUMNS rows), ITEMS_IN_CHUNK bills per query"""
+    ids = [bill[0] for bill in bills]
+    for start in range(0, len(ids), ITEMS_IN_CHUNK):
+        chunk = tuple(ids[start:start + ITEMS_IN_CHUNK])
+        yield bill_items_sql(len(chunk)), chunk
+
+
+def group_items(item_rows):
+    """{transaction id: its item rows} from bill_items_sql rows"""
+    items = {}
+    for item in item_rows:
+        items.setdefault(item[-1], []).append(item)
+    return items
+
 
 class BillingManager:
     def __init__(self):
         self.db = Database()
 
-    def create_bill(self, customer_name, items_list, payment_method="CASH", cash_amount=None, upi_amount=None, bill_type="REGULAR"):
+    def create_bill(self, customer_name, items_list, payment_method="CASH", cash_amount=None, upi_amount=None, bill_type="REGULAR",
+                    idempotency_key=None, request_hash=None):
         """
         Create a bill/transaction
         items_list: [(product_id, quantity, unit_price, product_name), ...]
         product_id can be 0 for manual items (no stock tracking)
         bill_type: REGULAR, CREDIT, or REPLACEMENT
+        idempotency_key: committed with the bill; if it is already taken nothing is written
         """
         if not items_list:
             print("✗ Bill must have at least one item")
             return None
 
         # Validate bill_type
-        if bill_type not in ["REGULAR", "CREDIT", "REPLACEMENT"]:
+        if bill_type not in BILL_TYPES:
             bill_type = "REGULAR"
 
-        # Generate bill number
-        bill_number = self._generate_bill_number()
+        try:
+            transaction_items, total_amount, _ = self._prepare_items(items_list)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return None
+
+        ist_time = get_ist_datetime()
+        bill_number = self._generate_bill_number(ist_time)
+        try:
+            # One commit for the whole bill instead of one per statement
+            with self.db.transaction():
+                self._write_bill(bill_number, customer_name, transaction_items, total_amount, payment_method,
+                                 cash_amount, upi_amount, bill_type, ist_time, idempotency_key, request_hash)
+        except Exception as e:
+            print(f"✗ Failed to create bill: {e}")
+            return None
+
+        metrics.BILLS_CREATED.inc(bill_type=bill_type)
+        metrics.BILL_LINE_ITEMS.observe(len(transaction_items))
+        print(f"✓ Bill created successfully. Bill #: {bill_number}")
+        return bill_number
+
+    def create_bills(self, bills, allow_oversell=True):
+        """
+        Apply a batch of bills (offline sync) with one commit; each bill has its own savepoint
+        bills: [{'client_id', 'customer_name', 'items': [(product_id, quantity, unit_price, product_name)],
+                 'payment_method', 'cash_amount', 'upi_amount', 'bill_type', 'created_at'}, ...]
+        client_id is the bill's idempotency key, so a batch sent twice creates each bill once;
+        an optional 'fingerprint' is the request hash compared against an existing key.
+        allow_oversell: record sales beyond current stock (they already happened) and report them
+        as stock_conflicts; otherwise such bills are rejected.
+        Returns one result per bill: {'client_id', 'status': created|duplicate|rejected, ...}
+        """
+        results, created = [], []
+        with self.db.transaction():
+            for bill in bills:
+                client_id = bill['client_id']
+                fingerprint = bill.get('fingerprint') or idempotency.request_hash(bill)
+                existing = idempotency.lookup(self.db, client_id)
+                if existing:
+                    if existing[0] == fingerprint:
+                        results.append({'client_id': client_id, 'status': 'duplicate', 'bill_number': existing[1]})
+                    else:
+                        results.append({'client_id': client_id, 'status': 'rejected',
+                                        'error': 'client_id was already used for a different bill'})
+                    continue
+                bill_type = bill.get('bill_type') if bill.get('bill_type') in BILL_TYPES else 'REGULAR'
+                try:
+                    if not bill.get('items'):
+                        raise ValueError("Bill must have at least one item")
+                    with self.db.savepoint():
+                        transaction_items, total_amount, shortages = self._prepare_items(bill['items'], allow_oversell)
+                        ist_time = self._bill_time(bill.get('created_at'))
+                        bill_number = self._generate_bill_number(ist_time)
+                        self._write_bill(bill_number, bill.get('customer_name') or 'Walk-in', transaction_items,
+                                         total_amount, bill.get('payment_method') or 'CASH', bill.get('cash_amount'),
+                                         bill.get('upi_amount'), bill_type, ist_time, client_id, fingerprint)
+                except Exception as e:
+                    results.append({'client_id': client_id, 'status': 'rejected', 'error': str(e)})
+                    continue
+                created.append((bill_type, len(transaction_items)))
+                results.append({'client_id': client_id, 'status': 'created', 'bill_number': bill_number,
+                                'stock_conflicts': shortages})
+
+        for bill_type, line_count in created:
+            metrics.BILLS_CREATED.inc(bill_type=bill_type)
+            metrics.BILL_LINE_ITEMS.observe(line_count)
+        print(f"✓ Synced {len(created)} of {len(bills)} bills")
+        return results
 
+    def _prepare_items(self, items_list, allow_oversell=False):
+        """
+        Price and validate bill items against current stock
+        Returns (transaction_items, total_amount, shortages); raises ValueError for an unknown
+        product, or for insufficient stock unless allow_oversell (then it is listed in shortages)
+        """
         total_amount = 0
         transaction_items = []
+        shortages = []
 
         # Validate all items and calculate total
         for item_data in items_list:
@@ -66,14 +228,15 @@ class BillingManager:
                 })
             else:
                 # Regular product - fetch from database
+                # Stock check must see the latest quantity, never a lagging replica
                 product = self.db.fetch_one(
                     'SELECT id, name, unit_price, quantity FROM products WHERE id = ?',
-                    (product_id,)
+                    (product_id,),
+                    use_primary=True
                 )
 
                 if not product:
-                    print(f"✗ Product ID {product_id} not found")
-                    return None
+                    raise ValueError(f"Product ID {product_id} not found")
 
                 db_product_id, db_product_name, db_unit_price, available_qty = product
 
@@ -88,8 +251,14 @@ class BillingManager:
                 final_name = product_name if product_name else db_product_name
 
                 if available_qty < quantity:
-                    print(f"✗ Insufficient stock for {final_name}. Available: {available_qty}")
-                    return None
+                    if not allow_oversell:
+                        raise ValueError(f"Insufficient stock for {final_name}. Available: {available_qty}")
+                    shortages.append({
+                        'product_id': product_id,
+                        'name': final_name,
+                        'requested': quantity,
+                        'available': available_qty
+                    })
 
                 item_total = final_price * quantity
                 total_amount += item_total
@@ -102,8 +271,11 @@ class BillingManager:
                     'is_manual': False
                 })
 
-        # Create transaction
-        ist_time = get_ist_datetime()
+        return transaction_items, total_amount, shortages
+
+    def _write_bill(self, bill_number, customer_name, transaction_items, total_amount, payment_method, cash_amount,
+                    upi_amount, bill_type, ist_time, idempotency_key=None, request_hash=None):
+        """Insert the bill, its items, stock movements and counters; call inside db.transaction()"""
         is_credit = 1 if bill_type == "CREDIT" else 0
         is_replacement = 1 if bill_type == "REPLACEMENT" else 0
         received_amount = 0 if is_credit else total_amount
@@ -113,36 +285,45 @@ class BillingManager:
             INSERT INTO transactions (customer_name, total_amount, payment_method, bill_number, cash_amount, upi_amount, bill_type, is_credit, is_replacement, received_amount, credit_status, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
-        if not self.db.execute_query(transaction_query, (customer_name, total_amount, payment_method, bill_number, cash_amount, upi_amount, bill_type, is_credit, is_replacement, received_amount, credit_status, ist_time)):
-            print("✗ Failed to create transaction")
-            return None
-
-        # Get transaction ID
-        transaction = self.db.fetch_one(
-            'SELECT id FROM transactions WHERE bill_number = ?',
-            (bill_number,)
-        )
-        
-        if not transaction:
-            print("✗ Failed to retrieve transaction ID")
-            return None
-            
-        transaction_id = transaction[0]
+        # First, so a duplicate retry fails before touching stock
+        if idempotency_key:
+            idempotency.reserve(self.db, idempotency_key, request_hash, bill_number)
+        transaction_id = self.db.execute_insert(transaction_query, (customer_name, total_amount, payment_method, bill_number, cash_amount, upi_amount, bill_type, is_credit, is_replacement, received_amount, credit_status, ist_time))
+        change_log.record(self.db, 'transactions', transaction_id, 'INSERT', {
+            'customer_name': customer_name, 'total_amount': total_amount, 'payment_method': payment_method,
+            'bill_number': bill_number, 'cash_amount': cash_amount, 'upi_amount': upi_amount, 'bill_type': bill_type,
+            'is_credit': is_credit, 'is_replacement': is_replacement, 'received_amount': received_amount,
+            'credit_status': credit_status, 'created_at': ist_time
+        })
 
         # Insert transaction items and update stock
+        logged_items = []
+        sold = {}
         for item in transaction_items:
+            # Cost is fixed at sale time (FIFO layers or average cost); manual items have none
+            total_cost = None
+            if not item['is_manual'] and item['product_id'] > 0:
+                total_cost = costing.consume(self.db, item['product_id'], item['quantity'])
             item_query = '''
-                INSERT INTO transaction_items (transaction_id, product_id, product_name, quantity, unit_price, total_price)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO transaction_items (transaction_id, product_id, product_name, quantity, unit_price, total_price, unit_cost, total_cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             '''
-            self.db.execute_query(item_query, (
+            unit_cost = round(total_cost / item['quantity'], 4) if total_cost is not None and item['quantity'] else None
+            item_id = self.db.execute_insert(item_query, (
                 transaction_id,
                 item['product_id'],
                 item['product_name'],
                 item['quantity'],
                 item['unit_price'],
-                item['total_price']
+                item['total_price'],
+                unit_cost,
+                total_cost
             ))
+            logged_items.append((item_id, {
+                'transaction_id': transaction_id, 'product_id': item['product_id'],
+                'product_name': item['product_name'], 'quantity': item['quantity'], 'unit_price': item['unit_price'],
+                'total_price': item['total_price'], 'unit_cost': unit_cost, 'total_cost': total_cost
+            }))
 
             # Update stock only for non-manual items
             if not item['is_manual'] and item['product_id'] > 0:
@@ -150,45 +331,60 @@ class BillingManager:
                     UPDATE products SET quantity = quantity - ? WHERE id = ?
                 '''
                 self.db.execute_query(stock_update, (item['quantity'], item['product_id']))
-
-                # Record stock movement
-                movement_query = '''
-                    INSERT INTO stock_movements (product_id, movement_type, quantity, reference_id)
-                    VALUES (?, ?, ?, ?)
-                '''
-                self.db.execute_query(movement_query, (
-                    item['product_id'],
-                    'SALE',
-                    item['quantity'],
-                    transaction_id
-                ))
-
-        print(f"✓ Bill created successfully. Bill #: {bill_number}")
-        return bill_number
-
-    def _generate_bill_number(self):
-        """Generate unique bill number"""
-        ist_time = get_ist_datetime()
+                sold[item['product_id']] = sold.get(item['product_id'], 0) + item['quantity']
+
+                stock.record_movement(self.db, item['product_id'], 'SALE', item['quantity'], transaction_id)
+        change_log.record_many(self.db, 'transaction_items', 'INSERT', logged_items)
+
+        # Daily per-product counters for the top-sellers report
+        sales_velocity.record_sales(self.db, ist_time[:10], [
+            (item['product_id'], item['quantity'], item['total_price'])
+            for item in transaction_items if not item['is_manual']
+        ])
+
+        # New stock levels of the products sold, for the change log and the live 'bill' event
+        levels = []
+        if sold and (change_log.CHANGE_LOG_ENABLED or events.EVENTS_ENABLED):
+            levels = self.db.fetch_all(
+                f"SELECT id, quantity, minimum_stock, unit_price FROM products WHERE id IN ({', '.join('?' for _ in sold)})",
+                tuple(sold), use_primary=True)
+        change_log.record_many(self.db, 'products', 'UPDATE', [(row[0], {'quantity': row[1]}) for row in levels])
+        events.publish_after_commit(self.db, 'bill', {
+            'bill_number': bill_number,
+            'customer_name': customer_name,
+            'total_amount': total_amount,
+            'payment_method': payment_method,
+            'bill_type': bill_type,
+            'created_at': ist_time,
+            'item_count': len(transaction_items),
+            'stock': [events.stock_delta(row[0], row[1], row[2], row[3], -sold[row[0]]) for row in levels]
+        })
+        return transaction_id
+
+    def _generate_bill_number(self, ist_time=None):
+        """Generate unique bill number (bill time plus a random suffix, so bills in the same second don't clash)"""
+        ist_time = ist_time or get_ist_datetime()
         timestamp = ist_time.replace("-", "").replace(":", "").replace(" ", "")[:14]
-        return f"BILL-{timestamp}"
+        return f"BILL-{timestamp}-{secrets.token_hex(3).upper()}"
 
-    def get_bill(self, bill_number):
-        """Get bill details"""
-        transaction = self.db.fetch_one(
-            'SELECT * FROM transactions WHERE bill_number = ?',
-            (bill_number,)
-        )
+    def _bill_time(self, created_at):
+        """IST time for a synced bill: when it was made offline, if that is a valid time not in the future"""
+        now = get_ist_datetime()
+        try:
+            datetime.strptime(created_at or '', '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return now
+        return created_at if created_at <= now else now
+
+    def get_bill(self, bill_number, use_primary=False):
+        """Get bill details; use_primary=True right after creating the bill"""
+        transaction = self.db.fetch_one(BILL_HEADER_SQL, (bill_number,), use_primary=use_primary)
         
         if not transaction:
             return None
 
         transaction_id = transaction[0]
-        items = self.db.fetch_all(
-            '''SELECT id, product_id, product_name, quantity, unit_price, total_price
-               FROM transaction_items
-               WHERE transaction_id = ?''',
-            (transaction_id,)
-        ) or []
+        items = self.db.fetch_all(BILL_ITEMS_SQL, (transaction_id,), use_primary=use_primary) or []
 
         return {
             'bill_number': transaction[4],
@@ -227,13 +423,13 @@ class BillingManager:
 
     def get_all_bills(self, limit=10):
         """Get recent bills"""
-        query = '''
-            SELECT bill_number, customer_name, total_amount, payment_method, created_at
-            FROM transactions
-            ORDER BY created_at DESC
-            LIMIT ?
-        '''
-        return self.db.fetch_all(query, (limit,))
+        return self.db.fetch_all(RECENT_BILLS_SQL, (limit,))
+
+    def get_recent_bills_with_items(self, limit=10):
+        """Recent bills (RECENT_BILL_COLUMNS rows) and {transaction id: item rows}"""
+        bills = self.db.fetch_all(RECENT_BILL_HEADERS_SQL, (limit,))
+        return bills, group_items(item for sql, params in bill_item_queries(bills)
+                                  for item in self.db.fetch_all(sql, params))
 
     def display_bill_history(self, limit=10):
         """Display bill history"""
@@ -273,17 +469,61 @@ class BillingManager:
 
     def get_sales_summary(self):
         """Get sales summary statistics - excludes credit and replacement transactions"""
-        query = '''
-            SELECT 
-                COUNT(*) as total_bills,
-                SUM(total_amount) as total_sales,
-                AVG(total_amount) as avg_bill_value,
-                MAX(total_amount) as max_bill_value
-            FROM transactions
-            WHERE is_credit = 0 AND is_replacement = 0
-        '''
-        return self.db.fetch_one(query)
+        return self.db.fetch_one(SALES_SUMMARY_SQL)
     
+    def get_profit_report(self, start, end):
+        """Revenue, cost and margin per day, category and product between two IST dates (inclusive).
+
+        Sums the cost stored on each bill line at sale time; lines without a
+        cost count towards uncosted_revenue and are left out of the margin.
+        Replacement bills are excluded.
+        """
+        start_day, end_day = date.fromisoformat(start), date.fromisoformat(end)
+        if end_day < start_day:
+            raise ValueError("'to' must not be before 'from'")
+        rows = self.db.fetch_all(PROFIT_SQL, (start_day.isoformat(), (end_day + timedelta(days=1)).isoformat()))
+
+        groups = {'day': {}, 'category': {}, 'product': {}}
+        for day, category, product_id, product_name, quantity, revenue, cost, costed_revenue in rows:
+            product_key = product_id if product_id and product_id > 0 else f"manual:{product_name}"
+            for dimension, key, extra in (
+                ('day', day, {}),
+                ('category', category, {}),
+                ('product', product_key, {'product_id': product_id or None, 'name': product_name, 'category': category}),
+                ('total', None, {})
+            ):
+                group = groups.setdefault(dimension, {}).get(key)
+                if group is None:
+                    group = groups[dimension][key] = dict(extra, quantity=0, revenue=0.0, cost=0.0, costed_revenue=0.0)
+                group['quantity'] += quantity or 0
+                group['revenue'] += revenue or 0
+                group['cost'] += cost or 0
+                group['costed_revenue'] += costed_revenue or 0
+
+        def finish(group):
+            margin = group['costed_revenue'] - group['cost']
+            return {
+                **{k: v for k, v in group.items() if k != 'costed_revenue'},
+                'revenue': round(group['revenue'], 2),
+                'cost': round(group['cost'], 2),
+                'margin': round(margin, 2),
+                'margin_pct': round(margin / group['costed_revenue'] * 100, 1) if group['costed_revenue'] else None,
+                'uncosted_revenue': round(group['revenue'] - group['costed_revenue'], 2)
+            }
+
+        total = groups['total'].get(None, {'quantity': 0, 'revenue': 0.0, 'cost': 0.0, 'costed_revenue': 0.0})
+        return {
+            'from': start_day.isoformat(),
+            'to': end_day.isoformat(),
+            'cost_method': costing.COST_METHOD,
+            'totals': finish(total),
+            'by_day': [dict(finish(g), date=key) for key, g in sorted(groups['day'].items())],
+            'by_category': sorted((dict(finish(g), category=key) for key, g in groups['category'].items()),
+                                  key=lambda row: row['revenue'], reverse=True),
+            'by_product': sorted((finish(g) for g in groups['product'].values()),
+                                 key=lambda row: row['margin'], reverse=True)
+        }
+
     # -------- CREDIT (WHOLESALE) MANAGEMENT ---------
     def get_credit_bills(self, status=None, limit=200):
         """Get credit customers aggregated (one row per customer)"""
@@ -324,12 +564,13 @@ class BillingManager:
         params.append(limit)
         return self.db.fetch_all(base, tuple(params))
 
-    def get_credit_bill(self, bill_number):
+    def get_credit_bill(self, bill_number, use_primary=False):
         """Get single credit bill with payment history"""
         txn = self.db.fetch_one(
             '''SELECT id, bill_number, customer_name, total_amount, received_amount, credit_status, payment_method, created_at
                FROM transactions WHERE bill_number = ? AND is_credit = 1''',
-            (bill_number,)
+            (bill_number,),
+            use_primary=use_primary
         )
         if not txn:
             return None
@@ -337,7 +578,8 @@ class BillingManager:
         payments = self.db.fetch_all(
             '''SELECT id, payment_amount, payment_date, notes, created_at
                FROM credit_bill_payments WHERE transaction_id = ? ORDER BY payment_date DESC, id DESC''',
-            (txn_id,)
+            (txn_id,),
+            use_primary=use_primary
         ) or []
         return {
             'id': txn_id,
@@ -384,11 +626,12 @@ class BillingManager:
                FROM transactions
                WHERE is_credit = 1 AND credit_status != 'PAID' AND customer_name = ?
                ORDER BY created_at ASC, id ASC''',
-            (customer_name,)
+            (customer_name,),
+            use_primary=True
         ) or []
 
     def _apply_payment_to_bill(self, txn_id, bill_number, current_received, total_amount, apply_amount, payment_date, notes):
-        """Apply payment to a single bill and persist rows"""
+        """Apply payment to a single bill and persist rows; call inside db.transaction()"""
         new_received = float(current_received) + apply_amount
         new_status = 'PAID' if new_received + 0.01 >= float(total_amount) else 'PARTIAL'
 
@@ -396,22 +639,25 @@ class BillingManager:
             INSERT INTO credit_bill_payments (transaction_id, payment_amount, payment_date, notes)
             VALUES (?, ?, ?, ?)
         '''
-        if not self.db.execute_query(insert, (txn_id, apply_amount, payment_date, notes)):
-            return False, "Failed to save payment"
+        payment_id = self.db.execute_insert(insert, (txn_id, apply_amount, payment_date, notes))
+        change_log.record(self.db, 'credit_bill_payments', payment_id, 'INSERT', {
+            'transaction_id': txn_id, 'payment_amount': apply_amount, 'payment_date': payment_date, 'notes': notes
+        })
 
         update = '''
             UPDATE transactions
             SET received_amount = ?, credit_status = ?
             WHERE id = ?
         '''
-        if not self.db.execute_query(update, (new_received, new_status, txn_id)):
-            return False, "Failed to update bill status"
+        self.db.execute_query(update, (new_received, new_status, txn_id))
+        change_log.record(self.db, 'transactions', txn_id, 'UPDATE',
+                          {'received_amount': new_received, 'credit_status': new_status})
 
-        return True, new_status, new_received
+        return new_status, new_received
 
     def add_credit_payment(self, bill_number, payment_amount, payment_date, notes=""):
         """Record a payment towards a credit bill; cascades to other unpaid bills of same customer"""
-        bill = self.get_credit_bill(bill_number)
+        bill = self.get_credit_bill(bill_number, use_primary=True)
         if not bill:
             return False, "Bill not found", []
         try:
@@ -425,35 +671,49 @@ class BillingManager:
         remaining = payment_amount
         allocations = []
 
-        for txn in queue:
-            txn_id, txn_bill_no, total_amt, received_amt, created_at = txn
-            balance = float(total_amt) - float(received_amt)
-            if balance <= 0:
-                continue
-            apply_amt = min(balance, remaining)
-            success, new_status, new_received = self._apply_payment_to_bill(
-                txn_id, txn_bill_no, received_amt, total_amt, apply_amt, payment_date, notes
-            )
-            if not success:
-                return False, new_status, allocations
-            allocations.append({
-                'bill_number': txn_bill_no,
-                'applied': apply_amt,
-                'new_status': new_status,
-                'new_balance': float(total_amt) - float(new_received)
-            })
-            remaining -= apply_amt
-            if remaining <= 0:
-                break
+        try:
+            # The whole cascade commits together, or not at all
+            with self.db.transaction():
+                for txn in queue:
+                    txn_id, txn_bill_no, total_amt, received_amt, created_at = txn
+                    balance = float(total_amt) - float(received_amt)
+                    if balance <= 0:
+                        continue
+                    apply_amt = min(balance, remaining)
+                    new_status, new_received = self._apply_payment_to_bill(
+                        txn_id, txn_bill_no, received_amt, total_amt, apply_amt, payment_date, notes
+                    )
+                    allocations.append({
+                        'bill_number': txn_bill_no,
+                        'applied': apply_amt,
+                        'previous_status': 'PARTIAL' if float(received_amt) > 0 else 'UNPAID',
+                        'new_status': new_status,
+                        'new_balance': float(total_amt) - float(new_received)
+                    })
+                    remaining -= apply_amt
+                    if remaining <= 0:
+                        break
+        except Exception as e:
+            print(f"✗ Failed to save payment: {e}")
+            return False, "Failed to save payment", []
 
         if not allocations:
             return False, "No eligible bills to apply payment", []
 
+        applied = {a['bill_number']: a['applied'] for a in allocations}
+        events.publish_after_commit(self.db, 'payment', {
+            'customer_name': bill['customer_name'],
+            'amount': payment_amount - remaining,
+            'allocations': allocations,
+            # The customer's oldest bill still open after this payment
+            'next_bill_number': next((txn[1] for txn in queue
+                                      if float(txn[2]) - float(txn[3]) - applied.get(txn[1], 0) > 0.01), None)
+        })
         return True, allocations[-1]['new_status'], allocations
 
     def mark_credit_paid(self, bill_number, payment_date, notes="Settled"):
         """Mark credit bill fully paid (cascades if overpaid)"""
-        bill = self.get_credit_bill(bill_number)
+        bill = self.get_credit_bill(bill_number, use_primary=True)
         if not bill:
             return False, "Bill not found"
         total_balance = 0
@@ -463,12 +723,35 @@ class BillingManager:
             total_balance += float(total_amt) - float(received_amt)
         if total_balance <= 0:
             # already paid
-            self.db.execute_query("UPDATE transactions SET credit_status='PAID' WHERE id=?", (bill['id'],))
+            with self.db.transaction():
+                self.db.execute_query("UPDATE transactions SET credit_status='PAID' WHERE id=?", (bill['id'],))
+                change_log.record(self.db, 'transactions', bill['id'], 'UPDATE', {'credit_status': 'PAID'})
             return True, 'PAID'
 
         success, _, allocations = self.add_credit_payment(bill_number, total_balance, payment_date, notes)
         return success, 'PAID' if success else 'UNPAID'
 
+    def delete_transaction(self, transaction_id):
+        """Delete a bill with its items and credit payments; False if there is no such bill"""
+        with self.db.transaction():
+            bill = self.db.fetch_one('SELECT id, created_at FROM transactions WHERE id = ?', (transaction_id,),
+                                     use_primary=True)
+            if not bill:
+                return False
+            # Take the bill's items off the daily sales counters of the day it was made
+            items = self.db.fetch_all(
+                'SELECT product_id, quantity, total_price FROM transaction_items WHERE transaction_id = ?',
+                (transaction_id,), use_primary=True)
+            sales_velocity.remove_sales(self.db, str(bill[1])[:10], items)
+            for table in ('credit_bill_payments', 'transaction_items'):
+                rows = self.db.fetch_all(f'SELECT id FROM {table} WHERE transaction_id = ?', (transaction_id,),
+                                         use_primary=True)
+                self.db.execute_query(f'DELETE FROM {table} WHERE transaction_id = ?', (transaction_id,))
+                change_log.record_many(self.db, table, 'DELETE', [(row[0], None) for row in rows])
+            self.db.execute_query('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+            change_log.record(self.db, 'transactions', transaction_id, 'DELETE')
+        return True
+
     def get_credit_summary(self):
         """Summary stats for credit bills"""
         summary = self.db.fetch_one(
@@ -0,0 +1,104 @@
+"""
+Change Log
+Append-only record of the managers' writes, so downstream consumers
+(accounting export, backups, analytics) sync what changed instead of
+re-reading whole tables.
+- One row per changed row: seq, table_name, row_id, op (INSERT / UPDATE /
+  DELETE) and payload, the JSON of the columns written with their new values
+  (none for a DELETE); created_at is IST, like the bills and other rows
+- record() is called inside the write's db.transaction(); the rows are
+  inserted as the transaction's last step, so a change is logged if and only
+  if it commits
+- seq follows commit order: on PostgreSQL that last step takes a transaction
+  advisory lock (held only until the commit), so a consumer that has read up
+  to seq N never later finds a committed change below N
+- GET /api/changes?since=<seq> returns the changes after seq, oldest first
+- Changes older than CHANGE_LOG_KEEP_DAYS are purged nightly; a consumer
+  further behind than that gets 410 and has to re-read the tables
+
+Logged tables: products, transactions, transaction_items,
+credit_bill_payments, expenses, supplier_bills, supplier_bill_payments.
+stock_movements is already an append-only log, and derived tables (sales
+counters, cost layers, reorder suggestions) are rebuilt from these.
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+
+from database import get_ist_datetime
+
+CHANGE_LOG_ENABLED = os.environ.get('CHANGE_LOG_ENABLED', '1') == '1'
+CHANGE_LOG_KEEP_DAYS = int(os.environ.get('CHANGE_LOG_KEEP_DAYS', '30'))
+# Rows read per query while streaming /api/changes
+CHANGE_LOG_PAGE_SIZE = int(os.environ.get('CHANGE_LOG_PAGE_SIZE', '1000'))
+
+# Arbitrary key for pg_advisory_xact_lock (jobs.py uses 7263540)
+ADVISORY_LOCK_KEY = 7263541
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+COLUMNS = ('table_name', 'row_id', 'op', 'payload', 'created_at')
+CHANGES_SQL = '''
+    SELECT seq, table_name, row_id, op, payload, created_at FROM change_log
+    WHERE seq > ? AND seq <= ?
+    ORDER BY seq
+    LIMIT ?
+'''
+
+
+def record(db, table_name, row_id, op, payload=None):
+    """Log a change to one row; call inside the write's db.transaction()"""
+    record_many(db, table_name, op, [(row_id, payload)])
+
+
+def record_many(db, table_name, op, rows):
+    """Log one change per (row_id, payload); call inside the write's db.transaction()"""
+    if not CHANGE_LOG_ENABLED or not rows:
+        return
+    created_at = get_ist_datetime()
+    params = [(table_name, row_id, op,
+               None if payload is None else json.dumps(payload, separators=(',', ':'), default=str), created_at)
+              for row_id, payload in rows]
+    db.before_commit(lambda: _write(db, params))
+
+
+def _write(db, params):
+    if db.is_postgres:
+        # Serialises the commits that log changes, so seq order is commit order
+        db.execute_query('SELECT pg_advisory_xact_lock(?)', (ADVISORY_LOCK_KEY,))
+    db.bulk_insert('change_log', COLUMNS, params)
+
+
+def get_bounds(db):
+    """(oldest seq, newest seq) still in the log, or (None, None) if it is empty"""
+    return db.fetch_one('SELECT MIN(seq), MAX(seq) FROM change_log', use_primary=True)
+
+
+def iter_changes(db, since, until, limit):
+    """Changes with since < seq <= until, oldest first, at most limit of them"""
+    while limit > 0:
+        rows = db.fetch_all(CHANGES_SQL, (since, until, min(limit, CHANGE_LOG_PAGE_SIZE)), use_primary=True)
+        if not rows:
+            return
+        yield from rows
+        since = rows[-1][0]
+        limit -= len(rows)
+
+
+def to_json_line(row):
+    """A change as one line of JSON; the stored payload is spliced in as-is"""
+    seq, table_name, row_id, op, payload, created_at = row
+    head = json.dumps({'seq': seq, 'table': table_name, 'row_id': row_id, 'op': op,
+                       'created_at': str(created_at)}, separators=(',', ':'))
+    return f'{head[:-1]},"data":{payload or "null"}}}\n'
+
+
+def purge(db):
+    """Delete changes older than CHANGE_LOG_KEEP_DAYS (always keeping the newest); returns True on success"""
+    cutoff = (datetime.strptime(get_ist_datetime(), TIMESTAMP_FORMAT)
+              - timedelta(days=CHANGE_LOG_KEEP_DAYS)).strftime(TIMESTAMP_FORMAT)
+    # The newest row stays so consumers can still tell how far the log has gone
+    return db.execute_query('''
+        DELETE FROM change_log WHERE created_at < ? AND seq < (SELECT MAX(seq) FROM change_log)
+    ''', (cutoff,))
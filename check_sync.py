@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Offline Sync Check
+Runs BillingManager.create_bills on a scratch SQLite database and checks that
+a batch is one transaction:
+
+  - no bill of the batch is visible to another connection before the commit
+  - a bill that fails after writing rolls back only its own savepoint (no
+    bill, no items, no stock change) and the others commit together
+  - a failure in the final before-commit step (the change log) rolls back the
+    whole batch
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python check_sync.py
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import contextlib
+import io
+
+START_STOCK = 100
+
+
+def main():
+    scratch = tempfile.mkdtemp()
+    # Keep live events out of the repo
+    os.environ.setdefault('EVENTS_DIR', os.path.join(scratch, 'events'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import database
+        database.DB_PATH = os.path.join(scratch, 'sync.db')
+        from products import ProductManager
+        from billing import BillingManager
+        products = ProductManager()
+        products.add_product('Sync Bulb', 'Lighting', 100, START_STOCK, 5)
+        products.close()
+
+    reader = sqlite3.connect(database.DB_PATH)
+    count = lambda query: reader.execute(query).fetchone()[0]
+    bill = lambda client_id: {'client_id': client_id, 'customer_name': 'Sync', 'items': [(1, 1)],
+                              'payment_method': 'CASH'}
+    billing = BillingManager()
+    write_bill = billing._write_bill
+
+    def failing_write_bill(*args):
+        # Fails after the bill, its items and the stock change are written
+        write_bill(*args)
+        if args[9] == 'fail':
+            raise RuntimeError('failed after writing')
+
+    seen_before_commit = []
+    billing._write_bill = failing_write_bill
+    with contextlib.redirect_stdout(io.StringIO()):
+        with billing.db.transaction():
+            billing.db.before_commit(lambda: seen_before_commit.append(
+                (billing.db.connection.in_transaction, count('SELECT COUNT(*) FROM transactions'))))
+            results = billing.create_bills([bill('a'), bill('fail'), bill('b')])
+
+    checks = [
+        ('statuses', [r['status'] for r in results], ['created', 'rejected', 'created']),
+        ('open transaction before the commit', seen_before_commit[0][0], True),
+        ('bills visible before the commit', seen_before_commit[0][1], 0),
+        ('bills', count('SELECT COUNT(*) FROM transactions'), 2),
+        ('bill items', count('SELECT COUNT(*) FROM transaction_items'), 2),
+        ('stock', count('SELECT quantity FROM products WHERE id = 1'), START_STOCK - 2),
+    ]
+
+    def failing_change_log():
+        raise RuntimeError('change log failed')
+
+    billing._write_bill = write_bill
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            with billing.db.transaction():
+                billing.create_bills([bill('c'), bill('d')])
+                billing.db.before_commit(failing_change_log)
+        except RuntimeError:
+            pass
+    checks += [
+        ('bills after a failed commit', count('SELECT COUNT(*) FROM transactions'), 2),
+        ('stock after a failed commit', count('SELECT quantity FROM products WHERE id = 1'), START_STOCK - 2),
+    ]
+    billing.close()
+    reader.close()
+
+    failed = False
+    for label, actual, expected in checks:
+        ok = actual == expected
+        failed = failed or not ok
+        print(f"  {'✓' if ok else '✗'} {label}: {actual} (expected {expected})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
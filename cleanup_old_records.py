@@ -7,16 +7,14 @@ Deletes old records to free up storage space on Render
 - Keeps only active products
 """
 
-import sqlite3
 from datetime import datetime, timedelta
-import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'electrical_shop.db')
+from database import Database
 
 class DatabaseCleaner:
     def __init__(self):
-        self.connection = sqlite3.connect(DB_PATH, check_same_thread=False)
-        self.cursor = self.connection.cursor()
+        # The configured database (SQLite file or DATABASE_URL), like the app's managers
+        self.db = Database()
         self.deleted_records = {
             'billing': 0,
             'supplier_bills': 0,
@@ -32,32 +30,22 @@ class DatabaseCleaner:
         cutoff_str = cutoff_date.strftime("%Y-%m-%d %H:%M:%S")
         
         try:
-            # First, get the transaction IDs to delete
-            self.cursor.execute('''
-                SELECT id FROM transactions 
-                WHERE created_at < ?
-            ''', (cutoff_str,))
-            
-            transaction_ids = [row[0] for row in self.cursor.fetchall()]
-            
-            if transaction_ids:
+            with self.db.transaction():
                 # Delete transaction items first (foreign key constraint)
-                placeholders = ','.join('?' * len(transaction_ids))
-                self.cursor.execute(f'''
+                items = self.db.execute_rowcount('''
                     DELETE FROM transaction_items 
-                    WHERE transaction_id IN ({placeholders})
-                ''', transaction_ids)
-                
-                self.deleted_records['orphaned_transaction_items'] += self.cursor.rowcount
+                    WHERE transaction_id IN (SELECT id FROM transactions WHERE created_at < ?)
+                ''', (cutoff_str,))
                 
                 # Delete transactions
-                self.cursor.execute(f'''
+                bills = self.db.execute_rowcount('''
                     DELETE FROM transactions 
-                    WHERE id IN ({placeholders})
-                ''', transaction_ids)
-                
-                self.deleted_records['billing'] = self.cursor.rowcount
-                self.connection.commit()
+                    WHERE created_at < ?
+                ''', (cutoff_str,))
+            
+            if bills:
+                self.deleted_records['orphaned_transaction_items'] += items
+                self.deleted_records['billing'] = bills
                 
                 print(f"✓ Deleted {self.deleted_records['billing']} billing records older than {days} days")
                 print(f"  (Also deleted {self.deleted_records['orphaned_transaction_items']} related transaction items)")
@@ -68,7 +56,6 @@ class DatabaseCleaner:
                 
         except Exception as e:
             print(f"✗ Error deleting billing records: {e}")
-            self.connection.rollback()
             return False
 
     def delete_old_supplier_bills(self, days=60):
@@ -77,20 +64,17 @@ class DatabaseCleaner:
         cutoff_str = cutoff_date.strftime("%Y-%m-%d")
         
         try:
-            self.cursor.execute('''
-                DELETE FROM supplier_bills 
-                WHERE bill_date < ?
-            ''', (cutoff_str,))
-            
-            self.deleted_records['supplier_bills'] = self.cursor.rowcount
-            self.connection.commit()
+            with self.db.transaction():
+                self.deleted_records['supplier_bills'] = self.db.execute_rowcount('''
+                    DELETE FROM supplier_bills 
+                    WHERE bill_date < ?
+                ''', (cutoff_str,))
             
             print(f"✓ Deleted {self.deleted_records['supplier_bills']} supplier bills older than {days} days")
             return True
             
         except Exception as e:
             print(f"✗ Error deleting supplier bills: {e}")
-            self.connection.rollback()
             return False
 
     def delete_old_expenses(self, days=7):
@@ -99,51 +83,38 @@ class DatabaseCleaner:
         cutoff_str = cutoff_date.strftime("%Y-%m-%d")
         
         try:
-            self.cursor.execute('''
-                DELETE FROM expenses 
-                WHERE expense_date < ?
-            ''', (cutoff_str,))
-            
-            self.deleted_records['expenses'] = self.cursor.rowcount
-            self.connection.commit()
+            with self.db.transaction():
+                self.deleted_records['expenses'] = self.db.execute_rowcount('''
+                    DELETE FROM expenses 
+                    WHERE expense_date < ?
+                ''', (cutoff_str,))
             
             print(f"✓ Deleted {self.deleted_records['expenses']} expense records older than {days} days")
             return True
             
         except Exception as e:
             print(f"✗ Error deleting expenses: {e}")
-            self.connection.rollback()
             return False
 
     def keep_only_active_products(self):
         """Delete products with zero quantity (inactive products)"""
         try:
-            # Get inactive product IDs
-            self.cursor.execute('''
-                SELECT id FROM products 
-                WHERE quantity = 0
-            ''')
-            
-            product_ids = [row[0] for row in self.cursor.fetchall()]
-            
-            if product_ids:
+            with self.db.transaction():
                 # Delete related stock movements first
-                placeholders = ','.join('?' * len(product_ids))
-                self.cursor.execute(f'''
+                movements = self.db.execute_rowcount('''
                     DELETE FROM stock_movements 
-                    WHERE product_id IN ({placeholders})
-                ''', product_ids)
-                
-                self.deleted_records['orphaned_stock_movements'] = self.cursor.rowcount
+                    WHERE product_id IN (SELECT id FROM products WHERE quantity = 0)
+                ''')
                 
                 # Delete inactive products
-                self.cursor.execute(f'''
+                products = self.db.execute_rowcount('''
                     DELETE FROM products 
-                    WHERE id IN ({placeholders})
-                ''', product_ids)
-                
-                self.deleted_records['inactive_products'] = self.cursor.rowcount
-                self.connection.commit()
+                    WHERE quantity = 0
+                ''')
+            
+            if products:
+                self.deleted_records['orphaned_stock_movements'] = movements
+                self.deleted_records['inactive_products'] = products
                 
                 print(f"✓ Deleted {self.deleted_records['inactive_products']} inactive products (zero quantity)")
                 print(f"  (Also deleted {self.deleted_records['orphaned_stock_movements']} related stock movements)")
@@ -154,23 +125,18 @@ class DatabaseCleaner:
                 
         except Exception as e:
             print(f"✗ Error deleting inactive products: {e}")
-            self.connection.rollback()
             return False
 
     def get_storage_summary(self):
         """Get summary of records in database"""
         try:
-            self.cursor.execute('SELECT COUNT(*) FROM transactions')
-            billing_count = self.cursor.fetchone()[0]
+            billing_count = self.db.fetch_one('SELECT COUNT(*) FROM transactions', use_primary=True)[0]
             
-            self.cursor.execute('SELECT COUNT(*) FROM supplier_bills')
-            supplier_count = self.cursor.fetchone()[0]
+            supplier_count = self.db.fetch_one('SELECT COUNT(*) FROM supplier_bills', use_primary=True)[0]
             
-            self.cursor.execute('SELECT COUNT(*) FROM expenses')
-            expense_count = self.cursor.fetchone()[0]
+            expense_count = self.db.fetch_one('SELECT COUNT(*) FROM expenses', use_primary=True)[0]
             
-            self.cursor.execute('SELECT COUNT(*) FROM products')
-            product_count = self.cursor.fetchone()[0]
+            product_count = self.db.fetch_one('SELECT COUNT(*) FROM products', use_primary=True)[0]
             
             print("\n" + "="*50)
             print("DATABASE SUMMARY BEFORE CLEANUP:")
@@ -215,8 +181,7 @@ class DatabaseCleaner:
 
     def close(self):
         """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        self.db.close()
 
 
 def main():
@@ -0,0 +1,209 @@
+"""
+Response Compression
+gzip / Brotli for the app's responses and static files, for the counters on
+slow Wi-Fi.
+- Responses of an allowlisted type (JSON, HTML, CSS, JS, SVG, NDJSON) and at
+  least COMPRESS_MIN_BYTES long are compressed for clients that accept it:
+  Brotli when the brotli package is installed (pip install brotli), gzip
+  otherwise. Streamed responses are compressed as they stream. Server-Sent
+  Events are never compressed (they have to reach the page one at a time)
+- Static files are read and precompressed at startup (app.create_app calls
+  preload), at the highest levels, and kept in memory (they are a few small
+  files). They are reloaded if they change on disk
+- url_for('static', ...) adds the file's content hash (?v=<hash>), and a
+  request with the current hash is cached for a year (immutable): a new
+  deploy changes the URL instead of waiting for caches to expire
+"""
+
+import os
+import gzip
+import zlib
+import hashlib
+import mimetypes
+import threading
+
+from flask import request, abort, Response
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+# Cache lifetime for fingerprinted static URLs
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'image/svg+xml',
+}
+FINGERPRINT_LENGTH = 12
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for a request's accepted encodings"""
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compress a streamed body chunk by chunk"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response):
+    """after_request hook: compress the response if its type, size and the client allow it"""
+    if (request.endpoint == 'static' or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Length unknown up front: streamed bodies are the large ones, so always compress
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if response.headers.get('ETag'):
+        # A compressed body is a different representation from the plain one
+        response.set_etag(f"{response.get_etag()[0]}-{encoding}", weak=True)
+    return response
+
+
+class StaticAsset:
+    """A static file, its fingerprint and its precompressed bodies"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.mtime = os.stat(path).st_mtime
+        self.fingerprint = hashlib.sha256(self.data).hexdigest()[:FINGERPRINT_LENGTH]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.encoded = {}
+        if is_compressible(self.mimetype) and len(self.data) >= COMPRESS_MIN_BYTES:
+            encodings = [('gzip', 9)] + ([('br', 11)] if brotli is not None else [])
+            for encoding, level in encodings:
+                compressed = compress(self.data, encoding, level)
+                if len(compressed) < len(self.data):
+                    self.encoded[encoding] = compressed
+
+
+class StaticAssets:
+    """Static files by name, loaded on first use (all of them at startup) and reloaded when they change"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = {}
+        self.lock = threading.Lock()
+
+    def preload(self):
+        """Load and precompress every static file; returns how many there are"""
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                self.get(os.path.relpath(os.path.join(root, name), self.folder).replace(os.sep, '/'))
+        return len(self.assets)
+
+    def get(self, filename):
+        path = safe_join(self.folder, filename)
+        if path is None:
+            return None
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        asset = self.assets.get(filename)
+        if asset is None or asset.mtime != mtime:
+            if not os.path.isfile(path):
+                return None
+            asset = StaticAsset(path)
+            with self.lock:
+                self.assets[filename] = asset
+        return asset
+
+    def serve(self, filename):
+        """Replacement for Flask's static view"""
+        asset = self.get(filename)
+        if asset is None:
+            abort(404)
+        encoding = next((e for e in ('br', 'gzip') if e in asset.encoded and request.accept_encodings[e]), None)
+        response = Response(asset.encoded[encoding] if encoding else asset.data, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.encoded:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(asset.fingerprint + (f'-{encoding}' if encoding else ''))
+        if request.args.get('v') == asset.fingerprint:
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            # Unversioned URL: the browser revalidates with the ETag
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def url_defaults(self, endpoint, values):
+        """url_defaults hook: fingerprint url_for('static', filename=...)"""
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            asset = self.get(values['filename'])
+            if asset is not None:
+                values['v'] = asset.fingerprint
+
+
+def init_app(app):
+    """Compress app's responses and serve its static files precompressed and fingerprinted"""
+    if not COMPRESSION_ENABLED:
+        return None
+    assets = StaticAssets(app.static_folder)
+    app.extensions['compression'] = assets
+    app.view_functions['static'] = assets.serve
+    app.url_defaults(assets.url_defaults)
+    app.after_request(compress_response)
+    return assets
@@ -0,0 +1,117 @@
+"""
+Cost Prices
+Tracks what each product cost to buy so bills can carry a cost and margin.
+- Every receipt (stock add, supplier bill line, opening cost) becomes a cost
+  layer: quantity received, quantity still on hand, unit cost
+- product_costs keeps the running weighted-average cost per product
+- At sale time create_bill consumes layers oldest first and stores the
+  line's unit_cost / total_cost on transaction_items, priced by COST_METHOD:
+  FIFO (the layers consumed) or AVERAGE (weighted-average cost)
+- Reports only sum transaction_items.total_cost; nothing is re-costed later
+
+Stock with no known cost (received before cost tracking, or added without a
+cost) is priced at the average cost when there is one; otherwise the line's
+cost is left NULL and reported as uncosted.
+"""
+
+import os
+
+from database import get_ist_datetime
+
+# 'AVERAGE' (weighted-average cost) or 'FIFO'
+COST_METHOD = os.environ.get('COST_METHOD', 'AVERAGE').upper()
+
+COST_UPSERT_SQL = '''
+    INSERT INTO product_costs (product_id, avg_cost, last_cost, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (product_id) DO UPDATE SET
+        avg_cost = excluded.avg_cost,
+        last_cost = excluded.last_cost,
+        updated_at = excluded.updated_at
+'''
+LAYER_INSERT_SQL = '''
+    INSERT INTO cost_layers (product_id, quantity, remaining, unit_cost, source, source_id, received_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+OPEN_LAYERS_SQL = '''
+    SELECT id, remaining, unit_cost FROM cost_layers
+    WHERE product_id = ? AND remaining > 0
+    ORDER BY id
+'''
+
+
+def get_cost(db, product_id):
+    """(avg_cost, last_cost) for a product, or None before its first costed receipt"""
+    return db.fetch_one('SELECT avg_cost, last_cost FROM product_costs WHERE product_id = ?',
+                        (product_id,), use_primary=True)
+
+
+def record_receipt(db, product_id, quantity, unit_cost, on_hand, source='STOCK_ADD', source_id=None):
+    """Add a cost layer for received stock and fold its cost into the weighted average.
+
+    on_hand is the product's quantity before the receipt. Without a unit_cost
+    the layer is priced at the current average cost. Call inside the stock
+    update's db.transaction().
+    """
+    current = get_cost(db, product_id)
+    layer_cost = unit_cost if unit_cost is not None else (current[0] if current else None)
+    db.execute_query(LAYER_INSERT_SQL, (product_id, quantity, quantity, layer_cost, source, source_id,
+                                        get_ist_datetime()))
+    if unit_cost is None:
+        return
+    on_hand = max(on_hand, 0)
+    if current and on_hand + quantity > 0:
+        avg_cost = (on_hand * current[0] + quantity * unit_cost) / (on_hand + quantity)
+    else:
+        avg_cost = unit_cost
+    db.execute_query(COST_UPSERT_SQL, (product_id, round(avg_cost, 4), unit_cost, get_ist_datetime()))
+
+
+def consume(db, product_id, quantity):
+    """Take quantity out of the product's layers, oldest first; returns its cost under COST_METHOD or None"""
+    query = OPEN_LAYERS_SQL + (' FOR UPDATE' if db.is_postgres else '')
+    left, fifo_cost, uncosted, updates = quantity, 0.0, 0, []
+    for layer_id, remaining, unit_cost in db.fetch_all(query, (product_id,), use_primary=True):
+        if left <= 0:
+            break
+        take = min(remaining, left)
+        if unit_cost is None:
+            uncosted += take
+        else:
+            fifo_cost += take * unit_cost
+        updates.append((remaining - take, layer_id))
+        left -= take
+    db.execute_many('UPDATE cost_layers SET remaining = ? WHERE id = ?', updates)
+
+    current = get_cost(db, product_id)
+    avg_cost = current[0] if current else None
+    if COST_METHOD == 'AVERAGE' and avg_cost is not None:
+        return round(avg_cost * quantity, 2)
+    # Stock beyond the layers (or in uncosted ones) is priced at the average cost
+    uncosted += left
+    if uncosted and avg_cost is None:
+        return None
+    return round(fifo_cost + uncosted * (avg_cost or 0), 2)
+
+
+def set_opening_cost(db, product_id, unit_cost):
+    """Give stock on hand that has no cost layer a cost, and reset the average cost to it"""
+    if unit_cost < 0:
+        raise ValueError("unit_cost must not be negative")
+    with db.transaction():
+        row = db.fetch_one('''
+            SELECT p.quantity, COALESCE((SELECT SUM(remaining) FROM cost_layers c
+                                         WHERE c.product_id = p.id AND c.remaining > 0), 0)
+            FROM products p WHERE p.id = ?
+        ''', (product_id,), use_primary=True)
+        if not row:
+            raise ValueError("Product not found")
+        # Uncosted layers on hand take the opening cost too
+        db.execute_query('UPDATE cost_layers SET unit_cost = ? WHERE product_id = ? AND remaining > 0 '
+                         'AND unit_cost IS NULL', (unit_cost, product_id))
+        uncovered = row[0] - row[1]
+        if uncovered > 0:
+            db.execute_query(LAYER_INSERT_SQL, (product_id, uncovered, uncovered, unit_cost, 'OPENING', None,
+                                                get_ist_datetime()))
+        db.execute_query(COST_UPSERT_SQL, (product_id, unit_cost, unit_cost, get_ist_datetime()))
+    return True
@@ -1,6 +1,17 @@
+import io
 import os
+import re
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from itertools import islice
 from datetime import datetime, timedelta
 import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+import profiler
+import metrics
 
 # Check if running on Render with PostgreSQL
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -8,11 +19,40 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 # Lazy import psycopg2 only when needed
 psycopg2 = None
 sql = None
+extras = None
 
 if not DATABASE_URL:
     # Use SQLite for local development
     DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'electrical_shop.db')
 
+# Statement cache settings
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', '512'))
+SQLITE_CACHED_STATEMENTS = int(os.environ.get('SQLITE_CACHED_STATEMENTS', '256'))
+# Server-side PREPARE once a statement repeats this many times on a connection (0 = never)
+PG_PREPARE_THRESHOLD = int(os.environ.get('PG_PREPARE_THRESHOLD', '2'))
+PREPARABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'VALUES')
+
+# Read routing: fetch_all/fetch_one go to a read-only connection (a replica DSN on
+# PostgreSQL, a mode=ro connection on SQLite in WAL mode) until the instance writes
+READ_REPLICA_URL = os.environ.get('READ_REPLICA_URL')
+DB_READ_ROUTING = os.environ.get('DB_READ_ROUTING', '1') == '1'
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+
+# Connection pool: Database() borrows a connection and close() hands it back, so a
+# request doesn't open a new one. Up to DB_POOL_SIZE idle connections are kept per
+# database per process (threaded workers each need one per busy thread)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+
+# Bulk writes (bulk_insert / bulk_upsert): rows per COPY, execute_values page or
+# executemany call, all inside one transaction
+BULK_CHUNK_ROWS = int(os.environ.get('BULK_CHUNK_ROWS', '1000'))
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Databases whose tables this process has already created: the DDL runs on the
+# first connection only (see init_schema), not on every Database()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
 def get_ist_datetime():
     """Get current datetime in IST (GMT +5:30)"""
     utc_now = datetime.utcnow()
@@ -20,35 +60,260 @@ def get_ist_datetime():
     ist_now = utc_now + ist_offset
     return ist_now.strftime("%Y-%m-%d %H:%M:%S")
 
+
+def split_placeholders(query):
+    """Split SQL on ? placeholders, ignoring any inside quoted strings"""
+    parts = []
+    current = []
+    quote = None
+    for ch in query:
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            current.append(ch)
+        elif ch == '?':
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def translate_placeholders(query):
+    """SQLite ? placeholders -> psycopg2 %s placeholders (cached per SQL string)"""
+    return '%s'.join(part.replace('%', '%%') for part in split_placeholders(query))
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def numbered_placeholders(query):
+    """SQLite ? placeholders -> PostgreSQL $1, $2, ... placeholders"""
+    parts = split_placeholders(query)
+    return parts[0] + ''.join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def prepared_statement(query):
+    """(name, PREPARE sql, EXECUTE sql) for a server-side prepared statement, or None"""
+    stripped = query.lstrip()
+    if not stripped.upper().startswith(PREPARABLE_STATEMENTS):
+        return None
+    param_count = len(split_placeholders(query)) - 1
+    name = 'stmt_' + hashlib.md5(query.encode()).hexdigest()[:16]
+    args = ', '.join(['%s'] * param_count)
+    execute = f"EXECUTE {name} ({args})" if args else f"EXECUTE {name}"
+    return name, f"PREPARE {name} AS {numbered_placeholders(query)}", execute
+
+
+def chunked(rows, size):
+    """Lists of up to size rows from any iterable (a generator streams)"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def check_identifiers(*names):
+    """Table and column names are spliced into bulk SQL: allow plain identifiers only"""
+    for name in names:
+        if not IDENTIFIER.match(name):
+            raise ValueError(f"Invalid table or column name: {name!r}")
+
+
+def _copy_value(value):
+    """One field of COPY ... (FORMAT csv): unquoted empty is NULL, text is always quoted"""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_csv(rows):
+    """Rows as the CSV text COPY FROM STDIN reads"""
+    return ''.join(','.join(map(_copy_value, row)) + '\n' for row in rows)
+
+
+class PooledConnection:
+    """A connection and its per-connection state, which travel together through the pool"""
+    __slots__ = ('connection', 'statements')
+
+    def __init__(self, connection):
+        self.connection = connection
+        # PostgreSQL prepared statements live in the session: (use counts, prepared names)
+        self.statements = ({}, set())
+
+
+class ConnectionPool:
+    """Idle connections by database, shared by this process's threads.
+
+    A connection is used by one Database (so one thread) at a time: Database()
+    takes it out of the pool and close() puts it back.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.pid = os.getpid()
+        self._inherited = []
+
+    def get(self, key, connect):
+        with self.lock:
+            self._after_fork()
+            idle = self.idle.get(key)
+            pooled = idle.pop() if idle else None
+        if pooled is not None:
+            metrics.CACHE_REQUESTS.inc(cache='db_pool', result='hit')
+            return pooled
+        metrics.CACHE_REQUESTS.inc(cache='db_pool', result='miss')
+        connection = connect()
+        if connection is None:
+            return None
+        metrics.DB_CONNECTIONS_OPEN.inc()
+        return PooledConnection(connection)
+
+    def put(self, key, pooled):
+        """Give a connection back, rolled back to a clean state; closed if that fails or the pool is full"""
+        connection = pooled.connection
+        try:
+            if getattr(connection, 'closed', 0):
+                raise ConnectionError('connection is closed')
+            connection.rollback()
+        except Exception:
+            self._close(pooled)
+            return
+        with self.lock:
+            self._after_fork()
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append(pooled)
+                return
+        self._close(pooled)
+
+    def clear(self):
+        """Close this process's idle connections (e.g. in gunicorn's master before it forks)"""
+        with self.lock:
+            self._after_fork()
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for pooled in connections:
+                self._close(pooled)
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+        metrics.DB_CONNECTIONS_OPEN.dec()
+
+    def _after_fork(self):
+        if self.pid != os.getpid():
+            # Connections inherited from the parent process are still its connections:
+            # keep them referenced (closing them here would close them for the parent too)
+            self._inherited.append(self.idle)
+            self.idle = {}
+            self.pid = os.getpid()
+
+
+_pool = ConnectionPool(DB_POOL_SIZE)
+
+
+def _connect_primary():
+    if DATABASE_URL:
+        try:
+            return psycopg2.connect(DATABASE_URL)
+        except Exception as e:
+            print(f"PostgreSQL connection error: {e}")
+            raise
+    # check_same_thread=False: a pooled connection moves between threads, one at a time
+    connection = sqlite3.connect(DB_PATH, check_same_thread=False,
+                                 cached_statements=SQLITE_CACHED_STATEMENTS)
+    if SQLITE_WAL:
+        # Readers and the writer no longer block each other
+        connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+def _connect_read_only():
+    """Connect to the read replica / read-only SQLite URI, or None if not configured"""
+    if DATABASE_URL:
+        if not READ_REPLICA_URL:
+            return None
+        connection = psycopg2.connect(READ_REPLICA_URL)
+        # Reads only; don't hold a snapshot open between statements
+        connection.autocommit = True
+        return connection
+    if not SQLITE_WAL:
+        return None
+    uri = Path(DB_PATH).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True, check_same_thread=False,
+                           cached_statements=SQLITE_CACHED_STATEMENTS)
+
+
 class Database:
+    """One unit of work on a pooled connection; use it from one thread, then close() it.
+
+    Every statement runs on its own cursor, so no cursor state is shared between operations.
+    """
+
     def __init__(self):
-        self.connection = None
-        self.cursor = None
         self.is_postgres = bool(DATABASE_URL)
+        if self.is_postgres:
+            # Lazy import psycopg2 only when needed
+            global psycopg2, sql, extras
+            import psycopg2
+            from psycopg2 import sql, extras
+        self._primary = None
+        self.connection = None
+        # Read-only connection, borrowed on the first routed read
+        self._reader = None
+        self._read_unavailable = False
+        # Set after the first write so later reads see it (read-your-writes)
+        self.has_written = False
+        # Inside transaction(): statements don't commit; callbacks run just before / after the commit
+        self._in_transaction = False
+        self._before_commit = []
+        self._after_commit = []
         self.init_database()
 
     def init_database(self):
-        """Initialize database and create tables"""
+        """Borrow a connection, and create the tables on this process's first connection to the database"""
+        self._primary = _pool.get(self._pool_key('primary'), _connect_primary)
+        self.connection = self._primary.connection
+
+        key = self._schema_key()
+        if key not in _schema_ready:
+            with _schema_lock:
+                # Threads that connect together wait for the first one's DDL
+                if key not in _schema_ready:
+                    self.create_tables()
+                    _schema_ready.add(key)
+
+    def _pool_key(self, role):
         if self.is_postgres:
-            # Lazy import psycopg2 only when needed
-            global psycopg2, sql
-            import psycopg2
-            from psycopg2 import sql
-            
-            try:
-                self.connection = psycopg2.connect(DATABASE_URL)
-                self.cursor = self.connection.cursor()
-            except Exception as e:
-                print(f"PostgreSQL connection error: {e}")
-                raise
-        else:
-            self.connection = sqlite3.connect(DB_PATH, check_same_thread=False)
-            self.cursor = self.connection.cursor()
-        
+            return role, READ_REPLICA_URL if role == 'read' else DATABASE_URL
+        return role, DB_PATH
+
+    def _schema_key(self):
+        if self.is_postgres:
+            return DATABASE_URL
+        # A file that is deleted and created again gets its tables again
+        return DB_PATH, os.stat(DB_PATH).st_ino
+
+    def create_tables(self):
+        """Create tables and indexes, and add newer columns (idempotent)"""
+        cursor = self.connection.cursor()
         try:
             # Products table
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS products (
                         id SERIAL PRIMARY KEY,
                         name TEXT NOT NULL UNIQUE,
@@ -60,7 +325,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS products (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT NOT NULL UNIQUE,
@@ -80,7 +345,7 @@ class Database:
         # Stock movements table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS stock_movements (
                         id SERIAL PRIMARY KEY,
                         product_id INTEGER NOT NULL,
@@ -93,7 +358,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS stock_movements (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         product_id INTEGER NOT NULL,
@@ -105,6 +370,9 @@ class Database:
                         FOREIGN KEY (product_id) REFERENCES products(id)
                     )
                 ''')
+            # Point-in-time stock (stock.get_stock_as_of) scans movements by time range
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_created ON stock_movements (created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements (product_id, created_at)')
             self.connection.commit()
             print("✓ Stock movements table created")
         except Exception as e:
@@ -113,7 +381,7 @@ class Database:
         # Transactions/Bills table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS transactions (
                         id SERIAL PRIMARY KEY,
                         customer_name TEXT NOT NULL,
@@ -131,7 +399,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS transactions (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         customer_name TEXT NOT NULL,
@@ -148,6 +416,8 @@ class Database:
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
+            # Date-range reports (profit report)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at)')
             self.connection.commit()
             print("✓ Transactions table created")
         except Exception as e:
@@ -156,7 +426,7 @@ class Database:
         # Transaction items table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS transaction_items (
                         id SERIAL PRIMARY KEY,
                         transaction_id INTEGER NOT NULL,
@@ -169,7 +439,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS transaction_items (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         transaction_id INTEGER NOT NULL,
@@ -181,6 +451,7 @@ class Database:
                         FOREIGN KEY (transaction_id) REFERENCES transactions(id)
                     )
                 ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_items_transaction ON transaction_items (transaction_id)')
             self.connection.commit()
             print("✓ Transaction items table created")
         except Exception as e:
@@ -189,7 +460,7 @@ class Database:
         # Expenses table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS expenses (
                         id SERIAL PRIMARY KEY,
                         category TEXT NOT NULL,
@@ -200,7 +471,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS expenses (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         category TEXT NOT NULL,
@@ -218,7 +489,7 @@ class Database:
         # Supplier Bills table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS supplier_bills (
                         id SERIAL PRIMARY KEY,
                         supplier_name TEXT NOT NULL,
@@ -234,7 +505,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS supplier_bills (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         supplier_name TEXT NOT NULL,
@@ -257,7 +528,7 @@ class Database:
         # Supplier Bill Payments table
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS supplier_bill_payments (
                         id SERIAL PRIMARY KEY,
                         bill_id INTEGER NOT NULL,
@@ -269,7 +540,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS supplier_bill_payments (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         bill_id INTEGER NOT NULL,
@@ -288,7 +559,7 @@ class Database:
         # Credit Bill Payments table (for wholesale credit customers)
         try:
             if self.is_postgres:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS credit_bill_payments (
                         id SERIAL PRIMARY KEY,
                         transaction_id INTEGER NOT NULL,
@@ -300,7 +571,7 @@ class Database:
                     )
                 ''')
             else:
-                self.cursor.execute('''
+                cursor.execute('''
                     CREATE TABLE IF NOT EXISTS credit_bill_payments (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         transaction_id INTEGER NOT NULL,
@@ -316,84 +587,614 @@ class Database:
         except Exception as e:
             print(f"Credit bill payments table: {e}")
 
+        # Background job runs table (history for the job scheduler)
+        try:
+            if self.is_postgres:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS job_runs (
+                        id SERIAL PRIMARY KEY,
+                        job_name TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'RUNNING',
+                        started_at TEXT NOT NULL,
+                        finished_at TEXT,
+                        duration_ms REAL,
+                        message TEXT,
+                        worker_pid INTEGER
+                    )
+                ''')
+            else:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS job_runs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_name TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'RUNNING',
+                        started_at TEXT NOT NULL,
+                        finished_at TEXT,
+                        duration_ms REAL,
+                        message TEXT,
+                        worker_pid INTEGER
+                    )
+                ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_runs_name ON job_runs (job_name, id)')
+            self.connection.commit()
+            print("✓ Job runs table created")
+        except Exception as e:
+            print(f"Job runs table: {e}")
+
+        # Daily sales counters per product (sales_velocity.py, updated by create_bill)
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS product_daily_sales (
+                    product_id INTEGER NOT NULL,
+                    sale_date TEXT NOT NULL,
+                    quantity INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (product_id, sale_date)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_daily_sales_date ON product_daily_sales (sale_date)')
+            # Covering index for per-product window sums (reorder.py)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_daily_sales_window ON product_daily_sales (product_id, sale_date, quantity)')
+            self.connection.commit()
+            print("✓ Product daily sales table created")
+        except Exception as e:
+            print(f"Product daily sales table: {e}")
+            self.connection.rollback()
+
+        # Stock snapshots (every product's quantity once a day, for point-in-time stock)
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stock_snapshots (
+                    snapshot_date TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    unit_price REAL NOT NULL,
+                    taken_at TEXT NOT NULL,
+                    PRIMARY KEY (snapshot_date, product_id)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_snapshots_taken ON stock_snapshots (taken_at)')
+            self.connection.commit()
+            print("✓ Stock snapshots table created")
+        except Exception as e:
+            print(f"Stock snapshots table: {e}")
+            self.connection.rollback()
+
+        # Stock ledger (per-product movement totals kept by reconciliation.py, up to a watermark)
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stock_ledger (
+                    product_id INTEGER PRIMARY KEY,
+                    opening_quantity INTEGER NOT NULL,
+                    movement_total INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stock_ledger_state (
+                    id INTEGER PRIMARY KEY,
+                    last_movement_id INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            self.connection.commit()
+            print("✓ Stock ledger tables created")
+        except Exception as e:
+            print(f"Stock ledger tables: {e}")
+            self.connection.rollback()
+
+        # Reorder engine (reorder.py): per-product lead times, suggestions and the run watermark
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reorder_settings (
+                    product_id INTEGER PRIMARY KEY,
+                    supplier_name TEXT,
+                    lead_time_days INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reorder_suggestions (
+                    product_id INTEGER PRIMARY KEY,
+                    quantity INTEGER NOT NULL,
+                    units_per_day REAL NOT NULL,
+                    days_of_cover REAL,
+                    lead_time_days INTEGER NOT NULL,
+                    reorder_point INTEGER NOT NULL,
+                    suggested_quantity INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    computed_at TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_suggestions_status ON reorder_suggestions (status)')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reorder_state (
+                    id INTEGER PRIMARY KEY,
+                    last_movement_id INTEGER NOT NULL,
+                    full_run_date TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            self.connection.commit()
+            print("✓ Reorder tables created")
+        except Exception as e:
+            print(f"Reorder tables: {e}")
+            self.connection.rollback()
+
+        # Cost prices (costing.py): receipt layers and each product's weighted-average cost
+        try:
+            if self.is_postgres:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS cost_layers (
+                        id SERIAL PRIMARY KEY,
+                        product_id INTEGER NOT NULL,
+                        quantity INTEGER NOT NULL,
+                        remaining INTEGER NOT NULL,
+                        unit_cost REAL,
+                        source TEXT NOT NULL,
+                        source_id INTEGER,
+                        received_at TEXT NOT NULL
+                    )
+                ''')
+            else:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS cost_layers (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        product_id INTEGER NOT NULL,
+                        quantity INTEGER NOT NULL,
+                        remaining INTEGER NOT NULL,
+                        unit_cost REAL,
+                        source TEXT NOT NULL,
+                        source_id INTEGER,
+                        received_at TEXT NOT NULL
+                    )
+                ''')
+            # Only layers with stock left are ever walked
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cost_layers_open ON cost_layers (product_id, id) WHERE remaining > 0')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS product_costs (
+                    product_id INTEGER PRIMARY KEY,
+                    avg_cost REAL NOT NULL,
+                    last_cost REAL NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            self.connection.commit()
+            print("✓ Cost tables created")
+        except Exception as e:
+            print(f"Cost tables: {e}")
+            self.connection.rollback()
+
+        # Cost of each bill line, fixed at sale time
+        for column in ('unit_cost REAL', 'total_cost REAL'):
+            try:
+                cursor.execute(f"ALTER TABLE transaction_items ADD COLUMN {column}")
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()  # Column already exists
+
+        # Idempotency keys for bill submission (idempotency.py)
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    idem_key TEXT PRIMARY KEY,
+                    request_hash TEXT NOT NULL,
+                    bill_number TEXT NOT NULL,
+                    status_code INTEGER,
+                    response TEXT,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)')
+            self.connection.commit()
+            print("✓ Idempotency keys table created")
+        except Exception as e:
+            print(f"Idempotency keys table: {e}")
+            self.connection.rollback()
+
+        # Change log of the managers' writes, for incremental consumers (change_log.py)
+        try:
+            if self.is_postgres:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS change_log (
+                        seq BIGSERIAL PRIMARY KEY,
+                        table_name TEXT NOT NULL,
+                        row_id INTEGER,
+                        op TEXT NOT NULL,
+                        payload TEXT,
+                        created_at TEXT NOT NULL
+                    )
+                ''')
+            else:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS change_log (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        table_name TEXT NOT NULL,
+                        row_id INTEGER,
+                        op TEXT NOT NULL,
+                        payload TEXT,
+                        created_at TEXT NOT NULL
+                    )
+                ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log (created_at)')
+            self.connection.commit()
+            print("✓ Change log table created")
+        except Exception as e:
+            print(f"Change log table: {e}")
+            self.connection.rollback()
+
         # Add columns to existing transactions table if they don't exist
         try:
-            self.cursor.execute("ALTER TABLE transactions ADD COLUMN bill_type TEXT DEFAULT 'REGULAR'")
+            cursor.execute("ALTER TABLE transactions ADD COLUMN bill_type TEXT DEFAULT 'REGULAR'")
         except:
             pass  # Column already exists
         
         try:
-            self.cursor.execute("ALTER TABLE transactions ADD COLUMN is_credit INTEGER DEFAULT 0")
+            cursor.execute("ALTER TABLE transactions ADD COLUMN is_credit INTEGER DEFAULT 0")
         except:
             pass  # Column already exists
         
         try:
-            self.cursor.execute("ALTER TABLE transactions ADD COLUMN is_replacement INTEGER DEFAULT 0")
+            cursor.execute("ALTER TABLE transactions ADD COLUMN is_replacement INTEGER DEFAULT 0")
         except:
             pass  # Column already exists
 
         try:
-            self.cursor.execute("ALTER TABLE transactions ADD COLUMN received_amount REAL DEFAULT 0")
+            cursor.execute("ALTER TABLE transactions ADD COLUMN received_amount REAL DEFAULT 0")
         except:
             pass  # Column already exists
 
         try:
-            self.cursor.execute("ALTER TABLE transactions ADD COLUMN credit_status TEXT DEFAULT 'UNPAID'")
+            cursor.execute("ALTER TABLE transactions ADD COLUMN credit_status TEXT DEFAULT 'UNPAID'")
         except:
             pass  # Column already exists
 
         self.connection.commit()
+        cursor.close()
 
     def close(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        """Hand the connections back to the pool"""
+        if self._reader is not None:
+            _pool.put(self._pool_key('read'), self._reader)
+            self._reader = None
+        if self._primary is not None:
+            _pool.put(self._pool_key('primary'), self._primary)
+            self._primary = None
+            self.connection = None
+
+    def _read_connection_for(self, use_primary):
+        """Pooled connection a read should use: read-only unless told otherwise, after a write or in a transaction"""
+        if (use_primary or self.has_written or self._in_transaction or not DB_READ_ROUTING
+                or self._read_unavailable):
+            metrics.DB_READS.inc(target='primary')
+            return self._primary
+        if self._reader is None:
+            try:
+                self._reader = _pool.get(self._pool_key('read'), _connect_read_only)
+            except Exception as e:
+                print(f"Read-only connection unavailable, using primary: {e}")
+            if self._reader is None:
+                self._read_unavailable = True
+                metrics.DB_READS.inc(target='primary')
+                return self._primary
+        metrics.DB_READS.inc(target='read_only')
+        return self._reader
+
+    def _execute_raw(self, statement):
+        """Run a statement with no parameters and no statement cache (DDL, savepoints)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    def optimize(self, vacuum=False):
+        """Refresh planner statistics; optionally reclaim free space with VACUUM"""
+        if self.is_postgres:
+            # VACUUM cannot run inside a transaction block
+            self.connection.commit()
+            self.connection.autocommit = True
+            try:
+                self._execute_raw('VACUUM ANALYZE' if vacuum else 'ANALYZE')
+            finally:
+                self.connection.autocommit = False
+        else:
+            self._execute_raw('PRAGMA optimize')
+            self.connection.commit()
+            if vacuum:
+                self._execute_raw('VACUUM')
+
+    def _run(self, query, params, pooled=None):
+        """Execute one statement on a new cursor of the pooled connection (the primary by default) and return the cursor"""
+        pooled = pooled or self._primary
+        cursor = pooled.connection.cursor()
+        try:
+            if not params:
+                cursor.execute(query)
+            elif not self.is_postgres:
+                cursor.execute(query, params)
+            else:
+                prepared = self._prepare(query, cursor, pooled.statements)
+                if prepared:
+                    cursor.execute(prepared, params)
+                else:
+                    cursor.execute(translate_placeholders(query), params)
+        except Exception:
+            cursor.close()
+            raise
+        return cursor
+
+    def _prepare(self, query, cursor, statements):
+        """EXECUTE sql for a statement prepared on the cursor's connection, or None"""
+        if PG_PREPARE_THRESHOLD <= 0:
+            return None
+        statement = prepared_statement(query)
+        if statement is None:
+            return None
+        name, prepare_sql, execute_sql = statement
+        uses, prepared = statements
+        if name in prepared:
+            metrics.CACHE_REQUESTS.inc(cache='pg_prepared', result='hit')
+            return execute_sql
+        uses[name] = uses.get(name, 0) + 1
+        if uses[name] < PG_PREPARE_THRESHOLD:
+            return None
+        metrics.CACHE_REQUESTS.inc(cache='pg_prepared', result='miss')
+        # A failed PREPARE aborts the transaction; a savepoint keeps it usable
+        in_transaction = not cursor.connection.autocommit
+        if in_transaction:
+            cursor.execute('SAVEPOINT prepare_statement')
+        try:
+            cursor.execute(prepare_sql)
+        except Exception as e:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT prepare_statement')
+            uses[name] = -(1 << 30)  # never retry on this connection
+            print(f"Statement not prepared ({name}): {e}")
+            return None
+        finally:
+            if in_transaction:
+                cursor.execute('RELEASE SAVEPOINT prepare_statement')
+        prepared.add(name)
+        return execute_sql
+
+    @contextmanager
+    def transaction(self):
+        """Run the block's statements with a single commit; roll back if it raises.
+
+        Inside the block execute_query raises on errors instead of returning False.
+        Nested blocks join the outer transaction.
+        """
+        if self._in_transaction:
+            yield self
+            return
+        self._in_transaction = True
+        try:
+            yield self
+            for callback in self._before_commit:
+                callback()
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            self._after_commit = []
+            raise
+        finally:
+            self._in_transaction = False
+            self._before_commit = []
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    @contextmanager
+    def savepoint(self, name='bill'):
+        """Inside transaction(): if the block raises, undo just its statements and re-raise"""
+        before, after = len(self._before_commit), len(self._after_commit)
+        if not self.is_postgres and not self.connection.in_transaction:
+            # sqlite3 doesn't BEGIN before a SAVEPOINT, which would then open (and its RELEASE
+            # commit) a transaction of its own; IMMEDIATE takes the write lock the block needs
+            self._execute_raw('BEGIN IMMEDIATE')
+        self._execute_raw(f'SAVEPOINT {name}')
+        try:
+            yield self
+        except Exception:
+            self._execute_raw(f'ROLLBACK TO SAVEPOINT {name}')
+            self._execute_raw(f'RELEASE SAVEPOINT {name}')
+            del self._before_commit[before:]
+            del self._after_commit[after:]
+            raise
+        self._execute_raw(f'RELEASE SAVEPOINT {name}')
+
+    def before_commit(self, callback):
+        """Run callback as the last step of the current transaction, before its commit (now if there is none)"""
+        if self._in_transaction:
+            self._before_commit.append(callback)
+        else:
+            callback()
+
+    def after_commit(self, callback):
+        """Run callback once the current transaction commits (now if there is none)"""
+        if self._in_transaction:
+            self._after_commit.append(callback)
+        else:
+            callback()
 
     def execute_query(self, query, params=None):
         """Execute a query"""
+        return self.execute_rowcount(query, params) is not None
+
+    def execute_rowcount(self, query, params=None):
+        """Execute a query and return how many rows it changed (None if it fails outside a transaction)"""
+        start = time.perf_counter()
         try:
-            # Convert SQLite placeholders to PostgreSQL placeholders if needed
-            if self.is_postgres and params:
-                query = query.replace('?', '%s')
-            
-            if params:
-                self.cursor.execute(query, params)
+            cursor = self._run(query, params)
+            rowcount = cursor.rowcount
+            cursor.close()
+            if not self._in_transaction:
+                self.connection.commit()
+            self.has_written = True
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, rowcount)
+            return rowcount
+        except Exception as e:
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 0, error=e)
+            if self._in_transaction:
+                raise
+            print(f"Error executing query: {e}")
+            return None
+
+    def execute_insert(self, query, params=None):
+        """Execute an INSERT and return the new row's id (None if it fails outside a transaction)"""
+        start = time.perf_counter()
+        try:
+            if self.is_postgres:
+                cursor = self._run(query.rstrip() + ' RETURNING id', params)
+                row_id = cursor.fetchone()[0]
             else:
-                self.cursor.execute(query)
-            self.connection.commit()
+                cursor = self._run(query, params)
+                row_id = cursor.lastrowid
+            cursor.close()
+            if not self._in_transaction:
+                self.connection.commit()
+            self.has_written = True
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 1)
+            return row_id
+        except Exception as e:
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 0, error=e)
+            if self._in_transaction:
+                raise
+            print(f"Error executing query: {e}")
+            return None
+
+    def execute_many(self, query, params_seq):
+        """Execute one statement once per parameter tuple (a single round trip per batch)"""
+        params_seq = list(params_seq)
+        if not params_seq:
+            return True
+        start = time.perf_counter()
+        try:
+            cursor = self.connection.cursor()
+            try:
+                cursor.executemany(translate_placeholders(query) if self.is_postgres else query, params_seq)
+            finally:
+                cursor.close()
+            if not self._in_transaction:
+                self.connection.commit()
+            self.has_written = True
+            profiler.record_query(query, params_seq[0], (time.perf_counter() - start) * 1000, len(params_seq))
             return True
         except Exception as e:
+            profiler.record_query(query, params_seq[0], (time.perf_counter() - start) * 1000, 0, error=e)
+            if self._in_transaction:
+                raise
             print(f"Error executing query: {e}")
             return False
 
-    def fetch_all(self, query, params=None):
-        """Fetch all results"""
+    def bulk_insert(self, table, columns, rows, chunk_rows=None):
+        """Insert many rows (any iterable, streamed in chunks) in one transaction.
+
+        COPY FROM STDIN on PostgreSQL, executemany per chunk on SQLite; chunk_rows defaults
+        to BULK_CHUNK_ROWS. Returns the row count; like execute_insert, None if it fails
+        outside a transaction (nothing is kept).
+        """
+        columns = tuple(columns)
+        check_identifiers(table, *columns)
+        if self.is_postgres:
+            statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            write = lambda cursor, chunk: cursor.copy_expert(statement, io.StringIO(copy_csv(chunk)))
+        else:
+            statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+            write = lambda cursor, chunk: cursor.executemany(statement, chunk)
+        return self._bulk_write(statement, rows, write, chunk_rows)
+
+    def bulk_upsert(self, table, columns, rows, conflict_columns, update_columns=None, chunk_rows=None):
+        """Insert many rows, updating the ones that clash on conflict_columns, in one transaction.
+
+        update_columns (default: every column not in conflict_columns) take the new row's
+        values; none means existing rows are kept as they are. execute_values on
+        PostgreSQL (one multi-row INSERT per chunk), executemany on SQLite. Returns the
+        number of rows sent; None if it fails outside a transaction.
+        """
+        columns, conflict_columns = tuple(columns), tuple(conflict_columns)
+        if update_columns is None:
+            update_columns = [column for column in columns if column not in conflict_columns]
+        check_identifiers(table, *columns, *conflict_columns, *update_columns)
+        if update_columns:
+            action = 'DO UPDATE SET ' + ', '.join(f"{column} = excluded.{column}" for column in update_columns)
+        else:
+            action = 'DO NOTHING'
+        conflict = f"ON CONFLICT ({', '.join(conflict_columns)}) {action}"
+        if self.is_postgres:
+            statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {conflict}"
+            write = lambda cursor, chunk: extras.execute_values(cursor, statement, chunk, page_size=len(chunk))
+        else:
+            statement = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                         f"{conflict}")
+            write = lambda cursor, chunk: cursor.executemany(statement, chunk)
+        return self._bulk_write(statement, rows, write, chunk_rows)
+
+    def _bulk_write(self, statement, rows, write, chunk_rows=None):
+        """Run write(cursor, chunk) per chunk of rows inside one transaction (joining the caller's)"""
+        outer = self._in_transaction
+        start = time.perf_counter()
+        count = 0
         try:
-            # Convert SQLite placeholders to PostgreSQL placeholders if needed
-            if self.is_postgres and params:
-                query = query.replace('?', '%s')
-                
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            return self.cursor.fetchall()
+            with self.transaction():
+                cursor = self.connection.cursor()
+                try:
+                    for chunk in chunked(rows, chunk_rows or BULK_CHUNK_ROWS):
+                        write(cursor, chunk)
+                        count += len(chunk)
+                finally:
+                    cursor.close()
+            self.has_written = True
+            profiler.record_query(statement, None, (time.perf_counter() - start) * 1000, count)
+            return count
+        except Exception as e:
+            profiler.record_query(statement, None, (time.perf_counter() - start) * 1000, 0, error=e)
+            if outer:
+                raise
+            print(f"Error in bulk write: {e}")
+            return None
+
+    def fetch_all(self, query, params=None, use_primary=False):
+        """Fetch all results; use_primary=True skips the read-only connection"""
+        start = time.perf_counter()
+        try:
+            cursor = self._run(query, params, self._read_connection_for(use_primary))
+            rows = cursor.fetchall()
+            cursor.close()
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, len(rows))
+            return rows
         except Exception as e:
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 0, error=e)
             print(f"Error fetching data: {e}")
             return []
 
-    def fetch_one(self, query, params=None):
-        """Fetch single result"""
+    def fetch_one(self, query, params=None, use_primary=False):
+        """Fetch single result; use_primary=True skips the read-only connection"""
+        start = time.perf_counter()
         try:
-            # Convert SQLite placeholders to PostgreSQL placeholders if needed
-            if self.is_postgres and params:
-                query = query.replace('?', '%s')
-                
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            return self.cursor.fetchone()
+            cursor = self._run(query, params, self._read_connection_for(use_primary))
+            row = cursor.fetchone()
+            cursor.close()
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 1 if row else 0)
+            return row
         except Exception as e:
+            profiler.record_query(query, params, (time.perf_counter() - start) * 1000, 0, error=e)
             print(f"Error fetching data: {e}")
             return None
+
+def init_schema():
+    """Create the tables now (once per process), e.g. before gunicorn forks its workers"""
+    Database().close()
+    # Workers must not inherit the connection it used
+    close_pool()
+
+
+def close_pool():
+    """Close this process's idle pooled connections"""
+    _pool.clear()
+
+
+def reset_schema_cache():
+    """Run the DDL again on the next connection (after restoring an older database)"""
+    _schema_ready.clear()
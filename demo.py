@@ -113,7 +113,7 @@ def demo():
         print(f"{'ID':<5} {'Name':<25} {'Current':<10} {'Min Stock':<10}")
         print("-"*50)
         for product in low_stock:
-            product_id, name, _, _, qty, min_stock_level, _ = product
+            product_id, name, _, _, qty, min_stock_level, *_ = product
             print(f"{product_id:<5} {name:<25} {qty:<10} {min_stock_level:<10}")
     else:
         print("No low stock products at the moment")
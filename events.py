@@ -0,0 +1,345 @@
+"""
+Live Events
+Publish/subscribe bus behind /api/events (Server-Sent Events). Managers
+publish small deltas once their transaction commits, and open pages apply
+them instead of re-fetching /api/dashboard or /api/stock-report:
+    bill     bill summary, plus the new quantity of each product sold
+    stock    product id, new quantity and the change (stock add/remove)
+    payment  credit payment and the bills it was applied to
+
+Fan-out across gunicorn workers (EVENTS_BACKEND):
+- 'postgres' (default with DATABASE_URL): NOTIFY on EVENTS_CHANNEL, and
+  every worker with an open stream LISTENs on its own connection
+- 'file' (default otherwise): events are appended to EVENTS_DIR/events.log
+  and every worker with an open stream tails it; a worker with open streams
+  holds a shared lock on EVENTS_DIR/listeners.lock, and while nobody does,
+  events aren't written at all
+- 'local': this process only (single worker, or the dev server)
+
+Each worker keeps its last EVENTS_BACKLOG events, so a browser that
+reconnects to the same worker (Last-Event-ID) gets what it missed; otherwise
+it gets a 'reset' event and re-fetches once.
+"""
+
+import os
+import json
+import time
+import queue
+import fcntl
+import select
+import secrets
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', '1') == '1'
+EVENTS_BACKEND = os.environ.get(
+    'EVENTS_BACKEND', 'postgres' if os.environ.get('DATABASE_URL') else 'file').lower()
+EVENTS_DIR = os.environ.get('EVENTS_DIR', os.path.join(os.path.dirname(__file__), 'data', 'events'))
+EVENTS_CHANNEL = os.environ.get('EVENTS_CHANNEL', 'shop_events')
+EVENTS_POLL_MS = int(os.environ.get('EVENTS_POLL_MS', '100'))
+EVENTS_MAX_BYTES = int(os.environ.get('EVENTS_MAX_BYTES', str(1024 * 1024)))
+EVENTS_BACKLOG = int(os.environ.get('EVENTS_BACKLOG', '500'))
+# Streams hold a worker thread each: cap them per worker, and end each one after
+# EVENTS_STREAM_SECONDS (the browser reconnects by itself)
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', '4'))
+EVENTS_STREAM_SECONDS = int(os.environ.get('EVENTS_STREAM_SECONDS', '300'))
+EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', '3000'))
+
+SUBSCRIBER_QUEUE_SIZE = 256
+# NOTIFY payloads must stay under 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7900
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+class Subscription:
+    """One open stream's queue of events"""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.lock = threading.Lock()
+
+    def get(self, timeout):
+        """Next (id, type, data) event, or None after timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, event):
+        with self.lock:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                # Too far behind to catch up with deltas: drop them and start again from a reset
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait((event[0], 'reset', {'reason': 'overflow'}))
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, backend=None):
+        self.backend = backend or EVENTS_BACKEND
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.backlog = deque(maxlen=EVENTS_BACKLOG)
+        # Event ids are '<token>-<seq>', local to this process
+        self.token = secrets.token_hex(4)
+        self.seq = 0
+        self._listener = None
+        self._notify_conn = None
+        self._notify_lock = threading.Lock()
+        self.path = os.path.join(EVENTS_DIR, 'events.log')
+        self.listeners_path = os.path.join(EVENTS_DIR, 'listeners.lock')
+        # Held with a shared lock while this worker has open streams (file backend)
+        self._listening = None
+
+    # ---- publishing ----
+
+    def publish(self, event_type, data):
+        """Send an event to every open stream (in every worker); never raises"""
+        metrics.EVENTS_PUBLISHED.inc(type=event_type)
+        payload = json.dumps({'type': event_type, 'data': data}, separators=(',', ':'), default=str)
+        try:
+            if self.backend == 'postgres':
+                self._notify(payload)
+            elif self.backend == 'file':
+                if self._has_listeners():
+                    self._append(payload)
+            else:
+                self._dispatch(event_type, data)
+        except Exception as e:
+            logger.warning("Live event '%s' not sent: %s", event_type, e)
+
+    def _notify(self, payload):
+        if len(payload) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({'type': 'reset', 'data': {'reason': 'too_large'}})
+        with self._notify_lock:
+            if self._notify_conn is None or self._notify_conn.closed:
+                self._notify_conn = _pg_connect()
+            try:
+                with self._notify_conn.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', (EVENTS_CHANNEL, payload))
+            except Exception:
+                self._notify_conn.close()
+                raise
+
+    def _has_listeners(self):
+        """True if some worker has an open stream; no disk write when none does"""
+        os.makedirs(EVENTS_DIR, exist_ok=True)
+        fd = os.open(self.listeners_path, os.O_RDONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    def _append(self, payload):
+        os.makedirs(EVENTS_DIR, exist_ok=True)
+        line = (payload + '\n').encode()
+        while True:
+            with open(self.path, 'ab', buffering=0) as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # Rotated by another writer while we waited for the lock
+                if not _same_file(f, self.path):
+                    continue
+                if f.tell() + len(line) > EVENTS_MAX_BYTES:
+                    os.replace(self.path, self.path + '.1')
+                    continue
+                # One write under the lock, so tailers never see half a line
+                f.write(line)
+                return
+
+    # ---- subscribing ----
+
+    def subscribe(self, last_event_id=None):
+        """Open a Subscription (replaying events after last_event_id), or None when the worker is full"""
+        self._start_listener()
+        subscription = Subscription(self)
+        with self.lock:
+            if len(self.subscribers) >= EVENTS_MAX_STREAMS:
+                return None
+            if last_event_id:
+                missed = self._missed_since(last_event_id)
+                if missed is None:
+                    subscription.put((self._last_id(), 'reset', {'reason': 'reconnect'}))
+                else:
+                    for event in missed:
+                        subscription.put(event)
+            self.subscribers.add(subscription)
+            if self.backend == 'file' and self._listening is None:
+                os.makedirs(EVENTS_DIR, exist_ok=True)
+                self._listening = os.open(self.listeners_path, os.O_RDONLY | os.O_CREAT, 0o644)
+                fcntl.flock(self._listening, fcntl.LOCK_SH)
+        metrics.EVENT_STREAMS_OPEN.set(len(self.subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+            if not self.subscribers and self._listening is not None:
+                # Closing the file releases the lock
+                os.close(self._listening)
+                self._listening = None
+        metrics.EVENT_STREAMS_OPEN.set(len(self.subscribers))
+
+    def _missed_since(self, last_event_id):
+        """Backlog events after last_event_id, or None if they are not all still here"""
+        token, _, seq = last_event_id.partition('-')
+        if token != self.token or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self.seq:
+            return None
+        missed = [event for event in self.backlog if int(event[0].rsplit('-', 1)[1]) > seq]
+        if len(missed) < self.seq - seq:
+            return None
+        return missed
+
+    def _last_id(self):
+        return f"{self.token}-{self.seq}"
+
+    def _dispatch(self, event_type, data):
+        with self.lock:
+            self.seq += 1
+            event = (self._last_id(), event_type, data)
+            self.backlog.append(event)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _dispatch_payload(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        self._dispatch(message['type'], message['data'])
+
+    # ---- cross-worker listener ----
+
+    def _start_listener(self):
+        if self.backend == 'local' or self._listener:
+            return
+        with self.lock:
+            if self._listener:
+                return
+            target = self._listen_postgres if self.backend == 'postgres' else self._tail_file
+            self._listener = threading.Thread(target=target, name='events-listener', daemon=True)
+            self._listener.start()
+
+    def _tail_file(self):
+        """Dispatch lines appended to the events file (from any worker), following rotations"""
+        os.makedirs(EVENTS_DIR, exist_ok=True)
+        f = open(self.path, 'ab+')
+        f.seek(0, os.SEEK_END)
+        partial = b''
+        while True:
+            chunk = f.read()
+            if chunk:
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                for line in lines:
+                    self._dispatch_payload(line.decode())
+                continue
+            if not _same_file(f, self.path):
+                # The rest of the old file has been read: move to the new one
+                f.close()
+                f = open(self.path, 'ab+')
+                f.seek(0)
+                partial = b''
+                continue
+            time.sleep(EVENTS_POLL_MS / 1000)
+
+    def _listen_postgres(self):
+        """Dispatch NOTIFYs on EVENTS_CHANNEL, reconnecting (and resetting streams) after errors"""
+        while True:
+            try:
+                conn = _pg_connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+                while True:
+                    if select.select([conn], [], [], EVENTS_HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch_payload(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Live events listener lost its connection: %s", e)
+                self._dispatch('reset', {'reason': 'listener'})
+                time.sleep(1)
+
+
+def _same_file(f, path):
+    try:
+        return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _pg_connect():
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = EventBus()
+    return _bus
+
+
+def publish(event_type, data):
+    if EVENTS_ENABLED:
+        get_bus().publish(event_type, data)
+
+
+def publish_after_commit(db, event_type, data):
+    """Publish once db's current transaction commits (nothing if it rolls back)"""
+    if EVENTS_ENABLED:
+        db.after_commit(lambda: publish(event_type, data))
+
+
+def stock_delta(product_id, quantity, minimum_stock, unit_price, change):
+    """A product's new stock level, as carried by 'bill' and 'stock' events"""
+    return {'product_id': product_id, 'quantity': quantity, 'minimum_stock': minimum_stock,
+            'unit_price': unit_price, 'change': change}
+
+
+def subscribe(last_event_id=None):
+    return get_bus().subscribe(last_event_id)
+
+
+def format_sse(event):
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+def stream(subscription):
+    """text/event-stream body for a Subscription: events, heartbeats, then a clean end"""
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=min(EVENTS_HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0)))
+            # Comment lines keep proxies from closing an idle stream
+            yield format_sse(event) if event else ': ping\n\n'
+    finally:
+        subscription.close()
@@ -1,4 +1,5 @@
 from database import Database
+import change_log
 from datetime import datetime
 
 class ExpenseManager:
@@ -16,12 +17,17 @@ class ExpenseManager:
         '''
         params = (category, description, amount, expense_date)
         
-        if self.db.execute_query(query, params):
-            print(f"✓ Expense added: {description} - ₹{amount}")
-            return True
-        else:
-            print(f"✗ Failed to add expense")
+        try:
+            with self.db.transaction():
+                expense_id = self.db.execute_insert(query, params)
+                change_log.record(self.db, 'expenses', expense_id, 'INSERT', {
+                    'category': category, 'description': description, 'amount': amount, 'expense_date': expense_date
+                })
+        except Exception as e:
+            print(f"✗ Failed to add expense: {e}")
             return False
+        print(f"✓ Expense added: {description} - ₹{amount}")
+        return True
 
     def get_all_expenses(self):
         """Get all expenses"""
@@ -80,30 +86,39 @@ class ExpenseManager:
     def delete_expense(self, expense_id):
         """Delete an expense"""
         query = 'DELETE FROM expenses WHERE id = ?'
-        return self.db.execute_query(query, (expense_id,))
+        try:
+            with self.db.transaction():
+                self.db.execute_query(query, (expense_id,))
+                change_log.record(self.db, 'expenses', expense_id, 'DELETE')
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+        return True
 
     def update_expense(self, expense_id, category=None, description=None, amount=None):
         """Update expense"""
-        updates = []
-        params = []
+        changes = {}
 
         if category:
-            updates.append('category = ?')
-            params.append(category)
+            changes['category'] = category
         if description:
-            updates.append('description = ?')
-            params.append(description)
+            changes['description'] = description
         if amount:
-            updates.append('amount = ?')
-            params.append(amount)
+            changes['amount'] = amount
 
-        if not updates:
+        if not changes:
             return False
 
-        params.append(expense_id)
-        query = f'UPDATE expenses SET {", ".join(updates)} WHERE id = ?'
+        query = f'UPDATE expenses SET {", ".join(f"{column} = ?" for column in changes)} WHERE id = ?'
         
-        return self.db.execute_query(query, params)
+        try:
+            with self.db.transaction():
+                self.db.execute_query(query, list(changes.values()) + [expense_id])
+                change_log.record(self.db, 'expenses', expense_id, 'UPDATE', changes)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+        return True
 
     def display_daily_expenses(self, date=None):
         """Display expenses for a day"""
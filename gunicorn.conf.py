@@ -0,0 +1,56 @@
+"""
+Gunicorn Settings
+Used by the Procfile (gunicorn -c gunicorn.conf.py). Tuned so several workers
+fit on a Raspberry Pi.
+- preload_app: the master loads the app once through create_app() (tables,
+  precompressed static files, imports) and every worker forks from it,
+  sharing that memory copy-on-write instead of loading its own copy
+- gc.freeze() after the load moves those objects out of the garbage
+  collector's reach: a collection in a worker would otherwise write to them
+  and un-share their pages
+- gthread workers (the default): the live event streams (/api/events) each
+  hold a thread, and every request thread borrows its own pooled database
+  connection (database.DB_POOL_SIZE idle ones are kept per worker, so keep it
+  at least GUNICORN_THREADS)
+- GUNICORN_WORKER_CLASS=gevent runs each request in a greenlet instead, for
+  many concurrent clients on PostgreSQL (pip install gevent psycogreen). Not
+  with SQLite: its calls block the whole worker while they run
+"""
+
+import gc
+import os
+
+try:
+    import psycogreen.gevent
+except ImportError:
+    psycogreen = None
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Green workers: concurrent greenlets per worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """Runs in the master after the preload, before the first worker forks"""
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info("Preloaded app frozen for copy-on-write sharing (%d objects)", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after the fork"""
+    import database
+    # Connections are per process: set aside any opened before the fork, unused
+    database.close_pool()
+    if worker_class == 'gevent' and database.DATABASE_URL:
+        if psycogreen is None:
+            server.log.warning("gevent workers without psycogreen: PostgreSQL queries block the worker")
+        else:
+            # psycopg2 waits on the socket through gevent, so other greenlets run meanwhile
+            psycogreen.gevent.patch_psycopg()
@@ -0,0 +1,57 @@
+"""
+Idempotency Keys
+Lets the billing page retry POST /api/billing/create safely.
+- The client sends an Idempotency-Key header (one per checkout) and keeps it
+  for every retry of that checkout
+- create_bill inserts the key in the bill's own transaction, so a bill and
+  its key commit together: a duplicate key rolls the whole bill back
+- The route stores the response it sent; a retry with the same key gets
+  that response back instead of a second bill
+- Keys are purged after IDEMPOTENCY_TTL_HOURS (hourly job)
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+MAX_KEY_LENGTH = 255
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def request_hash(payload):
+    """Fingerprint of a request body, to spot a key reused for a different bill"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def is_valid_key(key):
+    return bool(key) and len(key) <= MAX_KEY_LENGTH
+
+
+def lookup(db, key):
+    """(request_hash, bill_number, status_code, response) for a key, or None"""
+    return db.fetch_one('''
+        SELECT request_hash, bill_number, status_code, response FROM idempotency_keys WHERE idem_key = ?
+    ''', (key,), use_primary=True)
+
+
+def reserve(db, key, fingerprint, bill_number):
+    """Claim the key for a bill; call inside the bill's db.transaction() (raises if the key is taken)"""
+    db.execute_query('''
+        INSERT INTO idempotency_keys (idem_key, request_hash, bill_number, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', (key, fingerprint, bill_number, datetime.utcnow().strftime(TIMESTAMP_FORMAT)))
+
+
+def save_response(db, key, status_code, body):
+    """Remember the response sent for a key so retries get the same one"""
+    db.execute_query('UPDATE idempotency_keys SET status_code = ?, response = ? WHERE idem_key = ?',
+                     (status_code, json.dumps(body), key))
+
+
+def purge(db):
+    """Delete keys older than IDEMPOTENCY_TTL_HOURS; returns True on success"""
+    cutoff = (datetime.utcnow() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)).strftime(TIMESTAMP_FORMAT)
+    return db.execute_query('DELETE FROM idempotency_keys WHERE created_at < ?', (cutoff,))
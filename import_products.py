@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Product Import
+Loads a product list (a supplier's price list, a spreadsheet export) from CSV
+into the products table in one transaction, through Database.bulk_upsert:
+execute_values on PostgreSQL, chunked executemany on SQLite.
+- Columns: name, category, unit_price, and optionally quantity and
+  minimum_stock (header row required, any order, extra columns ignored)
+- Products are matched by name. Existing ones get the new category, price
+  and minimum stock and keep their stock (that changes through stock
+  add/remove, so it stays in the movements); quantity is the opening stock
+  of new products, booked as an ADD movement
+- Invalid rows are reported with their line number and skipped; a name that
+  appears twice keeps its last row
+- Every inserted or updated product is written to the change log
+
+Usage:
+    python import_products.py products.csv [--dry-run]
+"""
+
+import os
+import sys
+import csv
+import argparse
+
+from database import Database
+import change_log
+import stock
+
+REQUIRED_COLUMNS = ('name', 'category', 'unit_price')
+DEFAULT_MINIMUM_STOCK = int(os.environ.get('IMPORT_DEFAULT_MINIMUM_STOCK', '5'))
+
+IMPORT_COLUMNS = ('name', 'category', 'unit_price', 'quantity', 'minimum_stock')
+# quantity is only written for new products
+UPDATE_COLUMNS = ('category', 'unit_price', 'minimum_stock')
+
+
+def parse_rows(lines):
+    """(products by name, [(line number, error)]) from CSV lines"""
+    reader = csv.DictReader(lines)
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    reader.fieldnames = header
+
+    products, errors = {}, []
+    for row in reader:
+        try:
+            name = (row['name'] or '').strip()
+            category = (row['category'] or '').strip()
+            if not name or not category:
+                raise ValueError("name and category are required")
+            unit_price = float(row['unit_price'])
+            quantity = int(row.get('quantity') or 0)
+            minimum_stock = int(row.get('minimum_stock') or DEFAULT_MINIMUM_STOCK)
+            if unit_price < 0 or quantity < 0 or minimum_stock < 0:
+                raise ValueError("unit_price, quantity and minimum_stock can't be negative")
+        except (TypeError, ValueError) as e:
+            errors.append((reader.line_num, str(e)))
+            continue
+        products[name] = (name, category, unit_price, quantity, minimum_stock)
+    return products, errors
+
+
+def import_products(products, db=None):
+    """Upsert products {name: (name, category, unit_price, quantity, minimum_stock)}; returns (inserted, updated)"""
+    own_db = db is None
+    db = db or Database()
+    try:
+        with db.transaction():
+            existing = {row[0] for row in db.fetch_all('SELECT name FROM products')}
+            db.bulk_upsert('products', IMPORT_COLUMNS, products.values(), ('name',), UPDATE_COLUMNS)
+            ids = {name: product_id for product_id, name in db.fetch_all('SELECT id, name FROM products')}
+
+            inserted, updated = [], []
+            for name, row in products.items():
+                if name in existing:
+                    updated.append((ids[name], dict(zip(UPDATE_COLUMNS, (row[1], row[2], row[4])))))
+                else:
+                    inserted.append((ids[name], dict(zip(IMPORT_COLUMNS, row))))
+                    if row[3]:
+                        stock.record_movement(db, ids[name], 'ADD', row[3], notes='Opening stock')
+            change_log.record_many(db, 'products', 'INSERT', inserted)
+            change_log.record_many(db, 'products', 'UPDATE', updated)
+    finally:
+        if own_db:
+            db.close()
+    return len(inserted), len(updated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_file')
+    parser.add_argument('--dry-run', action='store_true', help='check the file, import nothing')
+    args = parser.parse_args()
+
+    try:
+        with open(args.csv_file, newline='', encoding='utf-8-sig') as f:
+            products, errors = parse_rows(f)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    for line, error in errors:
+        print(f"✗ Line {line}: {error}")
+    if args.dry_run:
+        print(f"✓ {len(products)} valid products, {len(errors)} invalid rows (dry run, nothing imported)")
+        return
+
+    try:
+        inserted, updated = import_products(products)
+    except Exception as e:
+        print(f"✗ Import failed, nothing was imported: {e}")
+        sys.exit(1)
+    print(f"✓ Imported {inserted + updated} products ({inserted} new, {updated} updated, {len(errors)} rows skipped)")
+
+
+if __name__ == "__main__":
+    main()
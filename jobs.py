@@ -0,0 +1,405 @@
+"""
+Background Job Scheduler
+Runs maintenance work (retention cleanup, database optimize, backups, stock
+snapshots and reconciliation) in quiet hours instead of on the request path.
+- Every gunicorn worker starts a scheduler, but only the worker holding the
+  leader lock runs jobs (lock file on SQLite, advisory lock on PostgreSQL)
+- A per-job lock of the same kind keeps a manual run from overlapping a
+  scheduled run of the same job
+- Every run is recorded in the job_runs table with its duration
+"""
+
+import os
+import time
+import zlib
+import logging
+import threading
+
+from database import Database, get_ist_datetime, DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.environ.get('JOBS_ENABLED', '1') == '1'
+JOBS_TIMEZONE = os.environ.get('JOBS_TIMEZONE', 'Asia/Kolkata')
+LOCK_PATH = os.environ.get(
+    'JOBS_LOCK_FILE',
+    os.path.join(os.path.dirname(__file__), 'data', 'jobs.lock')
+)
+# Arbitrary key shared by all workers for pg_try_advisory_lock
+ADVISORY_LOCK_KEY = 7263540
+
+
+class LeaderLock:
+    """Lock across worker processes: the leader lock, or a job's lock when given a job name.
+
+    The leader lock is held for the lifetime of the process once acquired, so
+    the operating system (or PostgreSQL, when the session ends) releases it if
+    the leader dies and another worker takes over on its next attempt.
+    """
+
+    def __init__(self, job_name=None):
+        self.job_name = job_name
+        self._fd = None
+        # Dedicated autocommit connection outside the pool: the advisory lock belongs to its session
+        self._connection = None
+
+    @property
+    def held(self):
+        return self._fd is not None or self._connection is not None
+
+    @property
+    def _advisory_key(self):
+        if self.job_name is None:
+            return (ADVISORY_LOCK_KEY,)
+        # Two-key form: a separate key space from the leader lock's single key
+        return (ADVISORY_LOCK_KEY, zlib.crc32(self.job_name.encode()) & 0x7fffffff)
+
+    def acquire(self):
+        """Try to become leader without blocking; returns True if held"""
+        if self.held:
+            return True
+        if DATABASE_URL:
+            return self._acquire_advisory()
+        return self._acquire_file()
+
+    def _acquire_file(self):
+        import fcntl
+        path = LOCK_PATH if self.job_name is None else f"{LOCK_PATH}.{self.job_name}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def _acquire_advisory(self):
+        import psycopg2
+        key = self._advisory_key
+        try:
+            # A session on the primary, not the read replica; autocommit so it never sits
+            # idle in a transaction (which would hold back VACUUM) while it holds the lock
+            connection = psycopg2.connect(DATABASE_URL)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT pg_try_advisory_lock({', '.join(['%s'] * len(key))})", key)
+                acquired = cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Advisory lock unavailable: {e}")
+            return False
+        if acquired:
+            self._connection = connection
+            return True
+        connection.close()
+        return False
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._connection is not None:
+            key = self._advisory_key
+            try:
+                with self._connection.cursor() as cursor:
+                    cursor.execute(f"SELECT pg_advisory_unlock({', '.join(['%s'] * len(key))})", key)
+            except Exception as e:
+                logger.error(f"Advisory unlock failed: {e}")
+            finally:
+                # Ending the session releases the lock in any case
+                self._connection.close()
+                self._connection = None
+
+
+class JobScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = LeaderLock()
+        self.scheduler = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def register(self, name, func, description='', **cron):
+        """Register a job; cron keyword arguments are passed to CronTrigger"""
+        self.jobs[name] = {
+            'func': func,
+            'description': description,
+            'cron': cron
+        }
+
+    def start(self):
+        """Start the scheduler once per worker process"""
+        if not JOBS_ENABLED or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Imported here: APScheduler is the slowest import of app.py, and is only needed once started
+            from apscheduler.schedulers.background import BackgroundScheduler
+            from apscheduler.triggers.cron import CronTrigger
+            self.scheduler = BackgroundScheduler(timezone=JOBS_TIMEZONE)
+            for name, job in self.jobs.items():
+                self.scheduler.add_job(
+                    func=self.run_job,
+                    args=(name,),
+                    trigger=CronTrigger(timezone=JOBS_TIMEZONE, **job['cron']),
+                    id=name,
+                    name=job['description'] or name,
+                    replace_existing=True,
+                    coalesce=True,
+                    max_instances=1,
+                    misfire_grace_time=3600
+                )
+            self.scheduler.start()
+            self._pid = os.getpid()
+            logger.info(f"Background scheduler started in worker {self._pid} ({len(self.jobs)} jobs)")
+
+    def shutdown(self):
+        if self.scheduler and self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.lock.release()
+        self._pid = None
+
+    def run_job(self, name, force=False):
+        """Run a registered job and record it in job_runs.
+
+        Skips the run unless this worker is the leader; force=True is used
+        for manual runs requested by an admin. Either way the run also takes
+        the job's own lock, and is skipped if the job is already running.
+        """
+        job = self.jobs.get(name)
+        if not job:
+            return None
+        if not force and not self.lock.acquire():
+            return None
+        job_lock = LeaderLock(name)
+        if not job_lock.acquire():
+            logger.info(f"Job '{name}' skipped: already running")
+            return None
+
+        db = Database()
+        try:
+            run_id = db.execute_insert(
+                'INSERT INTO job_runs (job_name, status, started_at, worker_pid) VALUES (?, ?, ?, ?)',
+                (name, 'RUNNING', get_ist_datetime(), os.getpid())
+            )
+            if run_id is None:
+                logger.error(f"Job '{name}' runs without a job_runs record")
+
+            logger.info(f"Job '{name}' started")
+            start = time.perf_counter()
+            try:
+                message = job['func']()
+                status = 'SUCCESS'
+            except Exception as e:
+                message = str(e)
+                status = 'FAILED'
+                logger.error(f"Job '{name}' failed: {e}")
+            duration_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Job '{name}' finished with {status} in {duration_ms:.0f} ms")
+
+            if run_id is not None:
+                db.execute_query(
+                    '''UPDATE job_runs SET status = ?, finished_at = ?, duration_ms = ?, message = ?
+                       WHERE id = ?''',
+                    (status, get_ist_datetime(), duration_ms, str(message or '')[:500], run_id)
+                )
+            return {'job_name': name, 'status': status, 'duration_ms': duration_ms, 'message': message}
+        finally:
+            db.close()
+            job_lock.release()
+
+    def run_in_background(self, name):
+        """Trigger a manual run without blocking the request"""
+        if name not in self.jobs:
+            return False
+        threading.Thread(target=self.run_job, args=(name,), kwargs={'force': True}, daemon=True).start()
+        return True
+
+    def get_status(self, history_limit=20):
+        """Registered jobs with next run times, timing stats and recent history"""
+        db = Database()
+        try:
+            stats = db.fetch_all('''
+                SELECT job_name,
+                       COUNT(*) as runs,
+                       SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as failures,
+                       AVG(duration_ms) as avg_ms,
+                       MAX(duration_ms) as max_ms,
+                       MAX(started_at) as last_started_at
+                FROM job_runs
+                GROUP BY job_name
+            ''')
+            history = db.fetch_all('''
+                SELECT id, job_name, status, started_at, finished_at, duration_ms, message, worker_pid
+                FROM job_runs
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (history_limit,))
+        finally:
+            db.close()
+
+        stats_by_name = {row[0]: row for row in stats}
+        jobs = []
+        for name, job in self.jobs.items():
+            next_run = None
+            if self.scheduler:
+                scheduled = self.scheduler.get_job(name)
+                if scheduled and scheduled.next_run_time:
+                    next_run = scheduled.next_run_time.strftime('%Y-%m-%d %H:%M:%S')
+            row = stats_by_name.get(name)
+            jobs.append({
+                'name': name,
+                'description': job['description'],
+                'schedule': job['cron'],
+                'next_run_at': next_run,
+                'runs': row[1] if row else 0,
+                'failures': row[2] if row else 0,
+                'avg_duration_ms': round(row[3], 1) if row and row[3] is not None else None,
+                'max_duration_ms': round(row[4], 1) if row and row[4] is not None else None,
+                'last_started_at': row[5] if row else None
+            })
+
+        return {
+            'enabled': JOBS_ENABLED,
+            'worker_pid': os.getpid(),
+            'is_leader': self.lock.held,
+            'jobs': jobs,
+            'history': [{
+                'id': r[0],
+                'job_name': r[1],
+                'status': r[2],
+                'started_at': r[3],
+                'finished_at': r[4],
+                'duration_ms': round(r[5], 1) if r[5] is not None else None,
+                'message': r[6],
+                'worker_pid': r[7]
+            } for r in history]
+        }
+
+
+# ============ MAINTENANCE JOBS ============
+
+def run_retention_cleanup():
+    """Delete expired records (see cleanup_old_records.py)"""
+    from cleanup_old_records import DatabaseCleaner
+    cleaner = DatabaseCleaner()
+    try:
+        cleaner.cleanup()
+        return f"Deleted {sum(cleaner.deleted_records.values())} records"
+    finally:
+        cleaner.close()
+
+
+def run_optimize():
+    """Refresh query planner statistics"""
+    db = Database()
+    try:
+        db.optimize()
+        return 'ANALYZE' if db.is_postgres else 'PRAGMA optimize'
+    finally:
+        db.close()
+
+
+def run_vacuum():
+    """Reclaim free space and refresh statistics"""
+    db = Database()
+    try:
+        db.optimize(vacuum=True)
+        return 'VACUUM ANALYZE' if db.is_postgres else 'VACUUM'
+    finally:
+        db.close()
+
+
+def run_backup():
+    """Take a compressed online snapshot of the database (see backup.py)"""
+    if DATABASE_URL:
+        return 'Skipped: online backups only support SQLite'
+    from backup import BackupManager
+    result = BackupManager().create_backup()
+    return f"{os.path.basename(result['path'])} ({result['size']} bytes)"
+
+
+def run_stock_snapshot():
+    """Snapshot every product's quantity for point-in-time stock (see stock.get_stock_as_of)"""
+    from stock import StockManager
+    manager = StockManager()
+    try:
+        return f"Snapshotted {manager.take_snapshot()} products"
+    finally:
+        manager.close()
+
+
+def run_stock_reconciliation():
+    """Check products.quantity against stock movements (see reconciliation.py)"""
+    from reconciliation import StockReconciler, RECONCILE_REPAIR
+    reconciler = StockReconciler()
+    try:
+        report = reconciler.run(repair=RECONCILE_REPAIR or None)
+        message = f"Checked {report['checked']} products, {len(report['drift'])} drifting"
+        if report.get('repaired'):
+            message += f" after repairing {report['repaired']} ({RECONCILE_REPAIR})"
+        return message
+    finally:
+        reconciler.close()
+
+
+def run_reorder_suggestions():
+    """Recompute reorder suggestions for products touched since the last run (see reorder.py)"""
+    from reorder import ReorderEngine
+    engine = ReorderEngine()
+    try:
+        result = engine.run()
+        return (f"{'Full' if result['full'] else 'Incremental'} run: "
+                f"{result['computed']} products, {result['changed']} changed")
+    finally:
+        engine.close()
+
+
+def run_idempotency_purge():
+    """Delete expired bill idempotency keys"""
+    import idempotency
+    db = Database()
+    try:
+        if not idempotency.purge(db):
+            raise RuntimeError("Idempotency key purge failed")
+        return f"Purged keys older than {idempotency.IDEMPOTENCY_TTL_HOURS}h"
+    finally:
+        db.close()
+
+
+def run_change_log_purge():
+    """Delete change log rows past their retention"""
+    import change_log
+    db = Database()
+    try:
+        if not change_log.purge(db):
+            raise RuntimeError("Change log purge failed")
+        return f"Purged changes older than {change_log.CHANGE_LOG_KEEP_DAYS} days"
+    finally:
+        db.close()
+
+
+def register_default_jobs(scheduler):
+    """Register the shop's maintenance jobs (times are IST quiet hours)"""
+    scheduler.register('backup', run_backup,
+                       'Nightly online backup', hour=1, minute=30)
+    scheduler.register('retention_cleanup', run_retention_cleanup,
+                       'Weekly Database Cleanup', day_of_week=6, hour=2, minute=0)
+    scheduler.register('vacuum', run_vacuum,
+                       'Weekly VACUUM', day_of_week=6, hour=3, minute=0)
+    scheduler.register('optimize', run_optimize,
+                       'Nightly planner statistics refresh', hour=3, minute=30)
+    scheduler.register('stock_snapshot', run_stock_snapshot,
+                       'Daily stock snapshot', hour=23, minute=55)
+    scheduler.register('stock_reconciliation', run_stock_reconciliation,
+                       'Nightly stock reconciliation', hour=4, minute=0)
+    scheduler.register('reorder_suggestions', run_reorder_suggestions,
+                       'Reorder suggestions', minute='*/15')
+    scheduler.register('idempotency_purge', run_idempotency_purge,
+                       'Expired idempotency key purge', minute=5)
+    scheduler.register('change_log_purge', run_change_log_purge,
+                       'Change log retention purge', hour=2, minute=30)
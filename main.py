@@ -99,7 +99,7 @@ class ElectricalShopSystem:
                 print(f"{'ID':<5} {'Name':<25} {'Category':<15} {'Current':<10} {'Min Stock':<10}")
                 print("-"*100)
                 for product in low_stock:
-                    product_id, name, category, _, qty, min_stock, _ = product
+                    product_id, name, category, _, qty, min_stock, *_ = product
                     print(f"{product_id:<5} {name:<25} {category:<15} {qty:<10} {min_stock:<10}")
                 print("="*100 + "\n")
             else:
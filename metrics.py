@@ -0,0 +1,264 @@
+"""
+Metrics Registry
+In-process counters, gauges and histograms exposed at /metrics in Prometheus
+text format.
+- Set METRICS_MULTIPROC_DIR to aggregate across gunicorn workers: each worker
+  writes a snapshot file there (at most every METRICS_FLUSH_SECONDS) and the
+  worker serving /metrics merges all of them
+- Counters and histograms from exited workers keep counting towards the
+  totals; gauges only count live workers
+"""
+
+import os
+import json
+import time
+import threading
+
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_lock = threading.Lock()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with _lock:
+            return [[list(key), value if not isinstance(value, list) else list(value)]
+                    for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Set a cumulative total that is tracked elsewhere (e.g. lru_cache stats)"""
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # [per-bucket counts..., +Inf count, sum]
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._last_flush = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, func):
+        """Register a callback that refreshes metric values before export"""
+        self.collectors.append(func)
+
+    def _collect(self):
+        for func in self.collectors:
+            try:
+                func()
+            except Exception:
+                pass
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    # ---- multiprocess mode ----
+
+    def maybe_flush(self, force=False):
+        """Write this worker's snapshot for other workers to merge"""
+        if not METRICS_MULTIPROC_DIR:
+            return
+        now = time.time()
+        if not force and now - self._last_flush < METRICS_FLUSH_SECONDS:
+            return
+        self._last_flush = now
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+        path = os.path.join(METRICS_MULTIPROC_DIR, f"metrics-{os.getpid()}.json")
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._collect(), f)
+        os.replace(tmp, path)
+
+    def _load_snapshots(self):
+        if not METRICS_MULTIPROC_DIR:
+            return [(os.getpid(), True, self._collect())]
+        self.maybe_flush(force=True)
+        snapshots = []
+        for name in os.listdir(METRICS_MULTIPROC_DIR):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            pid = int(name[len('metrics-'):-len('.json')])
+            try:
+                with open(os.path.join(METRICS_MULTIPROC_DIR, name)) as f:
+                    snapshots.append((pid, _pid_alive(pid), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _merge(self, metric, snapshots):
+        merged = {}
+        for pid, alive, data in snapshots:
+            for key, value in data.get(metric.name, []):
+                key = tuple(key)
+                if metric.kind == 'gauge':
+                    if not alive:
+                        continue
+                    if metric.multiprocess_mode == 'max':
+                        merged[key] = max(merged.get(key, value), value)
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+                elif metric.kind == 'histogram':
+                    current = merged.get(key)
+                    if current is None or len(current) != len(value):
+                        merged[key] = list(value)
+                    else:
+                        merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        snapshots = self._load_snapshots()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(self._merge(metric, snapshots).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.kind != 'histogram':
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f"{metric.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+                lines.append(f"{metric.name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+def track_lru_cache(cache_name, func):
+    """Export hit/miss totals of a functools.lru_cache wrapped function"""
+    def collect():
+        info = func.cache_info()
+        CACHE_REQUESTS.set_total(info.hits, cache=cache_name, result='hit')
+        CACHE_REQUESTS.set_total(info.misses, cache=cache_name, result='miss')
+    REGISTRY.add_collector(collect)
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('method', 'route'))
+REQUESTS = Counter(
+    'http_requests_total', 'Requests by route and status code', ('method', 'route', 'status'))
+REQUEST_DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Database time spent per request by route', ('method', 'route'))
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'Statements issued per request by route', ('method', 'route'),
+    buckets=COUNT_BUCKETS)
+BILLS_CREATED = Counter(
+    'bills_created_total', 'Bills created (use rate() * 60 for bills per minute)', ('bill_type',))
+BILL_LINE_ITEMS = Histogram(
+    'bill_line_items', 'Line items per bill', (), buckets=COUNT_BUCKETS)
+DB_CONNECTIONS_OPEN = Gauge(
+    'db_connections_open', 'Open database connections')
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ('cache', 'result'))
+DB_READS = Counter(
+    'db_reads_total', 'Reads by connection they were routed to (primary/read_only)', ('target',))
+STOCK_DRIFT_PRODUCTS = Gauge(
+    'stock_drift_products', 'Products whose quantity disagrees with the movement ledger (last reconciliation)',
+    multiprocess_mode='max')
+EVENTS_PUBLISHED = Counter(
+    'events_published_total', 'Live events published by this process, by type', ('type',))
+EVENT_STREAMS_OPEN = Gauge(
+    'event_streams_open', 'Open /api/events streams')
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+SQLite to PostgreSQL Migration
+Copies an existing SQLite database (data/electrical_shop.db) into the
+PostgreSQL database in DATABASE_URL, ids included, then checks the copy.
+- The app's tables are created on PostgreSQL first (Database's own DDL).
+  Every table present in both databases is copied, over the columns they
+  share
+- Tables are read in chunks of MIGRATE_CHUNK_ROWS and written through
+  Database.bulk_insert (COPY FROM STDIN), so memory stays flat however large
+  a table is. Tables with an integer key are split into key ranges of about
+  MIGRATE_PART_ROWS rows, and the parts run in parallel worker processes,
+  largest first
+- Tables run in waves: a table starts once the tables its foreign keys point
+  to are copied. Rows whose foreign key points at a missing row (SQLite never
+  enforced them) stop the migration before anything is copied, unless
+  --skip-orphans leaves them out
+- SERIAL / BIGSERIAL sequences are moved past the highest copied id, so new
+  rows don't collide with migrated ones
+- Verification compares each table's row count and a checksum of its rows on
+  both sides (order-independent; REAL values compared at PostgreSQL's single
+  precision, timestamps as timestamps)
+- The target tables must be empty; --truncate empties them first
+
+Usage:
+    DATABASE_URL=postgresql://... python migrate_to_postgres.py [--sqlite data/electrical_shop.db]
+        [--workers 4] [--tables products,stock_movements] [--truncate] [--skip-orphans] [--verify-only]
+"""
+
+import os
+import io
+import sys
+import time
+import struct
+import logging
+import sqlite3
+import hashlib
+import argparse
+import contextlib
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import database
+
+MIGRATE_CHUNK_ROWS = int(os.environ.get('MIGRATE_CHUNK_ROWS', '10000'))
+MIGRATE_PART_ROWS = int(os.environ.get('MIGRATE_PART_ROWS', '250000'))
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'electrical_shop.db')
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+CHECKSUM_MODULUS = 1 << 128
+
+TARGET_COLUMNS_SQL = '''
+    SELECT table_name, column_name, data_type FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, ordinal_position
+'''
+# Single-column foreign keys: (table, column, referenced table, referenced column)
+FOREIGN_KEYS_SQL = '''
+    SELECT cl.relname, a.attname, rcl.relname, ra.attname
+    FROM pg_constraint c
+    JOIN pg_class cl ON cl.oid = c.conrelid
+    JOIN pg_class rcl ON rcl.oid = c.confrelid
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+    JOIN pg_attribute ra ON ra.attrelid = c.confrelid AND ra.attnum = c.confkey[1]
+    WHERE c.contype = 'f' AND cl.relnamespace = current_schema()::regnamespace
+'''
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def connect_sqlite(path):
+    return sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+
+
+def connect_postgres():
+    with quiet():
+        return database.Database()
+
+
+def source_tables(source):
+    """{table: ([columns], [primary key columns])} of the SQLite database"""
+    tables = {}
+    names = source.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    for (name,) in names.fetchall():
+        info = source.execute(f'PRAGMA table_info("{name}")').fetchall()
+        key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        tables[name] = ([row[1] for row in info], key)
+    return tables
+
+
+def plan_tables(source, db, only=None, skip_orphans=False):
+    """Per table: columns, key, row count and foreign-key filter; prints what is left out"""
+    targets = {}
+    for table, column, data_type in db.fetch_all(TARGET_COLUMNS_SQL, use_primary=True):
+        targets.setdefault(table, {})[column] = data_type
+    foreign_keys = {}
+    for table, column, ref_table, ref_column in db.fetch_all(FOREIGN_KEYS_SQL, use_primary=True):
+        foreign_keys.setdefault(table, []).append((column, ref_table, ref_column))
+
+    plans = {}
+    for table, (columns, key) in source_tables(source).items():
+        if only and table not in only:
+            continue
+        if table not in targets:
+            print(f"  - {table}: not an app table on PostgreSQL, skipped")
+            continue
+        shared = [column for column in columns if column in targets[table]]
+        dropped = [column for column in columns if column not in targets[table]]
+        if dropped:
+            print(f"  - {table}: column(s) {', '.join(dropped)} not on PostgreSQL, skipped")
+        database.check_identifiers(table, *shared)
+
+        # Only rows whose foreign keys point at rows that exist in the source
+        references = [(column, ref_table, ref_column) for column, ref_table, ref_column in foreign_keys.get(table, [])
+                      if column in shared and ref_table != table]
+        valid = ' AND '.join(f"({column} IS NULL OR {column} IN (SELECT {ref_column} FROM {ref_table}))"
+                             for column, ref_table, ref_column in references) or '1 = 1'
+        total = source.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        orphans = total - source.execute(f"SELECT COUNT(*) FROM {table} WHERE {valid}").fetchone()[0]
+
+        int_key = key[0] if len(key) == 1 and targets[table].get(key[0]) in INTEGER_TYPES else None
+        plans[table] = {
+            'table': table,
+            'columns': shared,
+            'types': [targets[table][column] for column in shared],
+            'int_key': int_key,
+            'filter': valid if skip_orphans else '1 = 1',
+            'rows': total - orphans if skip_orphans else total,
+            'orphans': orphans,
+            'depends_on': {ref_table for _, ref_table, _ in references},
+        }
+    return plans
+
+
+def split_parts(source, plan):
+    """The table's key ranges [(low, high) or None for the whole table] of about MIGRATE_PART_ROWS rows"""
+    key = plan['int_key']
+    if not key or plan['rows'] <= MIGRATE_PART_ROWS:
+        return [None]
+    low, high = source.execute(f"SELECT MIN({key}), MAX({key}) FROM {plan['table']}").fetchone()
+    # Assumes keys are spread evenly over [low, high]; gaps just make parts smaller
+    step = max(1, (high - low + 1) * MIGRATE_PART_ROWS // plan['rows'])
+    return [(start, start + step) for start in range(low, high + 1, step)]
+
+
+def part_query(plan, part):
+    """SELECT for one part of a table, and its parameters"""
+    query = f"SELECT {', '.join(plan['columns'])} FROM {plan['table']} WHERE {plan['filter']}"
+    if part is None:
+        return query, ()
+    return query + f" AND {plan['int_key']} >= ? AND {plan['int_key']} < ?", part
+
+
+def waves(plans):
+    """Tables grouped so each group only references tables in earlier groups"""
+    remaining = dict(plans)
+    groups = []
+    while remaining:
+        ready = [table for table, plan in remaining.items() if not plan['depends_on'] & set(remaining)]
+        if not ready:
+            # A reference cycle: copy the rest together
+            ready = list(remaining)
+        groups.append(ready)
+        for table in ready:
+            del remaining[table]
+    return groups
+
+
+def read_chunks(cursor):
+    while True:
+        rows = cursor.fetchmany(MIGRATE_CHUNK_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def copy_part(sqlite_path, plan, part):
+    """Worker: copy one part of a table with COPY; returns (table, rows, seconds)"""
+    start = time.perf_counter()
+    source = connect_sqlite(sqlite_path)
+    db = connect_postgres()
+    try:
+        query, params = part_query(plan, part)
+        cursor = source.execute(query, params)
+        # Inside a transaction bulk_insert raises the database's error instead of printing it
+        with db.transaction():
+            count = db.bulk_insert(plan['table'], plan['columns'], read_chunks(cursor), chunk_rows=MIGRATE_CHUNK_ROWS)
+    finally:
+        db.close()
+        source.close()
+    return plan['table'], count, time.perf_counter() - start
+
+
+def normalizer(data_type):
+    """Turns a value from either database into the same text, by the PostgreSQL column type"""
+    if data_type == 'real':
+        # Compare at single precision, what PostgreSQL stores
+        return lambda value: struct.pack('<f', float(value)).hex()
+    if data_type in ('double precision', 'numeric'):
+        return lambda value: repr(float(value))
+    if data_type in INTEGER_TYPES:
+        return lambda value: str(int(value))
+    if data_type.startswith('timestamp'):
+        def timestamp(value):
+            try:
+                return datetime.fromisoformat(str(value)).isoformat(' ')
+            except ValueError:
+                return str(value)
+        return timestamp
+    if data_type == 'date':
+        return lambda value: str(value)[:10]
+    return str
+
+
+def checksum(rows, types):
+    """(row count, order-independent checksum) of rows"""
+    normalizers = [normalizer(data_type) for data_type in types]
+    count, total = 0, 0
+    for row in rows:
+        text = '\x1f'.join('\x00' if value is None else normalize(value)
+                           for normalize, value in zip(normalizers, row))
+        total += int.from_bytes(hashlib.blake2b(text.encode(), digest_size=16).digest(), 'big')
+        count += 1
+    return count, total % CHECKSUM_MODULUS
+
+
+def verify_part(sqlite_path, plan, part):
+    """Worker: (table, source (count, checksum), target (count, checksum)) for one part of a table"""
+    source = connect_sqlite(sqlite_path)
+    try:
+        query, params = part_query(plan, part)
+        source_sum = checksum(read_chunks(source.execute(query, params)), plan['types'])
+    finally:
+        source.close()
+
+    db = connect_postgres()
+    try:
+        query = f"SELECT {', '.join(plan['columns'])} FROM {plan['table']}"
+        params = ()
+        if part is not None:
+            query += f" WHERE {plan['int_key']} >= %s AND {plan['int_key']} < %s"
+            params = part
+        # Server-side cursor: rows arrive MIGRATE_CHUNK_ROWS at a time
+        cursor = db.connection.cursor(name=f"verify_{plan['table']}")
+        cursor.itersize = MIGRATE_CHUNK_ROWS
+        cursor.execute(query, params)
+        target_sum = checksum(cursor, plan['types'])
+        cursor.close()
+    finally:
+        db.close()
+    return plan['table'], source_sum, target_sum
+
+
+def run_parts(executor, func, sqlite_path, plans, parts):
+    """Run func over every (table, part), largest tables first; yields the results as they finish"""
+    order = sorted(parts, key=lambda item: -plans[item[0]]['rows'])
+    futures = [executor.submit(func, sqlite_path, plans[table], part) for table, part in order]
+    for future in futures:
+        yield future.result()
+
+
+def reset_sequences(db, plans):
+    """Move each SERIAL sequence past its column's highest value; returns how many were reset"""
+    reset = 0
+    for table, plan in plans.items():
+        for column, data_type in zip(plan['columns'], plan['types']):
+            if data_type not in INTEGER_TYPES:
+                continue
+            sequence = db.fetch_one('SELECT pg_get_serial_sequence(?, ?)', (table, column), use_primary=True)
+            if not sequence or not sequence[0]:
+                continue
+            db.fetch_one(f"SELECT setval(?, COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)",
+                         (sequence[0],), use_primary=True)
+            reset += 1
+    db.connection.commit()
+    return reset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sqlite', default=DEFAULT_SQLITE_PATH, help='SQLite database to copy')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--tables', help='comma-separated tables (default: all)')
+    parser.add_argument('--truncate', action='store_true', help='empty the PostgreSQL tables first')
+    parser.add_argument('--skip-orphans', action='store_true',
+                        help='leave out rows whose foreign key points at a missing row')
+    parser.add_argument('--verify-only', action='store_true', help='only compare the two databases')
+    args = parser.parse_args()
+
+    if not database.DATABASE_URL:
+        print("✗ Set DATABASE_URL to the PostgreSQL database to migrate into")
+        sys.exit(1)
+    if not os.path.exists(args.sqlite):
+        print(f"✗ SQLite database not found: {args.sqlite}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    # Bulk COPYs are slow queries by design; workers inherit this
+    logging.getLogger('slow_query').setLevel(logging.ERROR)
+    # Creates the tables; the pool is emptied so worker processes open their own connections
+    with quiet():
+        database.init_schema()
+    source = connect_sqlite(args.sqlite)
+    db = connect_postgres()
+    only = set(args.tables.split(',')) if args.tables else None
+    print(f"Planning {args.sqlite} -> PostgreSQL")
+    plans = plan_tables(source, db, only, args.skip_orphans)
+    parts = [(table, part) for table, plan in plans.items() for part in split_parts(source, plan)]
+    source.close()
+
+    orphaned = {table: plan['orphans'] for table, plan in plans.items() if plan['orphans']}
+    for table, count in orphaned.items():
+        action = 'left out' if args.skip_orphans else 'found'
+        print(f"  {'-' if args.skip_orphans else '✗'} {table}: {count} rows with a missing foreign key {action}")
+    if orphaned and not args.skip_orphans and not args.verify_only:
+        print("✗ Nothing copied: fix or delete those rows in SQLite, or pass --skip-orphans to leave them out")
+        sys.exit(1)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if not args.verify_only:
+            tables = list(plans)
+            if args.truncate and tables:
+                db.execute_query(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY")
+            not_empty = [table for table in tables
+                         if db.fetch_one(f"SELECT EXISTS (SELECT 1 FROM {table})", use_primary=True)[0]]
+            if not_empty:
+                print(f"✗ PostgreSQL tables already have rows: {', '.join(not_empty)} (use --truncate to replace them)")
+                sys.exit(1)
+            db.close()
+
+            copied = 0
+            for number, group in enumerate(waves(plans), 1):
+                group_parts = [(table, part) for table, part in parts if table in group]
+                print(f"Wave {number}: {', '.join(sorted(group))} ({len(group_parts)} parts, {args.workers} workers)")
+                try:
+                    for table, count, seconds in run_parts(executor, copy_part, args.sqlite, plans, group_parts):
+                        copied += count
+                        print(f"  ✓ {table}: {count} rows in {seconds:.1f}s")
+                except Exception as e:
+                    executor.shutdown(cancel_futures=True)
+                    print(f"✗ Migration failed: {e}")
+                    print("  Fix the cause, then run again with --truncate")
+                    sys.exit(1)
+            elapsed = time.perf_counter() - started
+            print(f"✓ Copied {copied} rows in {elapsed:.1f}s ({copied / max(elapsed, 1e-9):.0f} rows/s)")
+
+            db = connect_postgres()
+            print(f"✓ Reset {reset_sequences(db, plans)} sequences")
+            # Fresh planner statistics for the newly loaded tables
+            db.optimize()
+
+        print("Verifying row counts and checksums")
+        totals = {table: [[0, 0], [0, 0]] for table in plans}
+        for table, source_sum, target_sum in run_parts(executor, verify_part, args.sqlite, plans, parts):
+            for side, (count, total) in zip(totals[table], (source_sum, target_sum)):
+                side[0] += count
+                side[1] = (side[1] + total) % CHECKSUM_MODULUS
+    db.close()
+
+    mismatched = []
+    for table in sorted(totals):
+        (source_count, source_total), (target_count, target_total) = totals[table]
+        ok = source_count == target_count and source_total == target_total
+        if not ok:
+            mismatched.append(table)
+        detail = ' (checksum differs)' if not ok and source_count == target_count else ''
+        print(f"  {'✓' if ok else '✗'} {table:<28} {source_count:>10} -> {target_count:>10}{detail}")
+    if mismatched:
+        print(f"✗ Verification failed for: {', '.join(mismatched)}")
+        sys.exit(1)
+    print(f"✓ All {len(totals)} tables match ({time.perf_counter() - started:.1f}s total)")
+
+
+if __name__ == '__main__':
+    main()
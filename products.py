@@ -1,4 +1,19 @@
 from database import Database
+import change_log
+import stock
+
+# Shared with the async routes in asgi.py; the *_COLUMNS name each query's columns
+# for the row mappers in app.py
+PRODUCT_COLUMNS = ('id', 'name', 'category', 'unit_price', 'quantity', 'minimum_stock', 'created_at')
+ALL_PRODUCTS_SQL = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products ORDER BY name"
+# Product columns, then the reorder engine's suggested quantity and days of cover
+LOW_STOCK_COLUMNS = PRODUCT_COLUMNS + ('suggested_quantity', 'days_of_cover')
+LOW_STOCK_SQL = f'''
+    SELECT {', '.join('p.' + column for column in PRODUCT_COLUMNS)}, r.suggested_quantity, r.days_of_cover FROM products p
+    LEFT JOIN reorder_suggestions r ON r.product_id = p.id
+    WHERE p.quantity <= p.minimum_stock OR r.status = 'REORDER'
+    ORDER BY p.quantity ASC
+'''
 
 class ProductManager:
     def __init__(self):
@@ -12,23 +27,38 @@ class ProductManager:
         '''
         params = (name, category, unit_price, quantity, minimum_stock)
         
-        if self.db.execute_query(query, params):
-            print(f"✓ Product '{name}' added successfully")
-            return True
-        else:
-            print(f"✗ Failed to add product '{name}'")
+        try:
+            with self.db.transaction():
+                product_id = self.db.execute_insert(query, params)
+                change_log.record(self.db, 'products', product_id, 'INSERT', {
+                    'name': name, 'category': category, 'unit_price': unit_price,
+                    'quantity': quantity, 'minimum_stock': minimum_stock
+                })
+                if quantity:
+                    # The opening stock is in the ledger, so reconciliation can check it
+                    stock.record_movement(self.db, product_id, 'ADD', quantity, notes='Opening stock')
+        except Exception as e:
+            print(f"✗ Failed to add product '{name}': {e}")
             return False
+        print(f"✓ Product '{name}' added successfully")
+        return True
 
     def get_all_products(self):
         """Get all products"""
-        query = 'SELECT * FROM products ORDER BY name'
-        return self.db.fetch_all(query)
+        return self.db.fetch_all(ALL_PRODUCTS_SQL)
 
     def get_product_by_id(self, product_id):
         """Get product by ID"""
         query = 'SELECT * FROM products WHERE id = ?'
         return self.db.fetch_one(query, (product_id,))
 
+    def get_products_by_ids(self, product_ids):
+        """Get several products in one query, as {id: row}"""
+        if not product_ids:
+            return {}
+        query = f"SELECT * FROM products WHERE id IN ({', '.join('?' for _ in product_ids)})"
+        return {row[0]: row for row in self.db.fetch_all(query, tuple(product_ids))}
+
     def get_product_by_name(self, name):
         """Get product by name"""
         query = 'SELECT * FROM products WHERE name = ?'
@@ -36,43 +66,49 @@ class ProductManager:
 
     def update_product(self, product_id, name=None, category=None, unit_price=None, minimum_stock=None):
         """Update product details"""
-        updates = []
-        params = []
+        changes = {}
 
         if name:
-            updates.append('name = ?')
-            params.append(name)
+            changes['name'] = name
         if category:
-            updates.append('category = ?')
-            params.append(category)
+            changes['category'] = category
         if unit_price:
-            updates.append('unit_price = ?')
-            params.append(unit_price)
+            changes['unit_price'] = unit_price
         if minimum_stock:
-            updates.append('minimum_stock = ?')
-            params.append(minimum_stock)
+            changes['minimum_stock'] = minimum_stock
 
-        if not updates:
+        if not changes:
             return False
 
-        params.append(product_id)
-        query = f'UPDATE products SET {", ".join(updates)} WHERE id = ?'
+        query = f'UPDATE products SET {", ".join(f"{column} = ?" for column in changes)} WHERE id = ?'
         
-        return self.db.execute_query(query, params)
+        try:
+            with self.db.transaction():
+                self.db.execute_query(query, list(changes.values()) + [product_id])
+                if minimum_stock:
+                    # Recomputed by the reorder engine's next run
+                    self.db.execute_query('DELETE FROM reorder_suggestions WHERE product_id = ?', (product_id,))
+                change_log.record(self.db, 'products', product_id, 'UPDATE', changes)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+        return True
 
     def delete_product(self, product_id):
         """Delete a product"""
         query = 'DELETE FROM products WHERE id = ?'
-        return self.db.execute_query(query, (product_id,))
+        try:
+            with self.db.transaction():
+                self.db.execute_query(query, (product_id,))
+                change_log.record(self.db, 'products', product_id, 'DELETE')
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return False
+        return True
 
     def get_low_stock_products(self):
-        """Get products with stock below minimum"""
-        query = '''
-            SELECT * FROM products 
-            WHERE quantity <= minimum_stock 
-            ORDER BY quantity ASC
-        '''
-        return self.db.fetch_all(query)
+        """Get products with stock below minimum or at their reorder point"""
+        return self.db.fetch_all(LOW_STOCK_SQL)
 
     def display_all_products(self):
         """Display all products in formatted table"""
@@ -0,0 +1,145 @@
+"""
+Query Profiler
+Records every statement run through Database (statement text, parameter count,
+duration, row count) for the current request.
+- Per-endpoint totals: requests, queries per request, DB time
+- Per-statement totals to find the hot queries
+- Statements slower than SLOW_QUERY_MS are logged to the 'slow_query' logger
+"""
+
+import os
+import re
+import threading
+import logging
+import contextvars
+from collections import deque
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+MAX_TRACKED_STATEMENTS = 500
+
+slow_logger = logging.getLogger('slow_query')
+
+# Per-request query list; a context variable so it follows both threads and asyncio tasks
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+_lock = threading.Lock()
+_endpoint_stats = {}
+_statement_stats = {}
+_slow_queries = deque(maxlen=100)
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(query):
+    """Collapse whitespace so the same statement always has the same key"""
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def start_request():
+    """Begin collecting queries for the current request"""
+    _request_queries.set([])
+
+
+def current_queries():
+    return _request_queries.get() or []
+
+
+def record_query(query, params, duration_ms, rowcount, error=None):
+    """Called by Database after every statement"""
+    statement = normalize_statement(query)
+    param_count = len(params) if params else 0
+
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.append((statement, param_count, duration_ms, rowcount))
+
+    with _lock:
+        stats = _statement_stats.get(statement)
+        if stats is None and len(_statement_stats) < MAX_TRACKED_STATEMENTS:
+            stats = _statement_stats[statement] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'errors': 0}
+        if stats is not None:
+            stats['calls'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['rows'] += rowcount or 0
+            if error:
+                stats['errors'] += 1
+
+    if duration_ms >= SLOW_QUERY_MS:
+        _slow_queries.append({
+            'statement': statement[:500],
+            'params': param_count,
+            'duration_ms': round(duration_ms, 2),
+            'rows': rowcount
+        })
+        slow_logger.warning(f"Slow query ({duration_ms:.1f} ms, {param_count} params, {rowcount} rows): {statement[:300]}")
+
+
+def finish_request(endpoint, total_ms):
+    """Fold this request's queries into the endpoint totals; returns (count, db_ms)"""
+    queries = _request_queries.get() or []
+    _request_queries.set(None)
+    count = len(queries)
+    db_ms = sum(q[2] for q in queries)
+
+    with _lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = _endpoint_stats[endpoint] = {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_ms': 0.0, 'max_db_ms': 0.0, 'total_ms': 0.0, 'max_total_ms': 0.0
+            }
+        stats['requests'] += 1
+        stats['queries'] += count
+        stats['max_queries'] = max(stats['max_queries'], count)
+        stats['db_ms'] += db_ms
+        stats['max_db_ms'] = max(stats['max_db_ms'], db_ms)
+        stats['total_ms'] += total_ms
+        stats['max_total_ms'] = max(stats['max_total_ms'], total_ms)
+    return count, db_ms
+
+
+def get_stats(top=20):
+    """Endpoint and statement totals for this worker process"""
+    with _lock:
+        endpoints = []
+        for endpoint, s in _endpoint_stats.items():
+            requests = s['requests'] or 1
+            endpoints.append({
+                'endpoint': endpoint,
+                'requests': s['requests'],
+                'avg_queries': round(s['queries'] / requests, 2),
+                'max_queries': s['max_queries'],
+                'avg_db_ms': round(s['db_ms'] / requests, 2),
+                'max_db_ms': round(s['max_db_ms'], 2),
+                'avg_total_ms': round(s['total_ms'] / requests, 2),
+                'max_total_ms': round(s['max_total_ms'], 2)
+            })
+        statements = []
+        for statement, s in _statement_stats.items():
+            statements.append({
+                'statement': statement[:500],
+                'calls': s['calls'],
+                'total_ms': round(s['total_ms'], 2),
+                'avg_ms': round(s['total_ms'] / s['calls'], 3) if s['calls'] else 0,
+                'max_ms': round(s['max_ms'], 2),
+                'rows': s['rows'],
+                'errors': s['errors']
+            })
+        slow = list(_slow_queries)
+
+    endpoints.sort(key=lambda e: e['avg_db_ms'] * e['requests'], reverse=True)
+    statements.sort(key=lambda s: s['total_ms'], reverse=True)
+    return {
+        'worker_pid': os.getpid(),
+        'slow_query_ms': SLOW_QUERY_MS,
+        'endpoints': endpoints,
+        'top_statements': statements[:top],
+        'slow_queries': slow
+    }
+
+
+def reset():
+    with _lock:
+        _endpoint_stats.clear()
+        _statement_stats.clear()
+        _slow_queries.clear()
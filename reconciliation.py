@@ -0,0 +1,187 @@
+"""
+Stock Reconciliation
+Checks products.quantity against the stock_movements ledger and reports (and
+optionally repairs) products where they disagree.
+
+expected quantity = opening_quantity + sum of signed movements
+- stock_ledger keeps each product's movement total up to a watermark
+  (stock_ledger_state.last_movement_id), so a nightly run only aggregates
+  movements added since the last run; --full re-aggregates the whole table
+  (movements deleted by cleanup_old_records then count as drift)
+- The ledger starts every product at zero: new products book their opening
+  stock as an ADD movement, so stock a product holds beyond its movements is
+  drift, on the first run too (products older than those opening movements
+  show their opening stock; repair them once with --repair ledger)
+- Repair either trusts products.quantity and books an ADJUST movement
+  ('ledger'), or trusts the ledger and corrects the quantity ('quantity')
+
+    python reconciliation.py [--full] [--repair ledger|quantity]
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+from database import Database, get_ist_datetime
+from stock import SIGNED_QUANTITY_SQL
+import metrics
+import events
+
+# '' reports only; 'ledger' or 'quantity' repairs drift found by the nightly job
+RECONCILE_REPAIR = os.environ.get('STOCK_RECONCILE_REPAIR', '')
+REPAIR_MODES = ('ledger', 'quantity')
+# Movements newer than this are reported on but not yet folded into the ledger
+SETTLE_SECONDS = int(os.environ.get('STOCK_RECONCILE_SETTLE_SECONDS', '300'))
+
+LEDGER_UPSERT_SQL = '''
+    INSERT INTO stock_ledger (product_id, opening_quantity, movement_total, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (product_id) DO UPDATE SET
+        opening_quantity = excluded.opening_quantity,
+        movement_total = excluded.movement_total,
+        updated_at = excluded.updated_at
+'''
+STATE_UPSERT_SQL = '''
+    INSERT INTO stock_ledger_state (id, last_movement_id, updated_at)
+    VALUES (1, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET last_movement_id = excluded.last_movement_id, updated_at = excluded.updated_at
+'''
+
+
+class StockReconciler:
+    def __init__(self):
+        self.db = Database()
+
+    def _settled_watermark(self, last_id):
+        """Highest movement id older than the settle window; ids below it won't change any more.
+
+        PostgreSQL ids aren't handed out in commit order, so the newest movements
+        are counted for the report but not folded into the ledger yet.
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        row = self.db.fetch_one('''
+            SELECT id FROM stock_movements WHERE created_at <= ? ORDER BY created_at DESC, id DESC LIMIT 1
+        ''', (cutoff,), use_primary=True)
+        return max(last_id, row[0] if row else 0)
+
+    def reconcile(self, full=False):
+        """Bring the ledger up to date and return the drift report.
+
+        Returns {'checked', 'added', 'movements_from', 'movements_to', 'drift'};
+        drift rows are dicts with product_id, name, quantity, expected and drift
+        (quantity - expected).
+        """
+        state = self.db.fetch_one('SELECT last_movement_id FROM stock_ledger_state WHERE id = 1', use_primary=True)
+        last_id = 0 if full or not state else state[0]
+        watermark = self._settled_watermark(last_id)
+
+        # One statement, so quantities and movements come from the same snapshot;
+        # only movements after the last watermark are aggregated (all of them with full=True).
+        # On SQLite, unary + stops the planner walking idx_stock_movements_product row by row.
+        group_key = 'product_id' if self.db.is_postgres else '+product_id'
+        products = self.db.fetch_all(f'''
+            SELECT p.id, p.name, p.quantity, COALESCE(m.settled, 0), COALESCE(m.recent, 0)
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id,
+                       SUM(CASE WHEN id <= ? THEN {SIGNED_QUANTITY_SQL} ELSE 0 END) AS settled,
+                       SUM(CASE WHEN id > ? THEN {SIGNED_QUANTITY_SQL} ELSE 0 END) AS recent
+                FROM stock_movements
+                WHERE id > ?
+                GROUP BY {group_key}
+            ) m ON m.product_id = p.id
+            ORDER BY p.id
+        ''', (watermark, watermark, last_id), use_primary=True)
+        if not products and self.db.fetch_one('SELECT COUNT(*) FROM products', use_primary=True)[0]:
+            # Don't advance the watermark past movements we failed to count
+            raise RuntimeError("Reconciliation query failed")
+        ledger = {row[0]: (row[1], row[2]) for row in self.db.fetch_all(
+            'SELECT product_id, opening_quantity, movement_total FROM stock_ledger', use_primary=True)}
+
+        now = get_ist_datetime()
+        drift, updates, added = [], [], 0
+        for product_id, name, quantity, settled, recent in products:
+            if product_id in ledger and not full:
+                opening, movement_total = ledger[product_id][0], ledger[product_id][1] + settled
+            else:
+                # Derived from the movements alone, never from the quantity it is checked against
+                opening, movement_total = 0, settled
+                added += product_id not in ledger
+            if ledger.get(product_id) != (opening, movement_total):
+                updates.append((product_id, opening, movement_total, now))
+            expected = opening + movement_total + recent
+            if quantity != expected:
+                drift.append({
+                    'product_id': product_id,
+                    'name': name,
+                    'quantity': quantity,
+                    'expected': expected,
+                    'drift': quantity - expected
+                })
+
+        with self.db.transaction():
+            for params in updates:
+                self.db.execute_query(LEDGER_UPSERT_SQL, params)
+            # Products deleted since the last run
+            self.db.execute_query('DELETE FROM stock_ledger WHERE product_id NOT IN (SELECT id FROM products)')
+            self.db.execute_query(STATE_UPSERT_SQL, (watermark, now))
+
+        metrics.STOCK_DRIFT_PRODUCTS.set(len(drift))
+        return {
+            'checked': len(products),
+            'added': added,
+            'movements_from': last_id,
+            'movements_to': watermark,
+            'drift': drift
+        }
+
+    def repair(self, drift, mode):
+        """Fix the products in a drift report; 'ledger' books ADJUST movements, 'quantity' resets stock"""
+        if mode not in REPAIR_MODES:
+            raise ValueError(f"Repair mode must be one of: {', '.join(REPAIR_MODES)}")
+        with self.db.transaction():
+            for row in drift:
+                if mode == 'ledger':
+                    self.db.execute_query(
+                        'INSERT INTO stock_movements (product_id, movement_type, quantity, notes) VALUES (?, ?, ?, ?)',
+                        (row['product_id'], 'ADJUST', row['drift'], 'Stock reconciliation')
+                    )
+                else:
+                    # Relative update so a sale made since the report isn't overwritten
+                    self.db.execute_query('UPDATE products SET quantity = quantity - ? WHERE id = ?',
+                                          (row['drift'], row['product_id']))
+            if mode == 'quantity' and drift:
+                # Open stock pages re-fetch rather than apply one delta per product
+                events.publish_after_commit(self.db, 'reset', {'reason': 'reconciliation'})
+        print(f"✓ Repaired {len(drift)} products ({mode})")
+        return len(drift)
+
+    def run(self, full=False, repair=None):
+        """Reconcile, repair if asked, and reconcile again so the report shows what is left"""
+        report = self.reconcile(full=full)
+        if repair and report['drift']:
+            report['repaired'] = self.repair(report['drift'], repair)
+            report['drift'] = self.reconcile()['drift']
+        return report
+
+    def close(self):
+        """Close database connection"""
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check products.quantity against stock_movements')
+    parser.add_argument('--full', action='store_true', help='Re-aggregate every movement instead of new ones')
+    parser.add_argument('--repair', choices=REPAIR_MODES, help='Fix drift by trusting quantity (ledger) or movements (quantity)')
+    args = parser.parse_args()
+
+    reconciler = StockReconciler()
+    report = reconciler.run(full=args.full, repair=args.repair)
+    reconciler.close()
+    print(f"✓ Checked {report['checked']} products against movements "
+          f"{report['movements_from']}..{report['movements_to']} ({report['added']} new to the ledger)")
+    for row in report['drift']:
+        print(f"✗ {row['product_id']:<6} {row['name']:<30} quantity {row['quantity']:<8} "
+              f"expected {row['expected']:<8} drift {row['drift']:+}")
+    sys.exit(1 if report['drift'] else 0)
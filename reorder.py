@@ -0,0 +1,180 @@
+"""
+Reorder Suggestions
+Works out when to reorder each product and how much, from its sales velocity,
+its supplier's lead time and its current stock.
+
+    units/day      = units sold over the last REORDER_VELOCITY_DAYS days / days
+                     (product_daily_sales, the per-day totals of transaction_items)
+    days of cover  = quantity / units/day
+    reorder point  = max(minimum_stock, units/day * (lead time + REORDER_SAFETY_DAYS))
+    suggested qty  = enough to last REORDER_COVER_DAYS beyond the reorder point
+
+- Lead times are per product in reorder_settings (REORDER_LEAD_TIME_DAYS
+  when not set)
+- A run only recomputes products with stock movements since the last run
+  (reorder_state.last_movement_id), plus products without a suggestion row
+  (new products, changed minimum stock or lead time); the first run of each
+  IST day recomputes everything so velocities follow the sliding window
+- Only rows whose result changed are written
+- The reorder_suggestions job runs it every 15 minutes; the API serves the
+  stored rows and never recomputes on a request
+
+    python reorder.py [--full]
+"""
+
+import os
+import sys
+import math
+import argparse
+from datetime import date, timedelta
+
+from database import Database, get_ist_datetime
+
+REORDER_LEAD_TIME_DAYS = int(os.environ.get('REORDER_LEAD_TIME_DAYS', '7'))
+REORDER_SAFETY_DAYS = int(os.environ.get('REORDER_SAFETY_DAYS', '3'))
+REORDER_COVER_DAYS = int(os.environ.get('REORDER_COVER_DAYS', '14'))
+REORDER_VELOCITY_DAYS = int(os.environ.get('REORDER_VELOCITY_DAYS', '30'))
+
+# Products to recompute with their current suggestion; {filter} is empty for a full run
+REORDER_INPUT_SQL = '''
+    SELECT p.id, p.quantity, p.minimum_stock, COALESCE(s.lead_time_days, ?),
+           COALESCE((SELECT SUM(d.quantity) FROM product_daily_sales d
+                     WHERE d.product_id = p.id AND d.sale_date >= ?), 0),
+           r.quantity, r.units_per_day, r.days_of_cover, r.lead_time_days, r.reorder_point,
+           r.suggested_quantity, r.status
+    FROM products p
+    LEFT JOIN reorder_settings s ON s.product_id = p.id
+    LEFT JOIN reorder_suggestions r ON r.product_id = p.id
+    {filter}
+'''
+TOUCHED_FILTER_SQL = '''
+    WHERE r.product_id IS NULL
+       OR p.id IN (SELECT product_id FROM stock_movements WHERE id > ?)
+'''
+# Upserted on product_id: a product's row is replaced by its new suggestion
+SUGGESTION_COLUMNS = ('product_id', 'quantity', 'units_per_day', 'days_of_cover', 'lead_time_days',
+                      'reorder_point', 'suggested_quantity', 'status', 'computed_at')
+STATE_UPSERT_SQL = '''
+    INSERT INTO reorder_state (id, last_movement_id, full_run_date, updated_at)
+    VALUES (1, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        last_movement_id = excluded.last_movement_id,
+        full_run_date = excluded.full_run_date,
+        updated_at = excluded.updated_at
+'''
+SUGGESTIONS_SQL = '''
+    SELECT r.product_id, p.name, p.category, r.quantity, p.minimum_stock, r.units_per_day, r.days_of_cover,
+           r.lead_time_days, r.reorder_point, r.suggested_quantity, r.computed_at, s.supplier_name
+    FROM reorder_suggestions r
+    JOIN products p ON p.id = r.product_id
+    LEFT JOIN reorder_settings s ON s.product_id = r.product_id
+    WHERE r.status = 'REORDER'
+    ORDER BY CASE WHEN r.days_of_cover IS NULL THEN 1 ELSE 0 END, r.days_of_cover, r.suggested_quantity DESC
+'''
+
+
+def suggest(quantity, minimum_stock, lead_time_days, units_sold, velocity_days=None):
+    """(units_per_day, days_of_cover, reorder_point, suggested_quantity, status) for one product"""
+    units_per_day = round(max(units_sold, 0) / (velocity_days or REORDER_VELOCITY_DAYS), 3)
+    days_of_cover = round(max(quantity, 0) / units_per_day, 1) if units_per_day else None
+    reorder_point = max(minimum_stock, math.ceil(units_per_day * (lead_time_days + REORDER_SAFETY_DAYS)))
+    if quantity > reorder_point:
+        return units_per_day, days_of_cover, reorder_point, 0, 'OK'
+    # Order up to the reorder point plus REORDER_COVER_DAYS of sales (at least one unit above it)
+    order_up_to = reorder_point + max(math.ceil(units_per_day * REORDER_COVER_DAYS), 1)
+    return units_per_day, days_of_cover, reorder_point, order_up_to - quantity, 'REORDER'
+
+
+class ReorderEngine:
+    def __init__(self):
+        self.db = Database()
+
+    def run(self, full=False):
+        """Recompute suggestions for products touched since the last run (all of them with full=True).
+
+        Returns {'full', 'computed', 'changed', 'movements_to'}.
+        """
+        now = get_ist_datetime()
+        today = now[:10]
+        state = self.db.fetch_one('SELECT last_movement_id, full_run_date FROM reorder_state WHERE id = 1',
+                                  use_primary=True)
+        full = full or not state or state[1] != today
+        # Read before the products so movements committed meanwhile are picked up next time
+        watermark = self.db.fetch_one('SELECT COALESCE(MAX(id), 0) FROM stock_movements', use_primary=True)[0]
+
+        since = (date.fromisoformat(today) - timedelta(days=REORDER_VELOCITY_DAYS - 1)).isoformat()
+        if full:
+            products = self.db.fetch_all(REORDER_INPUT_SQL.format(filter=''),
+                                         (REORDER_LEAD_TIME_DAYS, since), use_primary=True)
+        else:
+            products = self.db.fetch_all(REORDER_INPUT_SQL.format(filter=TOUCHED_FILTER_SQL),
+                                         (REORDER_LEAD_TIME_DAYS, since, state[0]), use_primary=True)
+
+        changes = []
+        for product_id, quantity, minimum_stock, lead_time_days, units_sold, *current in products:
+            units_per_day, days_of_cover, reorder_point, suggested, status = suggest(
+                quantity, minimum_stock, lead_time_days, units_sold)
+            row = (quantity, units_per_day, days_of_cover, lead_time_days, reorder_point, suggested, status)
+            if current[1] is not None:
+                # Rounded again: PostgreSQL REAL columns don't read back exactly
+                current[1] = round(current[1], 3)
+                current[2] = None if current[2] is None else round(current[2], 1)
+            if tuple(current) != row:
+                changes.append((product_id,) + row + (now,))
+
+        with self.db.transaction():
+            self.db.bulk_upsert('reorder_suggestions', SUGGESTION_COLUMNS, changes, ('product_id',))
+            if full:
+                # Products deleted since the last run
+                self.db.execute_query(
+                    'DELETE FROM reorder_suggestions WHERE product_id NOT IN (SELECT id FROM products)')
+            self.db.execute_query(STATE_UPSERT_SQL, (watermark, today if full else state[1], now))
+
+        return {'full': full, 'computed': len(products), 'changed': len(changes), 'movements_to': watermark}
+
+    def get_suggestions(self):
+        """Products at or below their reorder point, least cover first"""
+        return self.db.fetch_all(SUGGESTIONS_SQL, use_primary=True)
+
+    def last_run(self):
+        """When the suggestions were last recomputed (IST), or None before the first run"""
+        row = self.db.fetch_one('SELECT updated_at FROM reorder_state WHERE id = 1')
+        return row[0] if row else None
+
+    def set_lead_time(self, product_id, lead_time_days, supplier_name=None):
+        """Set a product's lead time; its suggestion is recomputed on the next run"""
+        if lead_time_days < 0:
+            raise ValueError("lead_time_days must not be negative")
+        with self.db.transaction():
+            self.db.execute_query('''
+                INSERT INTO reorder_settings (product_id, supplier_name, lead_time_days, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    supplier_name = excluded.supplier_name,
+                    lead_time_days = excluded.lead_time_days,
+                    updated_at = excluded.updated_at
+            ''', (product_id, supplier_name, lead_time_days, get_ist_datetime()))
+            self.db.execute_query('DELETE FROM reorder_suggestions WHERE product_id = ?', (product_id,))
+        return True
+
+    def close(self):
+        """Close database connection"""
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Recompute reorder suggestions')
+    parser.add_argument('--full', action='store_true', help='Recompute every product, not just touched ones')
+    args = parser.parse_args()
+
+    engine = ReorderEngine()
+    result = engine.run(full=args.full)
+    suggestions = engine.get_suggestions()
+    engine.close()
+    print(f"✓ Recomputed {result['computed']} products ({result['changed']} changed, "
+          f"{'full' if result['full'] else 'incremental'} run)")
+    for product_id, name, _, quantity, _, units_per_day, days_of_cover, lead, _, suggested, _, _ in suggestions:
+        cover = f"{days_of_cover:.1f}d" if days_of_cover is not None else '-'
+        print(f"  {product_id:<6} {name:<30} qty {quantity:<6} {units_per_day:.2f}/day cover {cover:<8} "
+              f"lead {lead}d order {suggested}")
+    sys.exit(0)
@@ -0,0 +1,224 @@
+"""
+Sales Velocity
+Per-product daily sales counters for the top-sellers report.
+- create_bill adds each stock item to product_daily_sales (one row per product
+  per IST day) in the bill's own transaction; delete_transaction subtracts it
+  again in the delete's transaction
+- Each worker keeps the last VELOCITY_MAX_DAYS days in a ring buffer of daily
+  buckets; only today's and yesterday's buckets are re-read, every
+  VELOCITY_TTL_SECONDS, and on the next report after this worker sells (from
+  the bill's day, when it sells or deletes a bill of an earlier day)
+- Top-K is a heap over the window's summed counters, not a scan of
+  transaction_items
+
+Bills removed by retention cleanup stay counted. To recompute the counters
+from the bills still on file:
+    python sales_velocity.py rebuild
+"""
+
+import os
+import sys
+import time
+import heapq
+import threading
+from datetime import date, timedelta
+
+from database import Database, get_ist_datetime
+
+VELOCITY_MAX_DAYS = int(os.environ.get('VELOCITY_MAX_DAYS', '90'))
+VELOCITY_TTL_SECONDS = float(os.environ.get('VELOCITY_TTL_SECONDS', '60'))
+
+DAILY_SALES_UPSERT_SQL = '''
+    INSERT INTO product_daily_sales (product_id, sale_date, quantity, revenue)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (product_id, sale_date) DO UPDATE SET
+        quantity = product_daily_sales.quantity + excluded.quantity,
+        revenue = product_daily_sales.revenue + excluded.revenue
+'''
+# Not an upsert: a missing row has nothing to subtract from, and a negative row
+# in an empty table would skip the first-start rebuild
+DAILY_SALES_SUBTRACT_SQL = '''
+    UPDATE product_daily_sales SET quantity = quantity - ?, revenue = revenue - ?
+    WHERE product_id = ? AND sale_date = ?
+'''
+DAILY_SALES_SQL = '''
+    SELECT sale_date, product_id, quantity, revenue
+    FROM product_daily_sales
+    WHERE sale_date >= ?
+'''
+# created_at is the IST timestamp create_bill writes
+REBUILD_SQL = '''
+    INSERT INTO product_daily_sales (product_id, sale_date, quantity, revenue)
+    SELECT ti.product_id, SUBSTR(CAST(t.created_at AS TEXT), 1, 10), SUM(ti.quantity), SUM(ti.total_price)
+    FROM transaction_items ti
+    JOIN transactions t ON t.id = ti.transaction_id
+    WHERE ti.product_id > 0 AND t.created_at >= ?
+    GROUP BY ti.product_id, SUBSTR(CAST(t.created_at AS TEXT), 1, 10)
+'''
+
+
+def parse_window(window):
+    """'7d' / '30d' / '90d' (any 1..VELOCITY_MAX_DAYS days) -> number of days"""
+    try:
+        days = int(str(window).strip().lower().rstrip('d'))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= VELOCITY_MAX_DAYS:
+        raise ValueError(f"window must be between 1d and {VELOCITY_MAX_DAYS}d")
+    return days
+
+
+def _product_totals(items):
+    """{product_id: (quantity, revenue)} of the stock items (manual items have product_id 0)"""
+    totals = {}
+    for product_id, quantity, revenue in items:
+        if product_id and product_id > 0:
+            qty, rev = totals.get(product_id, (0, 0.0))
+            totals[product_id] = (qty + quantity, rev + revenue)
+    return totals
+
+
+def _invalidate_after_commit(db, sale_date):
+    velocity = _velocity
+    if velocity is not None:
+        # Show this worker's own change on the next report rather than after the TTL
+        db.after_commit(lambda: velocity.invalidate(sale_date))
+
+
+def record_sales(db, sale_date, items):
+    """Add a bill's stock items [(product_id, quantity, revenue)] to the daily counters.
+
+    Call inside the bill's db.transaction() so the counters commit with it.
+    """
+    for product_id, (quantity, revenue) in _product_totals(items).items():
+        db.execute_query(DAILY_SALES_UPSERT_SQL, (product_id, sale_date, quantity, revenue))
+    _invalidate_after_commit(db, sale_date)
+
+
+def remove_sales(db, sale_date, items):
+    """Subtract a deleted bill's stock items from the daily counters of its sale date.
+
+    Call inside the delete's db.transaction() so the counters commit with it.
+    """
+    for product_id, (quantity, revenue) in _product_totals(items).items():
+        db.execute_query(DAILY_SALES_SUBTRACT_SQL, (quantity, revenue, product_id, sale_date))
+    _invalidate_after_commit(db, sale_date)
+
+
+def rebuild(db, days=None):
+    """Recompute the counters for the last `days` days from bill history; returns rows written"""
+    since = (date.fromisoformat(get_ist_datetime()[:10]) - timedelta(days=(days or VELOCITY_MAX_DAYS) - 1)).isoformat()
+    with db.transaction():
+        db.execute_query('DELETE FROM product_daily_sales WHERE sale_date >= ?', (since,))
+        db.execute_query(REBUILD_SQL, (since,))
+    row = db.fetch_one('SELECT COUNT(*) FROM product_daily_sales WHERE sale_date >= ?', (since,), use_primary=True)
+    return row[0] if row else 0
+
+
+class SalesVelocity:
+    """Ring buffer of daily {product_id: [quantity, revenue]} buckets"""
+
+    def __init__(self, max_days=None):
+        self.max_days = max_days or VELOCITY_MAX_DAYS
+        self._days = [None] * self.max_days
+        self._buckets = [{} for _ in range(self.max_days)]
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._today = None
+        # Earliest day changed by this worker that falls outside the regular re-read
+        self._reload_from = None
+
+    def _load(self, db, since):
+        rows = db.fetch_all(DAILY_SALES_SQL, (since.isoformat(),))
+        fresh = {}
+        for sale_date, product_id, quantity, revenue in rows:
+            fresh.setdefault(date.fromisoformat(str(sale_date)[:10]).toordinal(), {})[product_id] = \
+                [quantity, revenue]
+        for day in range(since.toordinal(), self._today + 1):
+            index = day % self.max_days
+            self._days[index] = day
+            self._buckets[index] = fresh.get(day, {})
+
+    def refresh(self, force=False):
+        """Reload every bucket once, then only today's and yesterday's when the TTL expires"""
+        today = date.fromisoformat(get_ist_datetime()[:10])
+        if not force and today.toordinal() == self._today and time.time() - self._loaded_at < VELOCITY_TTL_SECONDS:
+            return
+        full = force or self._today is None or today.toordinal() - self._today >= self.max_days - 1
+        since = today - timedelta(days=self.max_days - 1 if full else max(1, today.toordinal() - self._today + 1))
+        reload_from = self._reload_from
+        if reload_from is not None:
+            since = min(since, date.fromordinal(max(reload_from, today.toordinal() - self.max_days + 1)))
+        db = Database()
+        try:
+            if self._today is None and not db.fetch_one('SELECT 1 FROM product_daily_sales LIMIT 1'):
+                # First start since the counters were added: fill them from bill history
+                rebuild(db, self.max_days)
+            with self._lock:
+                self._today = today.toordinal()
+                self._load(db, since)
+                self._loaded_at = time.time()
+                if self._reload_from == reload_from:
+                    self._reload_from = None
+        finally:
+            db.close()
+
+    def invalidate(self, sale_date=None):
+        """Re-read today's and yesterday's buckets on the next report (after this worker commits sales),
+        and every bucket from sale_date on if it is earlier.
+
+        Reloading rather than adding the sale in place: a load that already read the
+        committed counters would otherwise count it twice.
+        """
+        with self._lock:
+            self._loaded_at = 0.0
+            if sale_date is not None:
+                day = date.fromisoformat(str(sale_date)[:10]).toordinal()
+                if self._reload_from is None or day < self._reload_from:
+                    self._reload_from = day
+
+    def window_totals(self, days):
+        """{product_id: (quantity, revenue)} over the last `days` days including today"""
+        self.refresh()
+        totals = {}
+        with self._lock:
+            for day in range(self._today - days + 1, self._today + 1):
+                index = day % self.max_days
+                if self._days[index] != day:
+                    continue
+                for product_id, (quantity, revenue) in self._buckets[index].items():
+                    qty, rev = totals.get(product_id, (0, 0.0))
+                    totals[product_id] = (qty + quantity, rev + revenue)
+        return totals
+
+    def top_products(self, days, k=10, by='quantity'):
+        """[(product_id, quantity, revenue)] for the k best sellers in the window"""
+        key = (lambda item: item[1][0]) if by == 'quantity' else (lambda item: item[1][1])
+        # Products whose bills were all deleted are left with zero counters
+        sold = ((product_id, totals) for product_id, totals in self.window_totals(days).items() if totals[0] > 0)
+        best = heapq.nlargest(k, sold, key=key)
+        return [(product_id, quantity, revenue) for product_id, (quantity, revenue) in best]
+
+
+_velocity = None
+_velocity_lock = threading.Lock()
+
+
+def get_velocity():
+    """This process's SalesVelocity"""
+    global _velocity
+    if _velocity is None:
+        with _velocity_lock:
+            if _velocity is None:
+                _velocity = SalesVelocity()
+    return _velocity
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("Usage: python sales_velocity.py rebuild [days]")
+        sys.exit(1)
+    db = Database()
+    count = rebuild(db, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    db.close()
+    print(f"✓ Rebuilt {count} daily sales counters")
@@ -0,0 +1,130 @@
+"""
+JSON Serialization
+Row-to-dict mapping and JSON encoding for the list routes (/api/products,
+/api/stock-report, /api/bills and their asgi.py twins).
+- RowMapper turns one query's rows into dicts. Its fields are written
+  against the query's column names and compiled once, when the mapper is
+  created, into a single function that builds the dict in one step: no
+  per-row loop over fields, no name lookups
+- dumps() uses orjson when it is installed (pip install orjson), and the
+  standard json module otherwise; both give the same JSON
+- array_response() sends a list of rows as a JSON array, streamed in chunks
+  of STREAM_CHUNK_ROWS once it is longer than STREAM_THRESHOLD rows, so the
+  whole body never sits in memory as one string
+"""
+
+import os
+import ast
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_THRESHOLD = int(os.environ.get('JSON_STREAM_THRESHOLD', '2000'))
+STREAM_CHUNK_ROWS = int(os.environ.get('JSON_STREAM_CHUNK_ROWS', '500'))
+
+# Names a field expression may use besides the query's columns
+FIELD_BUILTINS = {'max': max, 'min': min, 'int': int, 'float': float, 'round': round}
+
+
+def _default(value):
+    """Types the database hands back that JSON has no type for"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        # Same text as SQLite's TIMESTAMP columns, on PostgreSQL too
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data):
+        """JSON as bytes"""
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+    def dumps(data):
+        """JSON as bytes"""
+        return _encoder.encode(data).encode()
+
+
+class _ColumnBinder(ast.NodeTransformer):
+    """Rewrites column names in a field expression to row[<position>]"""
+
+    def __init__(self, positions):
+        self.positions = positions
+
+    def visit_Name(self, node):
+        if node.id in self.positions:
+            return ast.copy_location(ast.Subscript(
+                value=ast.Name(id='row', ctx=ast.Load()),
+                slice=ast.Constant(self.positions[node.id]),
+                ctx=ast.Load()), node)
+        if node.id not in FIELD_BUILTINS:
+            raise NameError(f"'{node.id}' is not a column of this query")
+        return node
+
+
+class RowMapper:
+    """
+    Maps a query's rows to dicts.
+
+    columns: the query's column names, in SELECT order
+    fields: output key -> column name, or a Python expression over column
+            names (e.g. "'LOW' if quantity <= minimum_stock else 'OK'")
+    """
+
+    def __init__(self, columns, fields):
+        self.columns = tuple(columns)
+        self.fields = dict(fields)
+        self.to_dict = self._compile()
+
+    def _compile(self):
+        binder = _ColumnBinder({name: i for i, name in enumerate(self.columns)})
+        entries = []
+        for key, expression in self.fields.items():
+            tree = binder.visit(ast.parse(expression, mode='eval'))
+            entries.append(f"{key!r}: {ast.unparse(tree.body)}")
+        source = f"lambda row: {{{', '.join(entries)}}}"
+        return eval(compile(source, f"<RowMapper {', '.join(self.fields)}>", 'eval'), dict(FIELD_BUILTINS))
+
+    def __call__(self, row):
+        return self.to_dict(row)
+
+    def map(self, rows):
+        return list(map(self.to_dict, rows))
+
+
+def iter_array(rows, mapper, prefix=b'', suffix=b''):
+    """A JSON array of the mapped rows, in chunks of STREAM_CHUNK_ROWS (between prefix and suffix)"""
+    to_dict = getattr(mapper, 'to_dict', mapper)
+    yield prefix + b'['
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        chunk = dumps(list(map(to_dict, rows[start:start + STREAM_CHUNK_ROWS])))
+        # Each chunk is a complete array: drop its brackets and join with commas
+        yield (b',' if start else b'') + chunk[1:-1]
+    yield b']' + suffix
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def array_response(rows, mapper, prefix=b'', suffix=b'', status=200):
+    """
+    JSON response for a list of rows, streamed when there are more than
+    STREAM_THRESHOLD; mapper is a RowMapper or any function of one row
+    """
+    if len(rows) > STREAM_THRESHOLD:
+        return Response(iter_array(rows, mapper, prefix, suffix), status=status, mimetype='application/json')
+    body = dumps(list(map(getattr(mapper, 'to_dict', mapper), rows)))
+    return Response(prefix + body + suffix, status=status, mimetype='application/json')
@@ -0,0 +1,179 @@
+// Offline bill queue for the billing page
+// Bills made while the server can't be reached are saved to IndexedDB and sent to
+// /api/billing/sync in batches once it can. Each bill carries a client_id (the
+// Idempotency-Key of a direct attempt that failed), so a bill that got through, or a
+// batch sent again after a dropped response, is created only once.
+
+const BillQueue = (function () {
+    const DB_NAME = 'saibaba-billing';
+    const STORE = 'bills';
+    const FAILED_STORE = 'failed_bills';
+    const BATCH_SIZE = 50;
+    const SYNC_TIMEOUT_MS = 15000;
+    const SYNC_INTERVAL_MS = 10000;
+    const MAX_BACKOFF_MS = 30000;
+
+    let dbPromise = null;
+    let syncing = false;
+    let backoff = 0;
+    let retryTimer = null;
+
+    const queue = {
+        available: 'indexedDB' in window,
+        onSynced: null,     // (results) after each batch
+        onChange: null      // (pendingCount) when the queue grows or shrinks
+    };
+
+    function open() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore(STORE, {keyPath: 'client_id'});
+                    request.result.createObjectStore(FAILED_STORE, {keyPath: 'client_id'});
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    function run(storeName, mode, action) {
+        return open().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(storeName, mode);
+            const result = action(tx.objectStore(storeName));
+            tx.oncomplete = () => resolve(result && result.result !== undefined ? result.result : undefined);
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+
+    function notifyChange() {
+        if (queue.onChange) {
+            queue.count().then(queue.onChange);
+        }
+    }
+
+    // Current time in IST as 'YYYY-MM-DD HH:MM:SS', the format bills are stored in
+    function istNow() {
+        return new Date(Date.now() + 330 * 60000).toISOString().slice(0, 19).replace('T', ' ');
+    }
+
+    queue.newId = function () {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    };
+
+    // Save a bill (the /api/billing/create payload) and start syncing; resolves with its client_id
+    queue.add = function (bill) {
+        const record = Object.assign({}, bill, {
+            client_id: bill.client_id || queue.newId(),
+            created_at: bill.created_at || istNow(),
+            queued_at: Date.now()
+        });
+        return run(STORE, 'readwrite', store => store.put(record)).then(() => {
+            notifyChange();
+            queue.sync();
+            return record.client_id;
+        });
+    };
+
+    queue.count = function () {
+        return run(STORE, 'readonly', store => store.count());
+    };
+
+    queue.failed = function () {
+        return run(FAILED_STORE, 'readonly', store => store.getAll());
+    };
+
+    function nextBatch() {
+        return run(STORE, 'readonly', store => store.getAll()).then(bills =>
+            bills.sort((a, b) => a.queued_at - b.queued_at).slice(0, BATCH_SIZE));
+    }
+
+    function settle(results, sent) {
+        const byId = {};
+        sent.forEach(bill => { byId[bill.client_id] = bill; });
+        return open().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction([STORE, FAILED_STORE], 'readwrite');
+            results.forEach(result => {
+                tx.objectStore(STORE).delete(result.client_id);
+                if (result.status === 'rejected' && byId[result.client_id]) {
+                    tx.objectStore(FAILED_STORE).put(Object.assign({}, byId[result.client_id], {error: result.error}));
+                }
+            });
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+
+    function scheduleRetry() {
+        backoff = Math.min(backoff ? backoff * 2 : 1000, MAX_BACKOFF_MS);
+        clearTimeout(retryTimer);
+        retryTimer = setTimeout(queue.sync, backoff);
+    }
+
+    // Send queued bills until the queue is empty or the server can't be reached
+    queue.sync = function () {
+        if (syncing || !queue.available) {
+            return Promise.resolve();
+        }
+        syncing = true;
+        return nextBatch().then(bills => {
+            if (bills.length === 0) {
+                return false;
+            }
+            const controller = new AbortController();
+            const timer = setTimeout(() => controller.abort(), SYNC_TIMEOUT_MS);
+            const payload = bills.map(({queued_at, ...bill}) => bill);
+            return fetch('/api/billing/sync', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({bills: payload}),
+                signal: controller.signal
+            })
+            .finally(() => clearTimeout(timer))
+            .then(r => {
+                if (!r.ok) {
+                    throw new Error('Sync failed: ' + r.status);
+                }
+                return r.json();
+            })
+            .then(data => settle(data.results, bills).then(() => {
+                backoff = 0;
+                notifyChange();
+                if (queue.onSynced) {
+                    queue.onSynced(data.results);
+                }
+                return true;
+            }));
+        })
+        .then(more => {
+            syncing = false;
+            if (more) {
+                return queue.sync();
+            }
+        })
+        .catch(err => {
+            syncing = false;
+            console.warn('Bill sync will retry:', err);
+            scheduleRetry();
+        });
+    };
+
+    queue.start = function () {
+        if (!queue.available) {
+            return;
+        }
+        open().then(() => {
+            notifyChange();
+            queue.sync();
+        }).catch(() => { queue.available = false; });
+        window.addEventListener('online', () => queue.sync());
+        setInterval(queue.sync, SYNC_INTERVAL_MS);
+    };
+
+    return queue;
+})();
@@ -0,0 +1,62 @@
+// Live updates for open pages
+// Listens to /api/events (Server-Sent Events) and hands each bill, stock and payment
+// delta to the page's handlers, so pages don't re-fetch whole reports to stay current.
+// A 'reset' event means deltas were missed (reconnect to another worker, a stock
+// repair): the page re-fetches once through onReset. If the stream is refused, the
+// page is refreshed through onReset every RETRY_MS until the stream opens again.
+
+const LiveEvents = (function () {
+    const TYPES = ['bill', 'stock', 'payment'];
+    const RETRY_MS = 60000;
+
+    const handlers = {};
+    let source = null;
+
+    const live = {
+        onReset: null       // () when the page should load its full data again
+    };
+
+    live.on = function (type, handler) {
+        (handlers[type] = handlers[type] || []).push(handler);
+        return live;
+    };
+
+    function dispatch(type, event) {
+        const data = JSON.parse(event.data);
+        (handlers[type] || []).forEach(handler => handler(data));
+    }
+
+    function reset() {
+        if (live.onReset) {
+            live.onReset();
+        }
+    }
+
+    live.start = function () {
+        if (!('EventSource' in window) || source) {
+            return;
+        }
+        source = new EventSource('/api/events');
+        TYPES.forEach(type => source.addEventListener(type, event => dispatch(type, event)));
+        source.addEventListener('reset', reset);
+        source.onerror = () => {
+            // Dropped streams reconnect by themselves (with Last-Event-ID); a refused one is closed
+            if (source.readyState === EventSource.CLOSED) {
+                source = null;
+                setTimeout(() => {
+                    reset();
+                    live.start();
+                }, RETRY_MS);
+            }
+        };
+    };
+
+    // A product's low-stock state before and after a stock delta (+1, 0 or -1 to the low-stock count)
+    live.lowStockChange = function (delta) {
+        const wasLow = delta.quantity - delta.change <= delta.minimum_stock;
+        const isLow = delta.quantity <= delta.minimum_stock;
+        return (isLow ? 1 : 0) - (wasLow ? 1 : 0);
+    };
+
+    return live;
+})();
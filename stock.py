@@ -1,61 +1,106 @@
-from database import Database
-from datetime import datetime
+from database import Database, get_ist_datetime
+from datetime import datetime, timedelta
+import os
+import costing
+import events
+import change_log
+
+# Shared with the async routes in asgi.py
+STOCK_REPORT_COLUMNS = ('id', 'name', 'category', 'quantity', 'unit_price', 'minimum_stock', 'total_value')
+STOCK_REPORT_SQL = '''
+    SELECT id, name, category, quantity, unit_price, minimum_stock,
+           (quantity * unit_price) as total_value
+    FROM products
+    ORDER BY category
+'''
+# Movement quantities are stored positive and SALE/REMOVE take stock out;
+# ADJUST (stock reconciliation) is stored signed
+SIGNED_QUANTITY_SQL = "CASE WHEN movement_type IN ('SALE', 'REMOVE') THEN -quantity ELSE quantity END"
+
+# Daily snapshots older than this are pruned, except the last one of each month
+SNAPSHOT_KEEP_DAYS = int(os.environ.get('STOCK_SNAPSHOT_KEEP_DAYS', '90'))
+
+MOVEMENT_INSERT_SQL = '''
+    INSERT INTO stock_movements (product_id, movement_type, quantity, reference_id, notes) VALUES (?, ?, ?, ?, ?)
+'''
+
+IST_OFFSET = timedelta(hours=5, minutes=30)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def record_movement(db, product_id, movement_type, quantity, reference_id=None, notes=None):
+    """Insert a stock movement; call inside the stock change's db.transaction()"""
+    return db.execute_query(MOVEMENT_INSERT_SQL, (product_id, movement_type, quantity, reference_id, notes))
+
+
+def parse_as_of(value):
+    """IST 'YYYY-MM-DD' (end of that day) or 'YYYY-MM-DD HH:MM:SS' -> UTC cutoff string"""
+    value = value.strip()
+    if len(value) == 10:
+        value += ' 23:59:59'
+    try:
+        ist = datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError("as_of must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+    # stock_movements.created_at is UTC (CURRENT_TIMESTAMP)
+    return (ist - IST_OFFSET).strftime(TIMESTAMP_FORMAT)
+
 
 class StockManager:
     def __init__(self):
         self.db = Database()
 
-    def add_stock(self, product_id, quantity, notes=""):
-        """Add stock for a product"""
-        # Update product quantity
-        product = self.db.fetch_one('SELECT quantity FROM products WHERE id = ?', (product_id,))
-        
-        if not product:
-            print("Product not found")
+    def add_stock(self, product_id, quantity, notes="", unit_cost=None, source='STOCK_ADD', source_id=None):
+        """Add stock for a product; unit_cost (purchase price) feeds the cost layers for margin reports"""
+        # Relative update, then read back inside the transaction: concurrent
+        # adds to the same product can't overwrite each other
+        update_query = 'UPDATE products SET quantity = quantity + ? WHERE id = ?'
+        try:
+            with self.db.transaction():
+                if self.db.execute_rowcount(update_query, (quantity, product_id)) == 0:
+                    print("Product not found")
+                    return False
+                product = self.db.fetch_one('SELECT quantity, minimum_stock, unit_price FROM products WHERE id = ?',
+                                            (product_id,))
+                new_quantity = product[0]
+                record_movement(self.db, product_id, 'ADD', quantity, notes=notes)
+                costing.record_receipt(self.db, product_id, quantity, unit_cost, new_quantity - quantity,
+                                       source, source_id)
+                change_log.record(self.db, 'products', product_id, 'UPDATE', {'quantity': new_quantity})
+                events.publish_after_commit(self.db, 'stock', dict(
+                    events.stock_delta(product_id, new_quantity, product[1], product[2], quantity), movement_type='ADD'))
+        except Exception as e:
+            print(f"✗ Failed to update stock: {e}")
             return False
-
-        new_quantity = product[0] + quantity
-        
-        # Update product
-        update_query = 'UPDATE products SET quantity = ? WHERE id = ?'
-        self.db.execute_query(update_query, (new_quantity, product_id))
-
-        # Record movement
-        movement_query = '''
-            INSERT INTO stock_movements (product_id, movement_type, quantity, notes)
-            VALUES (?, ?, ?, ?)
-        '''
-        self.db.execute_query(movement_query, (product_id, 'ADD', quantity, notes))
         
         print(f"✓ Added {quantity} units. New stock: {new_quantity}")
         return True
 
     def remove_stock(self, product_id, quantity, notes=""):
         """Remove stock for a product"""
-        product = self.db.fetch_one('SELECT quantity, name FROM products WHERE id = ?', (product_id,))
-        
-        if not product:
-            print("Product not found")
+        # Checked and applied in one statement, so concurrent removals can't oversell
+        update_query = 'UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?'
+        try:
+            with self.db.transaction():
+                updated = self.db.execute_rowcount(update_query, (quantity, product_id, quantity))
+                product = self.db.fetch_one('SELECT quantity, name, minimum_stock, unit_price FROM products WHERE id = ?',
+                                            (product_id,))
+                if not product:
+                    print("Product not found")
+                    return False
+                if updated == 0:
+                    print(f"✗ Insufficient stock. Available: {product[0]}, Requested: {quantity}")
+                    return False
+                new_quantity, product_name = product[0], product[1]
+                record_movement(self.db, product_id, 'REMOVE', quantity, notes=notes)
+                costing.consume(self.db, product_id, quantity)
+                change_log.record(self.db, 'products', product_id, 'UPDATE', {'quantity': new_quantity})
+                events.publish_after_commit(self.db, 'stock', dict(
+                    events.stock_delta(product_id, new_quantity, product[2], product[3], -quantity),
+                    movement_type='REMOVE'))
+        except Exception as e:
+            print(f"✗ Failed to update stock: {e}")
             return False
-
-        current_qty, product_name = product[0], product[1]
-
-        if current_qty < quantity:
-            print(f"✗ Insufficient stock. Available: {current_qty}, Requested: {quantity}")
-            return False
-
-        new_quantity = current_qty - quantity
-        
-        # Update product
-        update_query = 'UPDATE products SET quantity = ? WHERE id = ?'
-        self.db.execute_query(update_query, (new_quantity, product_id))
-
-        # Record movement
-        movement_query = '''
-            INSERT INTO stock_movements (product_id, movement_type, quantity, notes)
-            VALUES (?, ?, ?, ?)
-        '''
-        self.db.execute_query(movement_query, (product_id, 'REMOVE', quantity, notes))
         
         print(f"✓ Removed {quantity} units from '{product_name}'. New stock: {new_quantity}")
         return True
@@ -71,15 +116,116 @@ class StockManager:
         '''
         return self.db.fetch_all(query, (product_id, limit))
 
-    def get_stock_report(self):
-        """Generate stock report"""
+    def take_snapshot(self):
+        """Record every product's quantity as today's (IST) snapshot; returns products snapshotted"""
+        snapshot_date = get_ist_datetime()[:10]
+        taken_at = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        keep_from = (datetime.utcnow() + IST_OFFSET - timedelta(days=SNAPSHOT_KEEP_DAYS)).strftime('%Y-%m-%d')
+        with self.db.transaction():
+            self.db.execute_query('DELETE FROM stock_snapshots WHERE snapshot_date = ?', (snapshot_date,))
+            self.db.execute_query('''
+                INSERT INTO stock_snapshots (snapshot_date, product_id, quantity, unit_price, taken_at)
+                SELECT ?, id, quantity, unit_price, ? FROM products
+            ''', (snapshot_date, taken_at))
+            # Keep month-end snapshots for audits
+            self.db.execute_query('''
+                DELETE FROM stock_snapshots
+                WHERE snapshot_date < ?
+                AND snapshot_date NOT IN (
+                    SELECT MAX(snapshot_date) FROM stock_snapshots GROUP BY SUBSTR(snapshot_date, 1, 7)
+                )
+            ''', (keep_from,))
+        count = self.db.fetch_one('SELECT COUNT(*) FROM stock_snapshots WHERE snapshot_date = ?',
+                                  (snapshot_date,), use_primary=True)
+        return count[0] if count else 0
+
+    def _movement_delta(self, after, until, product_ids):
+        """Net signed quantity per product for movements in (after, until]"""
+        query = f'''
+            SELECT product_id, SUM({SIGNED_QUANTITY_SQL})
+            FROM stock_movements
+            WHERE created_at > ? AND created_at <= ?
+        '''
+        params = [after, until]
+        if product_ids:
+            query += f" AND product_id IN ({', '.join('?' for _ in product_ids)})"
+            params += list(product_ids)
+        query += ' GROUP BY product_id'
+        return {row[0]: row[1] or 0 for row in self.db.fetch_all(query, tuple(params))}
+
+    def _nearest_snapshot(self, cutoff, now):
+        """(snapshot_date, taken_at) of the snapshot closest to cutoff, or None if current stock is closer"""
+        before = self.db.fetch_one('''
+            SELECT snapshot_date, taken_at FROM stock_snapshots
+            WHERE taken_at <= ? ORDER BY taken_at DESC LIMIT 1
+        ''', (cutoff,))
+        after = self.db.fetch_one('''
+            SELECT snapshot_date, taken_at FROM stock_snapshots
+            WHERE taken_at > ? ORDER BY taken_at LIMIT 1
+        ''', (cutoff,))
+        cutoff_time = datetime.strptime(cutoff, TIMESTAMP_FORMAT)
+        best, best_distance = None, abs((datetime.strptime(now, TIMESTAMP_FORMAT) - cutoff_time).total_seconds())
+        for snapshot in (before, after):
+            if snapshot:
+                distance = abs((datetime.strptime(snapshot[1], TIMESTAMP_FORMAT) - cutoff_time).total_seconds())
+                if distance < best_distance:
+                    best, best_distance = snapshot, distance
+        return best
+
+    def get_stock_as_of(self, as_of, product_ids=None):
+        """Stock on hand at an IST date/time, rebuilt from the nearest snapshot plus the movements since.
+
+        Returns {'as_of', 'source', 'items'} where items are rows shaped like
+        STOCK_REPORT_SQL (valued at the snapshot's price, or today's price).
+        Products created after as_of are left out.
+        """
+        cutoff = parse_as_of(as_of)
+        now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        snapshot = self._nearest_snapshot(cutoff, now) if cutoff < now else None
+
         query = '''
-            SELECT id, name, category, quantity, unit_price, minimum_stock,
-                   (quantity * unit_price) as total_value
-            FROM products
-            ORDER BY category
+            SELECT p.id, p.name, p.category, p.quantity, p.unit_price, p.minimum_stock,
+                   s.quantity, s.unit_price
+            FROM products p
+            LEFT JOIN stock_snapshots s ON s.product_id = p.id AND s.snapshot_date = ?
+            WHERE p.created_at <= ?
         '''
-        return self.db.fetch_all(query)
+        params = [snapshot[0] if snapshot else '', cutoff]
+        if product_ids:
+            query += f" AND p.id IN ({', '.join('?' for _ in product_ids)})"
+            params += list(product_ids)
+        products = self.db.fetch_all(query + ' ORDER BY p.category', tuple(params))
+
+        # Replay only the movements between the anchor and the cutoff, in whichever direction
+        unsnapshotted = [row[0] for row in products if row[6] is None]
+        current_delta = {}
+        if unsnapshotted and cutoff < now:
+            current_delta = self._movement_delta(cutoff, now, unsnapshotted if snapshot else product_ids)
+        snapshot_delta = {}
+        if snapshot and snapshot[1] <= cutoff:
+            snapshot_delta = self._movement_delta(snapshot[1], cutoff, product_ids)
+        elif snapshot:
+            snapshot_delta = {pid: -qty for pid, qty in self._movement_delta(cutoff, snapshot[1], product_ids).items()}
+
+        items = []
+        for product_id, name, category, quantity, unit_price, min_stock, snap_quantity, snap_price in products:
+            if snap_quantity is not None:
+                quantity = snap_quantity + snapshot_delta.get(product_id, 0)
+                unit_price = snap_price
+            else:
+                # Not in the snapshot (added since); work back from current stock
+                quantity = quantity - current_delta.get(product_id, 0)
+            items.append((product_id, name, category, quantity, unit_price, min_stock, quantity * unit_price))
+
+        return {
+            'as_of': as_of,
+            'source': f"snapshot {snapshot[0]}" if snapshot else 'current stock',
+            'items': items
+        }
+
+    def get_stock_report(self):
+        """Generate stock report"""
+        return self.db.fetch_all(STOCK_REPORT_SQL)
 
     def display_stock_report(self):
         """Display stock report in formatted table"""
@@ -1,4 +1,5 @@
 from database import Database
+import change_log
 from datetime import datetime
 
 class SupplierBillManager:
@@ -11,19 +12,21 @@ class SupplierBillManager:
     
     def add_bill(self, supplier_name, bill_number, bill_date, total_amount, description='', due_date=None):
         """Add a new supplier bill"""
-        cursor = self.db.cursor
-        cursor.execute('''
-            INSERT INTO supplier_bills (supplier_name, bill_number, bill_date, total_amount, description, due_date, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'UNPAID')
-        ''', (supplier_name, bill_number, bill_date, total_amount, description, due_date))
-        self.db.connection.commit()
-        return cursor.lastrowid
+        with self.db.transaction():
+            bill_id = self.db.execute_insert('''
+                INSERT INTO supplier_bills (supplier_name, bill_number, bill_date, total_amount, description, due_date, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'UNPAID')
+            ''', (supplier_name, bill_number, bill_date, total_amount, description, due_date))
+            change_log.record(self.db, 'supplier_bills', bill_id, 'INSERT', {
+                'supplier_name': supplier_name, 'bill_number': bill_number, 'bill_date': bill_date,
+                'total_amount': total_amount, 'description': description, 'due_date': due_date, 'status': 'UNPAID'
+            })
+        return bill_id
     
     def get_all_bills(self, status=None):
         """Get all supplier bills, optionally filtered by status"""
-        cursor = self.db.cursor
         if status:
-            cursor.execute('''
+            rows = self.db.fetch_all('''
                 SELECT id, supplier_name, bill_number, bill_date, total_amount, paid_amount, 
                        status, description, due_date, created_at, paid_at,
                        (SELECT MAX(payment_date) FROM supplier_bill_payments p WHERE p.bill_id = supplier_bills.id) as last_payment_date
@@ -32,7 +35,7 @@ class SupplierBillManager:
                 ORDER BY bill_date DESC, created_at DESC
             ''', (status,))
         else:
-            cursor.execute('''
+            rows = self.db.fetch_all('''
                 SELECT id, supplier_name, bill_number, bill_date, total_amount, paid_amount, 
                        status, description, due_date, created_at, paid_at,
                        (SELECT MAX(payment_date) FROM supplier_bill_payments p WHERE p.bill_id = supplier_bills.id) as last_payment_date
@@ -41,7 +44,7 @@ class SupplierBillManager:
             ''')
         
         bills = []
-        for row in cursor.fetchall():
+        for row in rows:
             bills.append({
                 'id': row[0],
                 'supplier_name': row[1],
@@ -60,15 +63,14 @@ class SupplierBillManager:
     
     def get_bill(self, bill_id):
         """Get a single supplier bill by ID"""
-        cursor = self.db.cursor
-        cursor.execute('''
+        # Read from the primary: payments compute the new paid amount from this row
+        row = self.db.fetch_one('''
             SELECT id, supplier_name, bill_number, bill_date, total_amount, paid_amount, 
                    status, description, due_date, created_at, paid_at
             FROM supplier_bills
             WHERE id = ?
-        ''', (bill_id,))
+        ''', (bill_id,), use_primary=True)
         
-        row = cursor.fetchone()
         if row:
             return {
                 'id': row[0],
@@ -87,8 +89,6 @@ class SupplierBillManager:
 
     def get_supplier_groups(self, status=None):
         """Return aggregated rows per supplier with totals and last payment date"""
-        cursor = self.db.cursor
-        
         if status:
             query = '''
                 SELECT 
@@ -108,7 +108,7 @@ class SupplierBillManager:
                 GROUP BY supplier_name
                 ORDER BY last_bill_date DESC, supplier_name ASC
             '''
-            cursor.execute(query, (status,))
+            rows = self.db.fetch_all(query, (status,))
         else:
             query = '''
                 SELECT 
@@ -127,10 +127,10 @@ class SupplierBillManager:
                 GROUP BY supplier_name
                 ORDER BY last_bill_date DESC, supplier_name ASC
             '''
-            cursor.execute(query)
+            rows = self.db.fetch_all(query)
 
         groups = []
-        for row in cursor.fetchall():
+        for row in rows:
             supplier, bill_count, total_amount, paid_amount, balance, first_bill_date, last_bill_date, open_bills, last_payment_date = row
             groups.append({
                 'supplier_name': supplier,
@@ -147,8 +147,7 @@ class SupplierBillManager:
 
     def get_bills_by_supplier(self, supplier_name):
         """Get all bills for a supplier with last payment date and history"""
-        cursor = self.db.cursor
-        cursor.execute('''
+        rows = self.db.fetch_all('''
             SELECT 
                 id, bill_number, bill_date, due_date, total_amount, paid_amount,
                 status, description, created_at, paid_at,
@@ -159,7 +158,7 @@ class SupplierBillManager:
         ''', (supplier_name,))
 
         bills = []
-        for row in cursor.fetchall():
+        for row in rows:
             bill_info = {
                 'id': row[0],
                 'bill_number': row[1],
@@ -179,8 +178,6 @@ class SupplierBillManager:
     
     def make_payment(self, bill_id, payment_amount, payment_date=None, notes=''):
         """Make a payment towards a bill"""
-        cursor = self.db.cursor
-        
         # Get current bill details
         bill = self.get_bill(bill_id)
         if not bill:
@@ -201,53 +198,55 @@ class SupplierBillManager:
         else:
             new_status = 'PARTIAL'
         
-        # Record the payment transaction
-        cursor.execute('''
+        with self.db.transaction():
+            # Record the payment transaction
+            self._insert_payment(bill_id, payment_amount, payment_date or datetime.now().strftime('%Y-%m-%d'), notes)
+
+            # Update the bill
+            self.db.execute_query('''
+                UPDATE supplier_bills
+                SET paid_amount = ?, status = ?, paid_at = ?
+                WHERE id = ?
+            ''', (new_paid_amount, new_status, paid_at, bill_id))
+            change_log.record(self.db, 'supplier_bills', bill_id, 'UPDATE',
+                              {'paid_amount': new_paid_amount, 'status': new_status, 'paid_at': paid_at})
+        return True
+
+    def _insert_payment(self, bill_id, payment_amount, payment_date, notes):
+        """Insert a supplier_bill_payments row; call inside db.transaction()"""
+        payment_id = self.db.execute_insert('''
             INSERT INTO supplier_bill_payments (bill_id, payment_amount, payment_date, notes)
             VALUES (?, ?, ?, ?)
-        ''', (bill_id, payment_amount, payment_date or datetime.now().strftime('%Y-%m-%d'), notes))
-        
-        # Update the bill
-        cursor.execute('''
-            UPDATE supplier_bills
-            SET paid_amount = ?, status = ?, paid_at = ?
-            WHERE id = ?
-        ''', (new_paid_amount, new_status, paid_at, bill_id))
-        
-        self.db.connection.commit()
-        return True
+        ''', (bill_id, payment_amount, payment_date, notes))
+        change_log.record(self.db, 'supplier_bill_payments', payment_id, 'INSERT', {
+            'bill_id': bill_id, 'payment_amount': payment_amount, 'payment_date': payment_date, 'notes': notes
+        })
     
     def _get_supplier_bill_queue(self, supplier_name):
         """Get unpaid/partial bills for a supplier in FIFO order"""
-        cursor = self.db.cursor
-        cursor.execute('''
+        return self.db.fetch_all('''
             SELECT id, bill_number, total_amount, paid_amount, bill_date
             FROM supplier_bills
             WHERE status != 'PAID' AND supplier_name = ?
             ORDER BY bill_date ASC, id ASC
-        ''', (supplier_name,))
-        return cursor.fetchall() or []
+        ''', (supplier_name,), use_primary=True)
 
     def _apply_payment_to_supplier_bill(self, bill_id, total_amount, current_paid, apply_amount, payment_date, notes):
-        """Apply payment to a single supplier bill"""
-        cursor = self.db.cursor
+        """Apply payment to a single supplier bill; call inside db.transaction()"""
         new_paid_amount = float(current_paid) + apply_amount
         new_status = 'PAID' if new_paid_amount + 0.01 >= float(total_amount) else 'PARTIAL'
         
         # Record payment
-        cursor.execute('''
-            INSERT INTO supplier_bill_payments (bill_id, payment_amount, payment_date, notes)
-            VALUES (?, ?, ?, ?)
-        ''', (bill_id, apply_amount, payment_date, notes))
+        self._insert_payment(bill_id, apply_amount, payment_date, notes)
         
         # Update bill
-        cursor.execute('''
+        self.db.execute_query('''
             UPDATE supplier_bills
             SET paid_amount = ?, status = ?
             WHERE id = ?
         ''', (new_paid_amount, new_status, bill_id))
-        
-        self.db.connection.commit()
+        change_log.record(self.db, 'supplier_bills', bill_id, 'UPDATE',
+                          {'paid_amount': new_paid_amount, 'status': new_status})
         return True, new_status, new_paid_amount
 
     def add_supplier_payment(self, supplier_name, payment_amount, payment_date, notes=""):
@@ -263,26 +262,30 @@ class SupplierBillManager:
         remaining = payment_amount
         allocations = []
         
-        for bill in queue:
-            bill_id, bill_no, total_amt, paid_amt, bill_date = bill
-            balance = float(total_amt) - float(paid_amt)
-            if balance <= 0:
-                continue
-            apply_amt = min(balance, remaining)
-            success, new_status, new_paid = self._apply_payment_to_supplier_bill(
-                bill_id, total_amt, paid_amt, apply_amt, payment_date, notes
-            )
-            if not success:
-                return False, "Payment failed", allocations
-            allocations.append({
-                'bill_number': bill_no,
-                'applied': apply_amt,
-                'new_status': new_status,
-                'new_balance': float(total_amt) - float(new_paid)
-            })
-            remaining -= apply_amt
-            if remaining <= 0:
-                break
+        try:
+            # The whole cascade commits together, or not at all
+            with self.db.transaction():
+                for bill in queue:
+                    bill_id, bill_no, total_amt, paid_amt, bill_date = bill
+                    balance = float(total_amt) - float(paid_amt)
+                    if balance <= 0:
+                        continue
+                    apply_amt = min(balance, remaining)
+                    success, new_status, new_paid = self._apply_payment_to_supplier_bill(
+                        bill_id, total_amt, paid_amt, apply_amt, payment_date, notes
+                    )
+                    allocations.append({
+                        'bill_number': bill_no,
+                        'applied': apply_amt,
+                        'new_status': new_status,
+                        'new_balance': float(total_amt) - float(new_paid)
+                    })
+                    remaining -= apply_amt
+                    if remaining <= 0:
+                        break
+        except Exception as e:
+            print(f"✗ Supplier payment failed: {e}")
+            return False, "Payment failed", []
         
         if not allocations:
             return False, "No eligible bills to apply payment", []
@@ -291,7 +294,6 @@ class SupplierBillManager:
 
     def mark_as_paid(self, bill_id, payment_date=None, notes=''):
         """Mark a bill as fully paid"""
-        cursor = self.db.cursor
         bill = self.get_bill(bill_id)
         if not bill:
             return False
@@ -305,34 +307,33 @@ class SupplierBillManager:
         else:
             paid_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Record the payment transaction for the remaining amount
-        if remaining_amount > 0:
-            cursor.execute('''
-                INSERT INTO supplier_bill_payments (bill_id, payment_amount, payment_date, notes)
-                VALUES (?, ?, ?, ?)
-            ''', (bill_id, remaining_amount, payment_date or datetime.now().strftime('%Y-%m-%d'), notes))
-        
-        # Update the bill
-        cursor.execute('''
-            UPDATE supplier_bills
-            SET paid_amount = total_amount, status = 'PAID', paid_at = ?
-            WHERE id = ?
-        ''', (paid_at, bill_id))
-        
-        self.db.connection.commit()
+        with self.db.transaction():
+            # Record the payment transaction for the remaining amount
+            if remaining_amount > 0:
+                self._insert_payment(bill_id, remaining_amount, payment_date or datetime.now().strftime('%Y-%m-%d'),
+                                     notes)
+
+            # Update the bill
+            self.db.execute_query('''
+                UPDATE supplier_bills
+                SET paid_amount = total_amount, status = 'PAID', paid_at = ?
+                WHERE id = ?
+            ''', (paid_at, bill_id))
+            change_log.record(self.db, 'supplier_bills', bill_id, 'UPDATE',
+                              {'paid_amount': bill['total_amount'], 'status': 'PAID', 'paid_at': paid_at})
         return True
     
     def delete_bill(self, bill_id):
         """Delete a supplier bill"""
-        cursor = self.db.cursor
-        cursor.execute('DELETE FROM supplier_bills WHERE id = ?', (bill_id,))
-        self.db.connection.commit()
-        return cursor.rowcount > 0
+        with self.db.transaction():
+            deleted = self.db.execute_rowcount('DELETE FROM supplier_bills WHERE id = ?', (bill_id,)) > 0
+            if deleted:
+                change_log.record(self.db, 'supplier_bills', bill_id, 'DELETE')
+        return deleted
     
     def get_payment_history(self, bill_id):
         """Get payment history for a specific bill"""
-        cursor = self.db.cursor
-        cursor.execute('''
+        rows = self.db.fetch_all('''
             SELECT id, payment_amount, payment_date, notes, created_at
             FROM supplier_bill_payments
             WHERE bill_id = ?
@@ -340,7 +341,7 @@ class SupplierBillManager:
         ''', (bill_id,))
         
         payments = []
-        for row in cursor.fetchall():
+        for row in rows:
             payments.append({
                 'id': row[0],
                 'payment_amount': row[1],
@@ -352,27 +353,21 @@ class SupplierBillManager:
     
     def get_summary(self):
         """Get summary statistics for supplier bills"""
-        cursor = self.db.cursor
-        
         # Total unpaid amount
-        cursor.execute('SELECT SUM(total_amount - paid_amount) FROM supplier_bills WHERE status != "PAID"')
-        total_unpaid = cursor.fetchone()[0] or 0
+        total_unpaid = self.db.fetch_one("SELECT SUM(total_amount - paid_amount) FROM supplier_bills WHERE status != 'PAID'")[0] or 0
         
         # Count of unpaid bills
-        cursor.execute('SELECT COUNT(*) FROM supplier_bills WHERE status = "UNPAID"')
-        unpaid_count = cursor.fetchone()[0]
+        unpaid_count = self.db.fetch_one("SELECT COUNT(*) FROM supplier_bills WHERE status = 'UNPAID'")[0]
         
         # Count of partial paid bills
-        cursor.execute('SELECT COUNT(*) FROM supplier_bills WHERE status = "PARTIAL"')
-        partial_count = cursor.fetchone()[0]
+        partial_count = self.db.fetch_one("SELECT COUNT(*) FROM supplier_bills WHERE status = 'PARTIAL'")[0]
         
         # Total paid this month
         current_month = datetime.now().strftime('%Y-%m')
-        cursor.execute('''
+        paid_this_month = self.db.fetch_one('''
             SELECT SUM(paid_amount) FROM supplier_bills 
             WHERE paid_at LIKE ? || '%'
-        ''', (current_month,))
-        paid_this_month = cursor.fetchone()[0] or 0
+        ''', (current_month,))[0] or 0
         
         return {
             'total_unpaid': total_unpaid,